@@ -0,0 +1,75 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# compares the per message cost of fuzzy watches against the same patterns as word watches.
+# run from the repository root: python -m benchmarks.fuzzy_matching [watches] [messages]
+
+import random
+import string
+import sys
+import time
+from dataclasses import dataclass
+from typing      import Any, List
+
+from shaak.matcher import MatchType, compile_pattern, find_matches
+
+@dataclass
+class Entry:
+    id:          int
+    pattern:     str
+    match_type:  int
+    ignore_case: bool
+    compiled:    Any
+
+def random_word(rng: random.Random, low: int, high: int) -> str:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+def make_entries(patterns: List[str], match_type: MatchType, distance: int = 0) -> List[Entry]:
+    return [
+        Entry(index, pattern, match_type.value, True, compile_pattern(pattern, match_type.value, True, distance))
+        for index, pattern in enumerate(patterns)
+    ]
+
+def run(entries: List[Entry], messages: List[str]) -> float:
+
+    find_matches(entries, messages[0])  # fuzzy groups are built on first use
+    start = time.perf_counter()
+    for message in messages:
+        find_matches(entries, message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+def main():
+
+    watch_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    message_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    rng = random.Random(0)
+    patterns = list(set(random_word(rng, 4, 10) for _ in range(watch_count)))
+    messages = [
+        ' '.join(random_word(rng, 1, 9) for _ in range(rng.randint(3, 30)))
+        for _ in range(message_count)
+    ]
+
+    word = run(make_entries(patterns, MatchType.word), messages)
+    print(f'{len(patterns)} watches over {len(messages)} messages')
+    print(f'word:           {word:8.1f}us per message')
+    for distance in (1, 2, 3):
+        fuzzy = run(make_entries(patterns, MatchType.fuzzy, distance), messages)
+        print(f'fuzzy (dist {distance}): {fuzzy:8.1f}us per message ({fuzzy / word:.2f}x word)')
+
+if __name__ == '__main__':
+    main()
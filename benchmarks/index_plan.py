@@ -0,0 +1,145 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# shows the query plans and latencies of the hot ban utils, word watch and preview lookups
+# on a seeded sqlite database, before and after the indexes from the index migration.
+# run from the repository root: python -m benchmarks.index_plan [scale] [lookups]
+
+import json
+import random
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing  import List, Tuple
+
+migration_path = Path(__file__).parent.parent / 'migrations' / 'models' / '23_20261019220000_update.json'
+
+schema = [
+    'CREATE TABLE "banutilbanevent" ("id" INTEGER PRIMARY KEY, "guild_id" BIGINT, "message_id" BIGINT, '
+    '"target_id" BIGINT, "timestamp" BIGINT, "banned" BOOL, "digest" BOOL)',
+    'CREATE TABLE "banutilcrossbanevent" ("id" INTEGER PRIMARY KEY, "guild_id" BIGINT, "event_id" INT, '
+    '"message_id" BIGINT, "timestamp" BIGINT, "banned" BOOL)',
+    'CREATE TABLE "banutilinvite" ("id" INTEGER PRIMARY KEY, "from_guild_id" BIGINT, "to_guild_id" BIGINT, "message_id" BIGINT)',
+    'CREATE TABLE "wordwatchwatch" ("id" INTEGER PRIMARY KEY, "guild_id" BIGINT, "pattern" TEXT, "match_type" INT)',
+    'CREATE TABLE "wordwatchignore" ("id" INTEGER PRIMARY KEY, "guild_id" BIGINT, "target_id" BIGINT, "mention_type" TEXT)',
+    'CREATE TABLE "previewfilter" ("id" INTEGER PRIMARY KEY, "guild_id" BIGINT, "channel_id" BIGINT)'
+]
+
+def index_statements() -> List[str]:
+
+    # the migration targets postgres. its indexes carry over as they are, and its unique
+    # constraints become unique indexes, which is what postgres builds for them anyway
+    statements = []
+    for statement in json.loads(migration_path.read_text())['upgrade']:
+        if statement.startswith('CREATE INDEX'):
+            statements.append(statement)
+        elif (match := re.match(r'ALTER TABLE (\S+) ADD CONSTRAINT (\S+) UNIQUE (\(.*\))', statement)):
+            table, name, columns = match.groups()
+            statements.append(f'CREATE UNIQUE INDEX {name} ON {table} {columns}')
+    return statements
+
+def seed(db: sqlite3.Connection, rng: random.Random, scale: int):
+
+    guilds = [rng.getrandbits(60) for _ in range(max(10, scale // 100))]
+    now = int(time.time())
+
+    events = [(index + 1, rng.choice(guilds), rng.getrandbits(60), rng.getrandbits(60), now - rng.randint(0, 60 * 60 * 24 * 31), 1, 0)
+              for index in range(scale)]
+    db.executemany('INSERT INTO "banutilbanevent" VALUES (?, ?, ?, ?, ?, ?, ?)', events)
+    db.executemany('INSERT INTO "banutilcrossbanevent" VALUES (NULL, ?, ?, ?, ?, 0)', [
+        (rng.choice(guilds), event[0], rng.getrandbits(60), event[4]) for event in events
+    ])
+    db.executemany('INSERT INTO "banutilinvite" VALUES (NULL, ?, ?, ?)', [
+        (rng.choice(guilds), rng.choice(guilds), rng.getrandbits(60)) for _ in range(scale // 20)
+    ])
+    db.executemany('INSERT INTO "wordwatchwatch" VALUES (NULL, ?, ?, 1)', [
+        (rng.choice(guilds), f'pattern{index}') for index in range(scale // 4)
+    ])
+    db.executemany('INSERT INTO "wordwatchignore" VALUES (NULL, ?, ?, \'@!\')', [
+        (rng.choice(guilds), rng.getrandbits(60)) for _ in range(scale // 10)
+    ])
+    db.executemany('INSERT INTO "previewfilter" VALUES (NULL, ?, ?)', [
+        (rng.choice(guilds), rng.getrandbits(60)) for _ in range(scale // 20)
+    ])
+    db.commit()
+
+def sample(db: sqlite3.Connection, query: str, rng: random.Random, count: int) -> List[tuple]:
+    rows = db.execute(query).fetchall()
+    return rng.sample(rows, min(count, len(rows)))
+
+def hot_queries(db: sqlite3.Connection, rng: random.Random, count: int) -> List[Tuple[str, str, List[tuple]]]:
+
+    # a day's worth of events past the 30 day cutoff, as the cleanup task sees them
+    cutoff = int(time.time()) - 60 * 60 * 24 * 30
+    return [
+        ('ban event by message', 'SELECT * FROM "banutilbanevent" WHERE "message_id" = ?',
+         sample(db, 'SELECT "message_id" FROM "banutilbanevent"', rng, count)),
+        ('ban event by target', 'SELECT * FROM "banutilbanevent" WHERE "guild_id" = ? AND "target_id" = ?',
+         sample(db, 'SELECT "guild_id", "target_id" FROM "banutilbanevent"', rng, count)),
+        ('expired ban events', 'SELECT "id" FROM "banutilbanevent" WHERE "timestamp" < ?',
+         [(cutoff,)] * max(1, count // 10)),
+        ('crossban by message', 'SELECT * FROM "banutilcrossbanevent" WHERE "message_id" = ?',
+         sample(db, 'SELECT "message_id" FROM "banutilcrossbanevent"', rng, count)),
+        ('invite by message', 'SELECT * FROM "banutilinvite" WHERE "message_id" = ?',
+         sample(db, 'SELECT "message_id" FROM "banutilinvite"', rng, count)),
+        ('watch by pattern', 'SELECT * FROM "wordwatchwatch" WHERE "guild_id" = ? AND "pattern" = ?',
+         sample(db, 'SELECT "guild_id", "pattern" FROM "wordwatchwatch"', rng, count)),
+        ('ignore by target', 'SELECT * FROM "wordwatchignore" WHERE "guild_id" = ? AND "target_id" = ?',
+         sample(db, 'SELECT "guild_id", "target_id" FROM "wordwatchignore"', rng, count)),
+        ('preview filter by channel', 'SELECT 1 FROM "previewfilter" WHERE "channel_id" = ?',
+         sample(db, 'SELECT "channel_id" FROM "previewfilter"', rng, count))
+    ]
+
+def measure(db: sqlite3.Connection, queries: List[Tuple[str, str, List[tuple]]]) -> List[Tuple[str, str, float]]:
+
+    results = []
+    for name, query, params in queries:
+        plan = ' / '.join(row[-1] for row in db.execute(f'EXPLAIN QUERY PLAN {query}', params[0]))
+        start = time.perf_counter()
+        for param in params:
+            db.execute(query, param).fetchall()
+        results.append((name, plan, (time.perf_counter() - start) / len(params) * 1e6))
+    return results
+
+def main():
+
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    rng = random.Random(0)
+    db = sqlite3.connect(':memory:')
+    for statement in schema:
+        db.execute(statement)
+    seed(db, rng, scale)
+    queries = hot_queries(db, rng, lookups)
+
+    before = measure(db, queries)
+    for statement in index_statements():
+        db.execute(statement)
+    db.execute('ANALYZE')
+    after = measure(db, queries)
+
+    print(f'{scale} ban events, {lookups} lookups per query')
+    for (name, old_plan, old_time), (_, new_plan, new_time) in zip(before, after):
+        print(f'{name}: {old_time:10.1f}us -> {new_time:8.1f}us ({old_time / new_time:.0f}x)')
+        print(f'    before: {old_plan}')
+        print(f'    after:  {new_plan}')
+
+if __name__ == '__main__':
+    main()
@@ -17,26 +17,61 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
 import asyncio
+from pathlib import Path
 
-def bootstrap():
+def bootstrap(args):
 
     from shaak.start import start_bot
     asyncio.run(start_bot())
 
-def init():
+def init(args):
 
     from shaak import initialize_bot
     initialize_bot()
 
+def export_config(args):
+
+    from shaak.snapshot import cli_export
+    asyncio.run(cli_export(args.guild_id, args.path))
+
+def import_config(args):
+
+    from shaak.snapshot import cli_import
+    asyncio.run(cli_import(args.guild_id, args.path))
+    print('Imported. A running bot picks up the new configuration after a restart')
+
+def scan(args):
+
+    from shaak.scanner import cli_scan
+    cli_scan(args)
+
 def main():
     
     parser = argparse.ArgumentParser('shaak')
-    parser.set_defaults(run=parser.print_help)
+    parser.set_defaults(run=lambda args: parser.print_help())
     parser.add_argument('--debug', help='Name of the logger to dump')
     parser.add_argument('--trace', help='Start tracemalloc', action='store_true')
     command_subparsers = parser.add_subparsers()
     command_subparsers.add_parser('init').set_defaults(run=init)
     command_subparsers.add_parser('run').set_defaults(run=bootstrap)
+    export_parser = command_subparsers.add_parser('export', help='Export a guild configuration snapshot')
+    export_parser.add_argument('guild_id', type=int)
+    export_parser.add_argument('path', type=Path)
+    export_parser.set_defaults(run=export_config)
+    import_parser = command_subparsers.add_parser('import', help='Replace a guild configuration with a snapshot')
+    import_parser.add_argument('guild_id', type=int)
+    import_parser.add_argument('path', type=Path)
+    import_parser.set_defaults(run=import_config)
+    scan_parser = command_subparsers.add_parser('scan', help="Match a message dump against a guild's watches")
+    scan_source = scan_parser.add_mutually_exclusive_group(required=True)
+    scan_source.add_argument('--guild', type=int, help='Load watches for this guild from the database')
+    scan_source.add_argument('--snapshot', type=Path, help='Load watches from a configuration snapshot')
+    scan_parser.add_argument('input', type=Path, help='Message dump, either JSONL with a content field or one message per line')
+    scan_parser.add_argument('--format', choices=['jsonl', 'text'], help='Input format, guessed from the extension by default')
+    scan_parser.add_argument('--output', type=Path, help='Where to write hit records, stdout by default')
+    scan_parser.add_argument('--workers', type=int, help='Worker processes, one per core by default')
+    scan_parser.add_argument('--chunk-size', type=int, default=500, help='Messages per work unit')
+    scan_parser.set_defaults(run=scan)
     args = parser.parse_args()
 
     if args.debug:
@@ -51,7 +86,7 @@ def main():
         import tracemalloc
         tracemalloc.start()
 
-    args.run()
+    args.run(args)
 
 if __name__ == '__main__':
     
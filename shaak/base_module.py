@@ -64,3 +64,8 @@ class BaseModule(commands.Cog):
     async def initialize(self):
         
         self.initialized.set()
+
+    async def reload_guild(self, guild_id: int):
+
+        # called after a guild's configuration was replaced in bulk, modules with caches reload them here
+        pass
@@ -18,12 +18,13 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 from dataclasses import dataclass
 from datetime    import timedelta
 from enum        import Enum
-from typing      import Union
+from typing      import Optional, Union
 
 import discord
 from discord.ext     import commands
 from tortoise.models import Model
 
+from shaak.matcher import MatchType
 from shaak.helpers import (str2bool, bool2str, mention2id_validate, MentionType,
                            id2mention_validate, ensurebool, pass_value, RollingValues)
 
@@ -36,6 +37,13 @@ class ResponseLevel(Enum):
     forbidden       = 3
     module_disabled = 4
 
+# what ban utils does when someone recently banned in a subscribed server joins
+class JoinAction(Enum):
+    off   = 0
+    alert = 1
+    kick  = 2
+    ban   = 3
+
 @dataclass
 class ModuleInfo:
     name:     str
@@ -65,11 +73,6 @@ setting_structure = {
     'error_channel': (mention2id_validate(MentionType.channel), id2mention_validate(MentionType.channel))
 }
 
-class MatchType(Enum):
-    contains = 0
-    word     = 1
-    regex    = 2
-
 def str_to_match_type(stuff: str) -> MatchType:
     if stuff.startswith('_'):
         raise AttributeError(stuff)
@@ -87,12 +90,21 @@ def ww_ban_parse(stuff: Union[str, bool]) -> int:
         return 7
     return num
 
+def ww_distance_parse(stuff: Union[str, bool]) -> Optional[int]:
+    if stuff == None:
+        return None
+    num = int(stuff)
+    if num < 0 or num > 3:
+        raise ValueError(stuff)
+    return num
+
 watch_setting_map = {
     'del': ensurebool,
     'cased': ensurebool,
     'type': str_to_match_type,
     'ping': pass_value,
-    'ban': ww_ban_parse
+    'ban': ww_ban_parse,
+    'dist': ww_distance_parse
 }
 
 mem_usage_stat = RollingValues()
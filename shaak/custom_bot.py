@@ -22,7 +22,7 @@ import discord
 from discord.ext import commands
 from tortoise.exceptions import DoesNotExist
 
-from shaak.errors import ModuleDisabled, NotAllowed, InvalidId
+from shaak.errors import ModuleDisabled, NotAllowed, InvalidId, InvalidSnapshot
 from shaak.consts import ResponseLevel
 from shaak.models import GuildSettings, GlobalSettings
 from shaak.settings import product_settings
@@ -61,7 +61,7 @@ class CustomBot(commands.Bot):
             await self.utils.respond(ctx, ResponseLevel.forbidden, 'You do not have permission to run this command')
         elif isinstance(error, discord.HTTPException) and error.code == 10008:
             await self.utils.respond(ctx, ResponseLevel.internal_error, f'HTTP error code {error.code}')
-        elif isinstance(error, (commands.CommandError, InvalidId)):
+        elif isinstance(error, (commands.CommandError, InvalidId, InvalidSnapshot)):
             await self.utils.respond(ctx, ResponseLevel.general_error, str(error) or type(error).__name__)
         elif isinstance(error, NotImplementedError):
             try:
@@ -23,6 +23,7 @@ from tortoise    import Tortoise
 from shaak.settings import app_settings
 from shaak.consts   import ResponseLevel
 from shaak.models   import WordWatchWatch
+from shaak.snapshot import import_guild
 
 class Debug(commands.Cog):
     
@@ -68,4 +69,23 @@ class Debug(commands.Cog):
         for i in self.bot.guilds:
             watch_count = await WordWatchWatch.filter(guild_id=i.id).count()
             items.append(f'{i.name} ({i.id}): {watch_count}')
-        await self.utils.list_items(ctx, items)
\ No newline at end of file
+        await self.utils.list_items(ctx, items)
+
+    @commands.command(name='debug.export')
+    async def debug_export(self, ctx: commands.Context, guild_id: int):
+
+        await self.bot.get_cog('Manager').send_snapshot(ctx, guild_id)
+
+    @commands.command(name='debug.import')
+    async def debug_import(self, ctx: commands.Context, guild_id: int):
+
+        guild = self.bot.get_guild(guild_id)
+        if guild == None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Guild not found')
+            return
+
+        manager = self.bot.get_cog('Manager')
+        snapshot = await manager.read_snapshot(ctx, guild)
+        await import_guild(guild_id, snapshot)
+        await manager.reload_guild(guild_id)
+        await self.utils.respond(ctx, ResponseLevel.success)
\ No newline at end of file
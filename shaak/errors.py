@@ -24,3 +24,13 @@ class InvalidId(Exception):
         self.message = message
     def __str__(self):
         return self.message
+class InvalidSnapshot(Exception):
+    def __init__(self, message='Invalid snapshot'):
+        self.message = message
+    def __str__(self):
+        return self.message
+class ScansDropped(Exception):
+    def __init__(self, message='Word watch scans dropped'):
+        self.message = message
+    def __str__(self):
+        return self.message
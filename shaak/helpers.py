@@ -16,14 +16,16 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import asyncio
+import collections
 import time
 import logging
 import platform
 import re
 from datetime import datetime
-from typing import Optional, List, Any, Tuple, Union, TypeVar
+from typing import Optional, List, Any, Tuple, Union, TypeVar, Type, Iterable, Set, Dict, Callable
 
 import discord
+from tortoise.models import Model
 
 from shaak.errors import InvalidId
 from shaak.models import GuildSettings
@@ -249,12 +251,108 @@ class DiscardingQueue:
         return self._queue.qsize()
 
 
+# bounded per-key queues served by deficit round robin, so a key with expensive
+# items gets the same share of work as everyone else instead of a share of turns
+class FairQueue:
+
+    def __init__(self, max_depth: int, quantum: int):
+        self.max_depth = max_depth
+        self.quantum = quantum
+        self._queues: Dict[Any, collections.deque] = {}
+        self._deficits: Dict[Any, int] = {}
+        self._active = collections.deque()
+        self._count = asyncio.Semaphore(0)
+
+    def put(self, key, item, cost: int = 1) -> bool:
+        if key not in self._queues:
+            self._queues[key] = collections.deque()
+            self._deficits[key] = 0
+            self._active.append(key)
+        queue = self._queues[key]
+        if len(queue) >= self.max_depth:
+            return False
+        queue.append((item, cost))
+        self._count.release()
+        return True
+
+    async def get(self) -> Tuple[Any, Any]:
+        await self._count.acquire()
+        while True:
+            key = self._active[0]
+            queue = self._queues[key]
+            item, cost = queue[0]
+            if self._deficits[key] >= cost:
+                queue.popleft()
+                self._deficits[key] -= cost
+                if not queue:
+                    self._active.popleft()
+                    del self._queues[key], self._deficits[key]
+                return key, item
+            self._deficits[key] += self.quantum
+            self._active.rotate(-1)
+
+    def depth(self, key) -> int:
+        return len(self._queues.get(key, ()))
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+
+# keeps the most recent texts within a fixed character budget, oldest dropped first
+class BoundedTextBuffer:
+
+    def __init__(self, max_chars: int, max_text: int):
+        self.max_chars = max_chars
+        self.max_text = max_text
+        self.size = 0
+        self._texts = collections.deque()
+
+    def push(self, text: str, tag: Any = None):
+        text = text[:self.max_text]
+        self._texts.append((tag, text))
+        self.size += len(text)
+        while self.size > self.max_chars:
+            self.size -= len(self._texts.popleft()[1])
+
+    def snapshot(self) -> List[Tuple[Any, str]]:
+        return list(self._texts)
+
+    def __len__(self):
+        return len(self._texts)
+
+
 def get_or_create(d, k, t):
     if k not in d:
         d[k] = t
     return d[k]
 
 
+# set-based config mutations. callers resolve everything up front and pass the keys
+# that currently exist, so each call costs at most a single query
+async def bulk_insert_missing(model: Type[Model], key_field: str, keys: Iterable[T], existing: Set[T],
+                              row_extras: Optional[Callable[[T], Dict[str, Any]]] = None,
+                              **shared) -> Tuple[Set[T], Set[T]]:
+
+    keys = set(keys)
+    added = keys - existing
+    if added:
+        await model.bulk_create([
+            model(**shared, **{key_field: key}, **(row_extras(key) if row_extras else {}))
+            for key in added
+        ])
+    return added, keys & existing
+
+
+async def bulk_delete_present(model: Type[Model], key_field: str, keys: Iterable[T], existing: Set[T],
+                              **shared) -> Tuple[Set[T], Set[T]]:
+
+    keys = set(keys)
+    removed = keys & existing
+    if removed:
+        await model.filter(**shared, **{f'{key_field}__in': list(removed)}).delete()
+    return removed, keys - existing
+
+
 def time_ms():
     return round(time.time() * 1000)
 
@@ -289,10 +387,10 @@ class RollingStats:
     def __init__(self):
         self.inner = [[0 for _ in range(24)] for _ in range(2)]
 
-    def record(self):
+    def record(self, amount: int = 1):
         now = datetime.now()
         self.inner[now.day % 2 - 1][now.hour] = 0
-        self.inner[now.day % 2][now.hour] += 1
+        self.inner[now.day % 2][now.hour] += amount
 
     def summarize(self) -> int:
         now = datetime.now()
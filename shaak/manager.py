@@ -15,6 +15,7 @@ You should have received a copy of the GNU Affero General Public License
 along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
+import io
 import logging
 from typing import Dict, Optional
 
@@ -22,11 +23,14 @@ import discord
 from discord import Embed
 from discord.ext import commands
 
+from shaak.base_module import BaseModule
 from shaak.checks import has_privlidged_role_check
 from shaak.consts import ModuleInfo, ResponseLevel, setting_structure
+from shaak.errors import InvalidSnapshot
 from shaak.models import Guild, GuildSettings
 from shaak.settings import app_settings
 from shaak.custom_bot import CustomBot
+from shaak.snapshot import export_guild, import_guild, dump_snapshot, load_snapshot, sanitize_references
 
 logger = logging.getLogger('shaak_manager')
 
@@ -207,3 +211,42 @@ class Manager(commands.Cog):
             formatted.append(
                 f'{name}: {"unset" if value == None else converter[1](value)}')
         await self.utils.list_items(ctx, formatted)
+
+
+    async def reload_guild(self, guild_id: int):
+
+        for cog in self.bot.cogs.values():
+            if isinstance(cog, BaseModule):
+                await cog.reload_guild(guild_id)
+
+    async def send_snapshot(self, ctx: commands.Context, guild_id: int):
+
+        snapshot = dump_snapshot(await export_guild(guild_id))
+        await ctx.send(file=discord.File(io.BytesIO(snapshot), filename=f'{guild_id}.shaak'))
+
+    async def read_snapshot(self, ctx: commands.Context, guild: discord.Guild) -> dict:
+
+        if len(ctx.message.attachments) != 1:
+            raise InvalidSnapshot('Attach exactly one snapshot file')
+        attachment = ctx.message.attachments[0]
+        if attachment.size > 8 * 1024**2:
+            raise InvalidSnapshot('Snapshot too large')
+        snapshot = load_snapshot(await attachment.read())
+        sanitize_references(snapshot, lambda channel_id: guild.get_channel(channel_id) != None,
+                            lambda role_id: guild.get_role(role_id) != None)
+        return snapshot
+
+    @commands.command('config.export')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def config_export(self, ctx: commands.Context):
+
+        await self.send_snapshot(ctx, ctx.guild.id)
+
+    @commands.command('config.import')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def config_import(self, ctx: commands.Context):
+
+        snapshot = await self.read_snapshot(ctx, ctx.guild)
+        await import_guild(ctx.guild.id, snapshot)
+        await self.reload_guild(ctx.guild.id)
+        await self.utils.respond(ctx, ResponseLevel.success)
@@ -18,8 +18,25 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 # simple word matching algorithm
 # in a seperate file to help with code organization
 
+import bisect
+import re
 import string
-from typing import Tuple, List, Iterator
+import sys
+import threading
+from enum   import Enum
+from typing import Any, Dict, Tuple, List, Iterator, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional, batches are matched one text at a time without it
+    np = None
+
+# kept here rather than in consts so the matcher stays importable without discord
+class MatchType(Enum):
+    contains = 0
+    word     = 1
+    regex    = 2
+    fuzzy    = 3
 
 word_markers = frozenset(string.punctuation + string.whitespace)
 format_markers = frozenset('*_|~')
@@ -71,4 +88,287 @@ def find_all_contains(text: str, sub: str) -> Iterator[Tuple[int, int]]:
         start = text.find(sub, start)
         if start == -1: return
         yield (start, start + sub_l)
-        start += len(sub)
\ No newline at end of file
+        start += len(sub)
+
+# fuzzy words are matched with wu-manber's bit-parallel shift-and, allowing up to
+# `distance` insertions, deletions and substitutions. patterns of the same length are
+# packed side by side into one big int, each in a lane of length+1 bits with the top bit
+# left empty as a guard, so one pass over the text advances all of them at once
+class FuzzyPattern:
+
+    __slots__ = ('pattern', 'length', 'distance', 'masks')
+
+    def __init__(self, pattern: str, distance: int):
+        self.pattern = ''.join(char for char in pattern.lower() if char not in format_markers)
+        self.length = len(self.pattern)
+        self.distance = distance
+        if not 0 <= distance < self.length:
+            raise ValueError(f'distance must be between 0 and {self.length-1}')
+        self.masks: Dict[str, int] = {}
+        for index, char in enumerate(self.pattern):
+            self.masks[char] = self.masks.get(char, 0) | (1 << index)
+
+class FuzzyGroup:
+
+    # built from compiled patterns only, so one group serves every caller whose entries
+    # hold the same patterns. lanes name positions in the caller's entry list
+    def __init__(self, length: int, members: List[Tuple[int, FuzzyPattern]]):
+        self.length = length
+        self.indices = [index for index, _ in members]
+        self.max_distance = max(compiled.distance for _, compiled in members)
+        width = length + 1
+        self.masks: Dict[str, int] = {}
+        self.lanes = 0
+        # prefixes[r] has the lowest r bits of every lane set
+        self.prefixes = [0] * (self.max_distance + 2)
+        self.accepts = [0] * (self.max_distance + 1)  # accepting bits of lanes, by their distance
+        for lane, (_, compiled) in enumerate(members):
+            offset = lane * width
+            for char, mask in compiled.masks.items():
+                self.masks[char] = self.masks.get(char, 0) | (mask << offset)
+            for bits in range(1, self.max_distance + 2):
+                self.prefixes[bits] |= ((1 << bits) - 1) << offset
+            self.lanes |= ((1 << length) - 1) << offset
+            self.accepts[compiled.distance] |= 1 << (offset + length - 1)
+
+fuzzy_group_cache: Dict[Tuple[int, ...], Tuple[List[FuzzyPattern], List[FuzzyGroup]]] = {}
+fuzzy_group_lock = threading.Lock()  # matching also runs in executor threads
+
+def fuzzy_groups(entries: List[Any]) -> List[FuzzyGroup]:
+
+    # keyed by the compiled patterns in order, which the cache keeps alive so their ids
+    # stay unique. entries sharing patterns share groups, but never each other's entries
+    compiled = [entry.compiled for entry in entries]
+    key = tuple(map(id, compiled))
+    with fuzzy_group_lock:
+        cached = fuzzy_group_cache.get(key)
+    if cached != None:
+        return cached[1]
+
+    by_length: Dict[int, List[Tuple[int, FuzzyPattern]]] = {}
+    for index, pattern in enumerate(compiled):
+        by_length.setdefault(pattern.length, []).append((index, pattern))
+    groups = [FuzzyGroup(length, members) for length, members in by_length.items()]
+    with fuzzy_group_lock:
+        if len(fuzzy_group_cache) >= 256:
+            fuzzy_group_cache.clear()
+        fuzzy_group_cache[key] = (compiled, groups)
+    return groups
+
+def fuzzy_matches(entries: List[Any], text: str) -> List[Tuple[Any, int, int]]:
+
+    # format markers are dropped and positions mapped back, boundaries are judged on the
+    # original text, and a trailing s is free, all as word_matches does it
+    positions = [index for index, char in enumerate(text) if char not in format_markers]
+    stripped = ''.join(text[index] for index in positions).lower()
+    text_len = len(text)
+    def is_start(index: int) -> bool:
+        return positions[index] == 0 or text[positions[index]-1] in word_markers
+    def is_end(index: int) -> bool:
+        return positions[index]+1 == text_len or text[positions[index]+1] in word_markers
+    word_starts = [index for index in range(len(stripped)) if is_start(index)]
+
+    found = []
+    for group in fuzzy_groups(entries):
+        masks, prefixes, lanes = group.masks, group.prefixes, group.lanes
+        max_distance = group.max_distance
+        states = [0] * (max_distance + 1)
+        since_start = max_distance + 1
+        for index, char in enumerate(stripped):
+            since_start = 0 if is_start(index) else since_start + 1
+            char_mask = masks.get(char, 0)
+            # a match may only begin at a word start. with j errors to spend, and after
+            # inserting the characters since then, the rest can go on deleting a prefix
+            before = [prefixes[j - since_start + 1] if since_start <= j else 0 for j in range(max_distance + 1)]
+            after = [prefixes[1] if since_start + 1 <= j else 0 for j in range(max_distance + 1)]
+            new_states = [((states[0] << 1) | before[0]) & char_mask & lanes]
+            for j in range(1, max_distance + 1):
+                new_states.append((
+                    (((states[j] << 1) | before[j]) & char_mask)  # match
+                    | states[j-1]                                  # insertion
+                    | (states[j-1] << 1) | before[j-1]             # substitution
+                    | (new_states[j-1] << 1) | after[j-1]          # deletion
+                ) & lanes)
+            states = new_states
+
+            accepted = 0
+            for j in range(max_distance + 1):
+                accepted |= states[j] & group.accepts[j]
+            if not accepted:
+                continue
+            if is_end(index):
+                end = index
+            elif index+1 < len(stripped) and stripped[index+1] == 's' and is_end(index+1):
+                end = index+1
+            else:
+                continue
+            begin_limit = index + 1 - max(1, group.length - max_distance)
+            start = word_starts[max(0, bisect.bisect_right(word_starts, begin_limit) - 1)] if word_starts else 0
+            for lane, entry_index in enumerate(group.indices):
+                if accepted >> (lane * (group.length + 1) + group.length - 1) & 1:
+                    found.append((entries[entry_index], positions[start], positions[end] + 1))
+    return found
+
+# shared by live scanning and every bulk path, so they all agree on what a match is
+def compile_pattern(pattern: str, match_type: int, ignore_case: bool, distance: int = 0) -> Any:
+    if match_type == MatchType.word.value:
+        return pattern_preprocess(pattern)
+    elif match_type == MatchType.contains.value:
+        return None
+    elif match_type == MatchType.regex.value:
+        return re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    elif match_type == MatchType.fuzzy.value:
+        return FuzzyPattern(pattern, distance)
+    else:
+        raise ValueError(f'{match_type} is not a valid match type')
+
+# many guilds watch the same words, so compiled patterns are shared and refcounted
+# by everything that holds them rather than compiled once per watch
+PatternKey = Tuple[str, int, bool, int]
+
+class PatternRegistry:
+
+    def __init__(self):
+        self.entries: Dict[PatternKey, List[Any]] = {}  # key -> [compiled, references]
+
+    def acquire(self, pattern: str, match_type: int, ignore_case: bool, distance: int = 0) -> Any:
+        key = (pattern, match_type, ignore_case, distance)
+        if key in self.entries:
+            self.entries[key][1] += 1
+        else:
+            self.entries[key] = [compile_pattern(pattern, match_type, ignore_case, distance), 1]
+        return self.entries[key][0]
+
+    def release(self, pattern: str, match_type: int, ignore_case: bool, distance: int = 0):
+        key = (pattern, match_type, ignore_case, distance)
+        if key not in self.entries:
+            return
+        self.entries[key][1] -= 1
+        if self.entries[key][1] <= 0:
+            del self.entries[key]
+
+    def stats(self) -> Tuple[int, int, int]:
+        # unique patterns, references, and roughly how many bytes sharing saves
+        references = 0
+        saved = 0
+        for compiled, count in self.entries.values():
+            references += count
+            saved += compiled_size(compiled) * (count - 1)
+        return len(self.entries), references, saved
+
+def compiled_size(compiled: Any) -> int:
+    if compiled == None:
+        return 0
+    if isinstance(compiled, tuple):  # preprocessed word, the characters themselves are interned
+        return sys.getsizeof(compiled) + sys.getsizeof(compiled[0])
+    if isinstance(compiled, FuzzyPattern):
+        return sys.getsizeof(compiled) + sys.getsizeof(compiled.masks) + sys.getsizeof(compiled.pattern)
+    return sys.getsizeof(compiled)  # regex sizes include their compiled code
+
+pattern_registry = PatternRegistry()
+
+# entries are anything with match_type, compiled, pattern and ignore_case attributes
+def find_matches(entries: List[Any], text: str) -> List[Tuple[Any, int, int]]:
+
+    found = []
+    processed_text = None
+    text_lower = None
+    fuzzy = []
+    for entry in entries:
+        if entry.match_type == MatchType.regex.value:
+            for match in entry.compiled.finditer(text):
+                found.append((entry, match.start(0), match.end(0)))
+        elif entry.match_type == MatchType.word.value:
+            if processed_text == None:
+                processed_text = text_preprocess(text)
+            for start, end in word_matches(processed_text, entry.compiled):
+                found.append((entry, start, end))
+        elif entry.match_type == MatchType.contains.value:
+            if entry.ignore_case and text_lower == None:
+                text_lower = text.lower()
+            for start, end in find_all_contains(text_lower if entry.ignore_case else text, entry.pattern):
+                found.append((entry, start, end))
+        elif entry.match_type == MatchType.fuzzy.value:
+            fuzzy.append(entry)
+    if fuzzy:
+        found.extend(fuzzy_matches(fuzzy, text))
+    return found
+
+
+# bulk scans prefilter single token word watches by hashing every candidate token of
+# a batch into one array and testing them all against the watch hashes at once. only
+# the watches whose token appears in a text are then run through find_matches on it,
+# so results are exactly what find_matches gives
+batch_min_texts  = 32
+batch_max_pieces = 12  # longer runs of format marker separated pieces skip the prefilter
+
+token_split = re.compile('[' + re.escape(''.join(sorted(word_markers - format_markers))) + ']+')
+piece_split = re.compile('[' + re.escape(''.join(sorted(format_markers))) + ']+')
+
+def token_key(entry: Any) -> Optional[str]:
+    if entry.match_type != MatchType.word.value:
+        return None
+    key = ''.join(entry.compiled[0])
+    if not key or any(char in word_markers for char in key):
+        return None
+    return key
+
+def text_tokens(text: str) -> Optional[List[str]]:
+
+    # a word match starts and ends next to any word marker but skips format markers
+    # inside it, so it covers whole pieces of a run and is their concatenation, with
+    # possibly a trailing s
+    tokens = []
+    for run in token_split.split(text.lower()):
+        pieces = [piece for piece in piece_split.split(run) if piece]
+        if len(pieces) > batch_max_pieces:
+            return None
+        for first in range(len(pieces)):
+            token = ''
+            for piece in pieces[first:]:
+                token += piece
+                tokens.append(token)
+                if token.endswith('s'):
+                    tokens.append(token[:-1])
+    return tokens
+
+def find_matches_batch(entries: List[Any], texts: List[str]) -> List[List[Tuple[Any, int, int]]]:
+
+    keys = [token_key(entry) for entry in entries]
+    if np == None or len(texts) < batch_min_texts or not any(keys):
+        return [find_matches(entries, text) for text in texts]
+
+    by_hash: Dict[int, List[int]] = {}
+    for position, key in enumerate(keys):
+        if key != None:
+            by_hash.setdefault(hash(key), []).append(position)
+    unindexed = [position for position, key in enumerate(keys) if key == None]
+
+    hashes = []
+    counts = []
+    unsplit = set()
+    for index, text in enumerate(texts):
+        tokens = text_tokens(text)
+        if tokens == None:
+            unsplit.add(index)
+            tokens = []
+        hashes.extend(map(hash, tokens))
+        counts.append(len(tokens))
+
+    token_hashes = np.fromiter(hashes, dtype=np.int64, count=len(hashes))
+    owners = np.repeat(np.arange(len(texts)), counts)
+    hits = np.flatnonzero(np.isin(token_hashes, np.fromiter(by_hash, dtype=np.int64, count=len(by_hash))))
+
+    candidates: Dict[int, set] = {}
+    for owner, token_hash in zip(owners[hits].tolist(), token_hashes[hits].tolist()):
+        candidates.setdefault(owner, set()).update(by_hash[token_hash])
+
+    results = []
+    for index, text in enumerate(texts):
+        if index in unsplit:
+            results.append(find_matches(entries, text))
+            continue
+        positions = sorted(candidates.get(index, ()))
+        checked = [entries[position] for position in (sorted(unindexed + positions) if unindexed else positions)]
+        results.append(find_matches(checked, text) if checked else [])
+    return results
@@ -38,10 +38,11 @@ class GuildSettings(Model):
     error_channel = fields.BigIntField     (null=True)
 
 class WordWatchSettings(Model, ModuleSettingsMixin):
-    guild       = fields.ForeignKeyField ('models.Guild', related_name='word_watch_settings')
-    log_channel = fields.BigIntField     (null=True)
-    header      = fields.TextField       (null=True)
-    scan_bots   = fields.BooleanField    (null=True)
+    guild           = fields.ForeignKeyField ('models.Guild', related_name='word_watch_settings')
+    log_channel     = fields.BigIntField     (null=True)
+    header          = fields.TextField       (null=True)
+    scan_bots       = fields.BooleanField    (null=True)
+    attachment_size = fields.IntField        (null=True) # kilobytes of text attachments to scan, null to only scan file names
 
 class WordWatchPingGroup(Model):
     guild = fields.ForeignKeyField ('models.Guild', related_name='word_watch_ping_groups')
@@ -60,12 +61,60 @@ class WordWatchWatch(Model):
     auto_delete = fields.BooleanField    ()
     ignore_case = fields.BooleanField    ()
     ban         = fields.IntField        (null=True)
+    distance    = fields.IntField        (null=True) # only for fuzzy watches
+
+    class Meta:
+        unique_together = (('guild', 'pattern'),)
+
+class WordWatchSharedList(Model):
+    guild = fields.ForeignKeyField ('models.Guild', related_name='word_watch_shared_lists', null=True) # null for lists owned by the bot owner
+    name  = fields.TextField       ()
+
+class WordWatchListWatch(Model):
+    list        = fields.ForeignKeyField ('models.WordWatchSharedList', related_name='watches')
+    pattern     = fields.TextField       ()
+    match_type  = fields.IntField        ()
+    ignore_case = fields.BooleanField    ()
+
+class WordWatchSubscription(Model):
+    guild       = fields.ForeignKeyField ('models.Guild', related_name='word_watch_subscriptions')
+    list        = fields.ForeignKeyField ('models.WordWatchSharedList', related_name='subscriptions')
+    group       = fields.ForeignKeyField ('models.WordWatchPingGroup', related_name='subscriptions', null=True, on_delete=fields.SET_NULL)
+    auto_delete = fields.BooleanField    ()
+    ban         = fields.IntField        (null=True)
+
+class WordWatchListExclusion(Model):
+    subscription = fields.ForeignKeyField ('models.WordWatchSubscription', related_name='exclusions')
+    pattern      = fields.TextField       ()
+
+class WordWatchScope(Model):
+    watch      = fields.ForeignKeyField ('models.WordWatchWatch', related_name='scopes')
+    target_id  = fields.BigIntField     ()
+    scope_type = fields.CharField       (2)
+
+class WordWatchHit(Model):
+    guild       = fields.ForeignKeyField ('models.Guild', related_name='word_watch_hits')
+    watch_id    = fields.IntField        () # not a foreign key so hits outlive their watch
+    list_id     = fields.IntField        (null=True) # set when watch_id is a shared list watch
+    pattern     = fields.TextField       ()
+    user_id     = fields.BigIntField     ()
+    channel_id  = fields.BigIntField     ()
+    message_id  = fields.BigIntField     ()
+    timestamp   = fields.DatetimeField   (index=True)
+    deleted     = fields.BooleanField    ()
+    banned      = fields.BooleanField    ()
+
+    class Meta:
+        indexes = (('guild', 'timestamp'),)
 
 class WordWatchIgnore(Model):
     guild        = fields.ForeignKeyField ('models.Guild', related_name='word_watch_ignores')
     target_id    = fields.BigIntField     ()
     mention_type = fields.CharField       (2)
 
+    class Meta:
+        unique_together = (('guild', 'target_id'),)
+
 class PreviewSettings(Model, ModuleSettingsMixin):
     guild       = fields.ForeignKeyField ('models.Guild', related_name='preview_settings')
     log_channel = fields.BigIntField     (null=True)
@@ -74,36 +123,48 @@ class PreviewFilter(Model):
     guild      = fields.ForeignKeyField ('models.Guild', related_name='preview_filter')
     channel_id = fields.BigIntField     ()
 
+    class Meta:
+        # channel first, so the index also serves lookups by channel alone
+        unique_together = (('channel_id', 'guild'),)
+
 class BanUtilSettings(Model, ModuleSettingsMixin):
     guild                 = fields.ForeignKeyField ('models.Guild', related_name='ban_util_settings')
     foreign_log_channel   = fields.BigIntField     (null=True)
     domestic_log_channel  = fields.BigIntField     (null=True)
     receive_invite_alerts = fields.BooleanField    (default=True)
+    join_action           = fields.IntField        (default=0)
 
 class BanUtilBanEvent(Model):
     guild           = fields.ForeignKeyField ('models.Guild', related_name='ban_util_ban_event')
-    message_id      = fields.BigIntField     ()
+    message_id      = fields.BigIntField     (index=True) # shared by every event in a digest
     message_channel = fields.BigIntField     ()
     target_id       = fields.BigIntField     ()
-    banner_id       = fields.BigIntField     ()
+    banner_id       = fields.BigIntField     (null=True) # null when the audit log entry never showed up
     ban_reason      = fields.TextField       (null=True)
-    timestamp       = fields.DatetimeField   (auto_now_add=True)
+    timestamp       = fields.DatetimeField   (auto_now_add=True, index=True)
     banned          = fields.BooleanField    (default=True)
     reported        = fields.DatetimeField   (default=None, null=True)
+    digest          = fields.BooleanField    (default=False) # one of many events sharing a ban wave digest message
+
+    class Meta:
+        unique_together = (('guild', 'target_id'),)
 
 class BanUtilCrossbanEvent(Model):
     guild           = fields.ForeignKeyField ('models.Guild', related_name='ban_util_crossban_event')
     event           = fields.ForeignKeyField ('models.BanUtilBanEvent', related_name='crossbans')
-    message_id      = fields.BigIntField     ()
+    message_id      = fields.BigIntField     (unique=True)
     message_channel = fields.BigIntField     ()
-    timestamp       = fields.DatetimeField   (auto_now_add=True)
+    timestamp       = fields.DatetimeField   (auto_now_add=True, index=True)
     banned          = fields.BooleanField    (default=False)
     reported        = fields.DatetimeField   (default=None, null=True)
 
+    class Meta:
+        unique_together = (('guild', 'event'),)
+
 class BanUtilInvite(Model):
     from_guild = fields.ForeignKeyField ('models.Guild', related_name='ban_utils_outgoing_invites')
     to_guild   = fields.ForeignKeyField ('models.Guild', related_name='ban_utils_incoming_invites')
-    message_id = fields.BigIntField     (null=True)
+    message_id = fields.BigIntField     (null=True, unique=True)
 
 class BanUtilSubscription(Model):
     from_guild = fields.ForeignKeyField ('models.Guild', related_name='ban_utils_subscribers')
@@ -16,22 +16,441 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import asyncio
-from datetime import datetime
-from typing   import List, Optional, Tuple, Union
+import collections
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from typing   import Dict, List, Optional, Set, Tuple, Union
 
 import discord
 from discord.ext           import commands
 from tortoise.exceptions   import DoesNotExist
-from tortoise.transactions import in_transaction
 
 from shaak.base_module import BaseModule
 from shaak.checks      import has_privlidged_role_check
-from shaak.consts      import ModuleInfo, ResponseLevel, color_red
+from shaak.consts      import JoinAction, ModuleInfo, ResponseLevel, color_red
 from shaak.helpers     import (check_privildged, datetime_repr, str2bool, bool2str,
-                               DiscardingQueue, multi_split, commas, getrange_s)
+                               DiscardingQueue, multi_split, commas, getrange_s, get_or_create)
 from shaak.models      import (BanUtilBanEvent, BanUtilCrossbanEvent, BanUtilInvite,
                                BanUtilSettings, BanUtilSubscription, BanUtilBlock)
 
+# ban attribution. entries come from the audit log create gateway event when the library
+# dispatches it, and otherwise from audit log fetches shared by every handler waiting on
+# the same guild, so a ban wave costs a fetch per interval rather than one per ban
+audit_attribution_waits = (0.5, 1, 2, 4, 8)  # seconds, between refreshes; then the ban goes unattributed
+audit_refresh_interval  = 1
+audit_fetch_limit       = 100
+audit_entry_max_age     = timedelta(minutes=5)
+audit_cache_size        = 500  # per guild
+
+crossban_concurrency = 8  # subscriber sends at once per report
+
+# ban waves. once a guild logs digest_threshold bans inside digest_window, further bans are
+# collected and posted every digest_interval as a single paginated digest message
+digest_window        = 30  # seconds
+digest_threshold     = 5
+digest_interval      = 10  # seconds
+digest_page_size     = 15
+digest_reason_length = 80
+
+recent_ban_ttl = timedelta(days=7)  # how long a ban counts against someone joining a subscriber
+
+# what a tracked message is, so reactions can go straight to the right table
+class TrackedMessage:
+    ban      = 'ban'
+    crossban = 'crossban'
+    invite   = 'invite'
+    digest   = 'digest'
+
+invite_reactions = ['✅', '⏹️', '⛔']
+event_reactions  = ['📣', '🔄', '🔨', '❌']
+
+# messages carry buttons whose custom ids are 'bu:<kind>:<id>:<action>'. the id is the ban
+# event for ban and crossban messages, the inviting guild for invites and the shown page
+# for digests, which with the guild the button was pressed in (and the message, for
+# digests) is enough to find the rows without fetching anything. messages sent before
+# buttons keep working through reactions
+component_prefix = 'bu'
+
+event_actions = {
+    '📣': 'report',
+    '🔄': 'unban',
+    '🔨': 'ban',
+    '❌': 'close'
+}
+
+invite_actions = {
+    '✅': 'accept',
+    '⏹️': 'block',
+    '⛔': 'disable'
+}
+
+def component_id(kind: str, target_id: int, action: str) -> str:
+    return f'{component_prefix}:{kind}:{target_id}:{action}'
+
+def parse_component_id(custom_id: str) -> Optional[Tuple[str, int, str]]:
+
+    parts = custom_id.split(':')
+    if len(parts) != 4 or parts[0] != component_prefix:
+        return None
+    try:
+        return parts[1], int(parts[2]), parts[3]
+    except ValueError:
+        return None
+
+def stateless_view(buttons: List[discord.ui.Button]) -> discord.ui.View:
+
+    view = discord.ui.View(timeout=None)
+    for button in buttons:
+        view.add_item(button)
+    # presses are routed by custom id in on_interaction, a stopped view isn't kept by the library
+    view.stop()
+    return view
+
+def event_controls(kind: str, event_id: int, banned: bool) -> discord.ui.View:
+
+    return stateless_view([
+        discord.ui.Button(
+            label='Report' if kind == TrackedMessage.ban else 'Forward', emoji='📣',
+            style=discord.ButtonStyle.primary, custom_id=component_id(kind, event_id, 'report')
+        ),
+        discord.ui.Button(
+            label='Unban', emoji='🔄', style=discord.ButtonStyle.secondary, custom_id=component_id(kind, event_id, 'unban')
+        ) if banned else discord.ui.Button(
+            label='Ban', emoji='🔨', style=discord.ButtonStyle.danger, custom_id=component_id(kind, event_id, 'ban')
+        ),
+        discord.ui.Button(
+            label='Close', emoji='❌', style=discord.ButtonStyle.secondary, custom_id=component_id(kind, event_id, 'close')
+        )
+    ])
+
+def invite_controls(from_guild_id: int) -> discord.ui.View:
+
+    return stateless_view([
+        discord.ui.Button(
+            label='Accept', emoji='✅', style=discord.ButtonStyle.success,
+            custom_id=component_id(TrackedMessage.invite, from_guild_id, 'accept')
+        ),
+        discord.ui.Button(
+            label='Block guild', emoji='⏹️', style=discord.ButtonStyle.danger,
+            custom_id=component_id(TrackedMessage.invite, from_guild_id, 'block')
+        ),
+        discord.ui.Button(
+            label='Disable alerts', emoji='⛔', style=discord.ButtonStyle.secondary,
+            custom_id=component_id(TrackedMessage.invite, from_guild_id, 'disable')
+        )
+    ])
+
+user_display_cache_size = 2000
+
+# (name, avatar url) for users shown in ban messages, or None for users that don't exist
+UserDisplay = Optional[Tuple[str, str]]
+
+# least recently used display data for ban message authors, so re-rendering a message
+# on every state change doesn't go back to the gateway cache or REST for the same users
+class UserDisplayCache:
+
+    def __init__(self, max_size: int = user_display_cache_size):
+
+        self.max_size = max_size
+        self.entries: Dict[int, UserDisplay] = collections.OrderedDict()
+
+    def remember(self, user: Union[discord.User, discord.Member]):
+
+        self.store(user.id, (f'{user.name}#{user.discriminator}', user.display_avatar.url))
+
+    def store(self, user_id: int, display: UserDisplay):
+
+        self.entries[user_id] = display
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get(self, utils, user_id: int) -> UserDisplay:
+
+        if user_id in self.entries:
+            self.entries.move_to_end(user_id)
+            return self.entries[user_id]
+        user = await utils.aggressive_resolve_user(user_id)
+        if user == None:
+            self.store(user_id, None)
+        else:
+            self.remember(user)
+        return self.entries.get(user_id)
+
+def digest_page_count(entries: int) -> int:
+    return max(1, -(-entries // digest_page_size))
+
+def digest_controls(events: List[BanUtilBanEvent], page: int) -> discord.ui.View:
+
+    last_page = digest_page_count(len(events)) - 1
+    return stateless_view([
+        discord.ui.Button(
+            emoji='◀️', style=discord.ButtonStyle.secondary, disabled=page <= 0,
+            custom_id=component_id(TrackedMessage.digest, page, 'prev')
+        ),
+        discord.ui.Button(
+            emoji='▶️', style=discord.ButtonStyle.secondary, disabled=page >= last_page,
+            custom_id=component_id(TrackedMessage.digest, page, 'next')
+        ),
+        discord.ui.Button(
+            label='Report all', emoji='📣', style=discord.ButtonStyle.primary,
+            disabled=all(event.reported for event in events),
+            custom_id=component_id(TrackedMessage.digest, page, 'report')
+        ),
+        discord.ui.Button(
+            label='Unban all', emoji='🔄', style=discord.ButtonStyle.secondary,
+            disabled=not any(event.banned for event in events),
+            custom_id=component_id(TrackedMessage.digest, page, 'unban')
+        )
+    ])
+
+def render_digest_embed(events: List[BanUtilBanEvent], page: int) -> discord.Embed:
+
+    lines = []
+    for event in events[page*digest_page_size:(page+1)*digest_page_size]:
+        line = f'<@{event.target_id}> ({event.target_id})'
+        if event.banner_id != None:
+            line += f' by <@{event.banner_id}>'
+        reason = event.ban_reason or 'No reason given'
+        if len(reason) > digest_reason_length:
+            reason = reason[:digest_reason_length-1] + '…'
+        line += f': {reason}'
+        if event.reported:
+            line += ' *(reported)*'
+        if not event.banned:
+            line += ' *(unbanned)*'
+        lines.append(line)
+
+    embed = discord.Embed(
+        color=color_red,
+        title=f'Ban wave: {len(events)} bans',
+        description='\n'.join(lines)
+    )
+    embed.set_footer(text=f'Page {page+1}/{digest_page_count(len(events))}')
+    return embed
+
+# sliding window of recent ban times per guild
+class BanBurstDetector:
+
+    def __init__(self, window: float = digest_window, threshold: int = digest_threshold):
+
+        self.window = window
+        self.threshold = threshold
+        self.bans: Dict[int, collections.deque] = {}
+
+    def record(self, guild_id: int) -> bool:
+
+        now = time.monotonic()
+        bans = get_or_create(self.bans, guild_id, collections.deque())
+        bans.append(now)
+        while bans[0] <= now - self.window:
+            bans.popleft()
+        return len(bans) >= self.threshold
+
+    def forget(self, guild_id: int):
+
+        self.bans.pop(guild_id, None)
+
+# users banned in each guild over the last recent_ban_ttl, looked up on every join so it
+# stays a dict hit. expiry runs off a deque in ban order; entries superseded by a later
+# ban or removed by an unban are skipped when their turn comes
+class RecentBanIndex:
+
+    def __init__(self, ttl: timedelta = recent_ban_ttl):
+
+        self.ttl = ttl.total_seconds()
+        self.bans: Dict[int, Dict[int, float]] = {}  # user -> source guild -> ban time
+        self.expiry = collections.deque()            # (ban time, guild, user)
+
+    async def load(self):
+
+        self.__init__(timedelta(seconds=self.ttl))
+        since = datetime.now() - timedelta(seconds=self.ttl)
+        for guild_id, target_id, timestamp in await BanUtilBanEvent.filter(timestamp__gte=since, banned=True) \
+                .order_by('timestamp').values_list('guild_id', 'target_id', 'timestamp'):
+            self.add(guild_id, target_id, timestamp.timestamp())
+
+    def add(self, guild_id: int, user_id: int, banned_at: Optional[float] = None):
+
+        if banned_at == None:
+            banned_at = time.time()
+        get_or_create(self.bans, user_id, {})[guild_id] = banned_at
+        self.expiry.append((banned_at, guild_id, user_id))
+        self.prune()
+
+    def remove(self, guild_id: int, user_id: int):
+
+        sources = self.bans.get(user_id)
+        if sources != None:
+            sources.pop(guild_id, None)
+            if not sources:
+                del self.bans[user_id]
+
+    def prune(self):
+
+        cutoff = time.time() - self.ttl
+        while self.expiry and self.expiry[0][0] <= cutoff:
+            banned_at, guild_id, user_id = self.expiry.popleft()
+            if self.bans.get(user_id, {}).get(guild_id) == banned_at:
+                self.remove(guild_id, user_id)
+
+    def banned_in(self, user_id: int, guild_ids: Set[int]) -> List[int]:
+
+        sources = self.bans.get(user_id)
+        if not sources:
+            return []
+        cutoff = time.time() - self.ttl
+        return [guild_id for guild_id, banned_at in sources.items() if guild_id in guild_ids and banned_at > cutoff]
+
+class AuditLogCache:
+
+    def __init__(self):
+        # guild id -> target id -> (banner id, reason, created at)
+        self.entries: Dict[int, collections.OrderedDict] = {}
+        self.waiters: Dict[Tuple[int, int], asyncio.Event] = {}
+        self.fetches: Dict[int, asyncio.Task] = {}
+        self.fetched_at: Dict[int, float] = {}
+
+    def record(self, guild_id: int, target_id: int, banner_id: Optional[int], reason: Optional[str], created_at: datetime):
+
+        entries = self.entries.setdefault(guild_id, collections.OrderedDict())
+        existing = entries.get(target_id)
+        if existing != None and existing[2] >= created_at:
+            return
+        entries[target_id] = (banner_id, reason, created_at)
+        entries.move_to_end(target_id)
+        while len(entries) > audit_cache_size:
+            entries.popitem(last=False)
+        if (guild_id, target_id) in self.waiters:
+            self.waiters[(guild_id, target_id)].set()
+
+    def lookup(self, guild_id: int, target_id: int, since: datetime) -> Optional[Tuple[Optional[int], Optional[str]]]:
+
+        entry = self.entries.get(guild_id, {}).get(target_id)
+        if entry == None or entry[2] < since:
+            return None
+        return entry[0], entry[1]
+
+    async def fetch(self, guild: discord.Guild):
+
+        try:
+            async for log_entry in guild.audit_logs(limit=audit_fetch_limit, action=discord.AuditLogAction.ban):
+                if log_entry.target != None:
+                    self.record(guild.id, log_entry.target.id, log_entry.user.id if log_entry.user else None,
+                                log_entry.reason, log_entry.created_at)
+        finally:
+            self.fetched_at[guild.id] = time.monotonic()
+
+    async def refresh(self, guild: discord.Guild):
+
+        # single flight: while a fetch runs, everyone waits on it instead of starting another
+        task = self.fetches.get(guild.id)
+        if task == None or task.done():
+            if time.monotonic() - self.fetched_at.get(guild.id, 0) < audit_refresh_interval:
+                return
+            task = self.fetches[guild.id] = asyncio.create_task(self.fetch(guild))
+        try:
+            await asyncio.shield(task)
+        except discord.HTTPException:
+            pass  # retried on the next refresh
+
+    async def attribute(self, guild: discord.Guild, target_id: int) -> Tuple[Optional[int], Optional[str]]:
+
+        since = datetime.now(timezone.utc) - audit_entry_max_age
+        key = (guild.id, target_id)
+        event = self.waiters.setdefault(key, asyncio.Event())
+        try:
+            for wait in audit_attribution_waits:
+                found = self.lookup(guild.id, target_id, since)
+                if found != None:
+                    return found
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    await self.refresh(guild)
+                event.clear()
+            return self.lookup(guild.id, target_id, since) or (None, None)
+        finally:
+            self.waiters.pop(key, None)
+
+    def forget(self, guild_id: int):
+
+        self.entries.pop(guild_id, None)
+        self.fetched_at.pop(guild_id, None)
+        task = self.fetches.pop(guild_id, None)
+        if task != None:
+            task.cancel()
+
+# subscriptions, pending invites and blocks between guilds, mirrored from the database
+# at startup and kept in step by everything that changes them
+class FederationGraph:
+
+    def __init__(self):
+        self.subscribers: Dict[int, Set[int]] = {}    # source guild -> subscribed guilds
+        self.subscriptions: Dict[int, Set[int]] = {}  # subscribed guild -> source guilds
+        self.invites: Dict[int, Set[int]] = {}        # inviting guild -> invited guilds
+        self.blocks: Dict[int, Set[int]] = {}         # guild -> guilds it blocked
+
+    async def load(self, guild_id: Optional[int] = None):
+
+        if guild_id == None:
+            self.__init__()
+            edge_filters, block_filters = [{}], [{}]
+        else:
+            self.forget(guild_id)
+            edge_filters = [{'from_guild_id': guild_id}, {'to_guild_id': guild_id}]
+            block_filters = [{'guild_id': guild_id}, {'blocked_id': guild_id}]
+
+        for filters in edge_filters:
+            for from_guild_id, to_guild_id in await BanUtilSubscription.filter(**filters).values_list('from_guild_id', 'to_guild_id'):
+                self.add_subscription(from_guild_id, to_guild_id)
+            for from_guild_id, to_guild_id in await BanUtilInvite.filter(**filters).values_list('from_guild_id', 'to_guild_id'):
+                self.add_invite(from_guild_id, to_guild_id)
+        for filters in block_filters:
+            for blocking_id, blocked_id in await BanUtilBlock.filter(**filters).values_list('guild_id', 'blocked_id'):
+                self.add_block(blocking_id, blocked_id)
+
+    def forget(self, guild_id: int):
+
+        for from_guild_id in self.subscriptions.pop(guild_id, set()):
+            self.subscribers.get(from_guild_id, set()).discard(guild_id)
+        for to_guild_id in self.subscribers.pop(guild_id, set()):
+            self.subscriptions.get(to_guild_id, set()).discard(guild_id)
+        self.invites.pop(guild_id, None)
+        self.blocks.pop(guild_id, None)
+        for edges in itertools.chain(self.invites.values(), self.blocks.values()):
+            edges.discard(guild_id)
+
+    def add_subscription(self, from_guild_id: int, to_guild_id: int):
+        get_or_create(self.subscribers, from_guild_id, set()).add(to_guild_id)
+        get_or_create(self.subscriptions, to_guild_id, set()).add(from_guild_id)
+
+    def remove_subscription(self, from_guild_id: int, to_guild_id: int):
+        self.subscribers.get(from_guild_id, set()).discard(to_guild_id)
+        self.subscriptions.get(to_guild_id, set()).discard(from_guild_id)
+
+    def is_subscribed(self, from_guild_id: int, to_guild_id: int) -> bool:
+        return to_guild_id in self.subscribers.get(from_guild_id, ())
+
+    def add_invite(self, from_guild_id: int, to_guild_id: int):
+        get_or_create(self.invites, from_guild_id, set()).add(to_guild_id)
+
+    def remove_invite(self, from_guild_id: int, to_guild_id: int):
+        self.invites.get(from_guild_id, set()).discard(to_guild_id)
+
+    def is_invited(self, from_guild_id: int, to_guild_id: int) -> bool:
+        return to_guild_id in self.invites.get(from_guild_id, ())
+
+    def add_block(self, guild_id: int, blocked_id: int):
+        get_or_create(self.blocks, guild_id, set()).add(blocked_id)
+
+    def remove_block(self, guild_id: int, blocked_id: int):
+        self.blocks.get(guild_id, set()).discard(blocked_id)
+
+    def is_blocked(self, guild_id: int, blocked_id: int) -> bool:
+        return blocked_id in self.blocks.get(guild_id, ())
+
 class BanUtils(BaseModule):
     
     meta = ModuleInfo(
@@ -45,12 +464,57 @@ class BanUtils(BaseModule):
 
         self.report_locks: Union[int, asyncio.Lock] = {}
         self.massban_queue = DiscardingQueue(0x10)
+        self.audit_log = AuditLogCache()
+        self.federation = FederationGraph()
+        self.user_display = UserDisplayCache()
+        self.ban_bursts = BanBurstDetector()
+        self.recent_bans = RecentBanIndex()
+        # unsaved ban events waiting for the next digest, by guild and then target
+        self.digests: Dict[int, Dict[int, BanUtilBanEvent]] = {}
+        self.digest_tasks: Dict[int, asyncio.Task] = {}
+        # message ids of live ban, crossban and invite messages. reactions anywhere else
+        # are dropped before any requests or queries
+        self.tracked_messages: Dict[int, str] = {}
+        # (guild, user) bans made by join_action. they aren't indexed or logged as domestic
+        # bans, or one source ban would spread down every chain of subscriptions by itself
+        self.join_bans: Set[Tuple[int, int]] = set()
+
+    def tracked_queries(self):
+
+        return ((TrackedMessage.ban, BanUtilBanEvent.filter(digest=False)),
+                (TrackedMessage.crossban, BanUtilCrossbanEvent.all()),
+                (TrackedMessage.invite, BanUtilInvite.filter(message_id__not_isnull=True)))
+
+    async def prune_tracked_messages(self):
+
+        # drops ids whose rows were deleted without going through the module. ids added
+        # while this runs aren't candidates, and their rows exist before they're tracked
+        candidates = set(self.tracked_messages)
+        live = set()
+        for _, query in self.tracked_queries():
+            live.update(await query.values_list('message_id', flat=True))
+        for message_id in candidates - live:
+            self.tracked_messages.pop(message_id, None)
+
+    async def delete_invites(self, from_guild_id: int, to_guild_id: int):
+
+        invites = BanUtilInvite.filter(from_guild_id=from_guild_id, to_guild_id=to_guild_id)
+        for message_id in await invites.filter(message_id__not_isnull=True).values_list('message_id', flat=True):
+            self.tracked_messages.pop(message_id, None)
+        await invites.delete()
 
     async def initialize(self):
 
         for guild in self.bot.guilds:
             self.report_locks[guild.id] = asyncio.Lock()
 
+        await self.federation.load()
+        await self.recent_bans.load()
+
+        for kind, query in self.tracked_queries():
+            for message_id in await query.values_list('message_id', flat=True):
+                self.tracked_messages[message_id] = kind
+
         self.massban_task = self.bot.loop.create_task(self.massban_loop())
 
         await super().initialize()
@@ -60,7 +524,16 @@ class BanUtils(BaseModule):
         await self.massban_queue.put(None)
         if self.massban_task:
             await self.massban_task
+
+        for task in self.digest_tasks.values():
+            task.cancel()
+        for guild_id in list(self.digests):
+            await self.flush_digest(guild_id)
     
+    async def reload_guild(self, guild_id: int):
+
+        await self.federation.load(guild_id)
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
 
@@ -74,115 +547,178 @@ class BanUtils(BaseModule):
             await self.report_locks[guild.id].aquire()
             del self.report_locks[guild.id]
 
-    async def update_ban_message(self, ban_event: BanUtilBanEvent):
+        self.audit_log.forget(guild.id)
+        self.ban_bursts.forget(guild.id)
 
-        await ban_event.fetch_related('guild')
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
 
-        guild = self.bot.get_guild(ban_event.guild.id)
-        channel = guild.get_channel(ban_event.message_channel)
-        if channel == None:
-            return
+        if entry.action == discord.AuditLogAction.ban and entry.target != None:
+            self.audit_log.record(entry.guild.id, entry.target.id, entry.user_id, entry.reason, entry.created_at)
+
+    async def edit_log_message(self, channel_id: int, message_id: int, embed: discord.Embed, view: Optional[discord.ui.View]):
+
+        # edits go straight to the stored ids, the message itself is never fetched
+        message = self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
         try:
-            message = await channel.fetch_message(ban_event.message_id)
+            await message.edit(embed=embed, view=view)
         except (discord.NotFound, discord.Forbidden):
+            pass
+
+    async def render_event(self, event: Union[BanUtilBanEvent, BanUtilCrossbanEvent],
+                           is_ban_event: bool) -> Optional[Tuple[discord.Embed, Optional[discord.ui.View]]]:
+
+        # crossban events need their source event loaded
+        if is_ban_event:
+            guild = self.bot.get_guild(event.guild_id)
+            if guild == None:
+                return None
+            embed = await self.render_ban_embed(event, guild)
+            view = None if event.id == None else event_controls(TrackedMessage.ban, event.id, event.banned)
+        else:
+            source_guild = self.bot.get_guild(event.event.guild_id)
+            if source_guild == None:
+                return None
+            embed = await self.render_crossban_embed(event.event, source_guild, event.id == None, event.reported)
+            view = None if event.id == None else event_controls(TrackedMessage.crossban, event.event.id, event.banned)
+        return embed, view
+
+    async def update_ban_message(self, ban_event: BanUtilBanEvent):
+
+        # digest entries are rendered from the database whenever their digest is paged
+        if ban_event.digest:
             return
+        rendered = await self.render_event(ban_event, True)
+        if rendered != None:
+            await self.edit_log_message(ban_event.message_channel, ban_event.message_id, *rendered)
+
+    async def render_ban_embed(self, ban_event: BanUtilBanEvent, guild: discord.Guild) -> discord.Embed:
+
         icon_url = None
 
-        target_user: Optional[discord.User] = await self.utils.aggressive_resolve_user(ban_event.target_id)
+        target_user = await self.user_display.get(self.utils, ban_event.target_id)
         if target_user == None:
             title = f'{ban_event.target_id} banned'
         else:
-            icon_url = target_user.display_avatar.url
-            title = f'{target_user.name}#{target_user.discriminator} ({ban_event.target_id}) banned'
+            title = f'{target_user[0]} ({ban_event.target_id}) banned'
+            icon_url = target_user[1]
 
         if ban_event.banner_id != None:
-            banner_user: Optional[discord.User] = await self.utils.aggressive_resolve_user(ban_event.banner_id)
+            banner_user = await self.user_display.get(self.utils, ban_event.banner_id)
             if banner_user == None:
                 title += f' by {ban_event.banner_id}'
             else:
-                title += f' by {banner_user.name}#{banner_user.discriminator}'
+                title += f' by {banner_user[0]}'
                 if icon_url == None:
-                    icon_url = banner_user.avatar.url
+                    icon_url = banner_user[1]
 
-        if icon_url == None:
-            icon_url = guild.icon_url
+        if icon_url == None and guild.icon != None:
+            icon_url = guild.icon.url
 
+        description_entries = [( 'Reason', ban_event.ban_reason )]
+        if ban_event.reported:
+            description_entries.append(( '📣', f'Reported on {datetime_repr(ban_event.reported)}' ))
         if ban_event.id == None:
-            description_entries = [
-                ( 'Reason', ban_event.ban_reason ),
-                ( '❌',                  'Closed' )
-            ]
-        else:
-            description_entries = [
-                ( 'Reason',                                                               ban_event.ban_reason ),
-                ( '📣', f'Reported on {datetime_repr(ban_event.reported)}' if ban_event.reported else 'Report' ),
-                ( '🔄' if ban_event.banned else '🔨',                   'Unban' if ban_event.banned else 'Ban' ),
-                ( '❌',                                                                                 'Close')
-            ]
+            description_entries.append(( '❌', 'Closed' ))
 
         embed = discord.Embed(
             color=color_red,
             description='\n'.join((f'{i[0]}: {i[1]}' for i in description_entries))
         )
         embed.set_author(name=title, icon_url=icon_url)
-        await message.edit(embed=embed)
+        return embed
     
     async def update_crossban_message(self, crossban_event: BanUtilCrossbanEvent):
 
-        await crossban_event.fetch_related('event', 'guild')
-        await crossban_event.event.fetch_related('guild')
+        rendered = await self.render_event(crossban_event, False)
+        if rendered != None:
+            await self.edit_log_message(crossban_event.message_channel, crossban_event.message_id, *rendered)
 
-        source_guild = self.bot.get_guild(crossban_event.event.guild.id)
-        guild = self.bot.get_guild(crossban_event.guild.id)
-        channel = guild.get_channel(crossban_event.message_channel)
-        if channel == None:
-            return
-        try:
-            message = await channel.fetch_message(crossban_event.message_id)
-        except (discord.NotFound, discord.Forbidden):
-            return
+    async def render_crossban_embed(self, ban_event: BanUtilBanEvent, source_guild: discord.Guild,
+                                    closed: bool, reported: Optional[datetime]) -> discord.Embed:
 
-        icon_url = source_guild.icon.url
-        target_user: discord.User = await self.utils.aggressive_resolve_user(crossban_event.event.target_id)
+        icon_url = source_guild.icon.url if source_guild.icon != None else None
+        target_user = await self.user_display.get(self.utils, ban_event.target_id)
         if target_user == None:
-            title = f'{crossban_event.event.target_id} banned in {source_guild.name}'
+            title = f'{ban_event.target_id} banned in {source_guild.name}'
         else:
-            title = f'{target_user.name}#{target_user.discriminator} ({crossban_event.event.target_id}) banned in {source_guild.name}'
+            title = f'{target_user[0]} ({ban_event.target_id}) banned in {source_guild.name}'
             if icon_url == None:
-                icon_url = target_user.avatar.url
+                icon_url = target_user[1]
 
-        if crossban_event.event.banner_id != None:
-            banner_user: Optional[discord.User] = await self.utils.aggressive_resolve_user(crossban_event.event.banner_id)
+        if ban_event.banner_id != None:
+            banner_user = await self.user_display.get(self.utils, ban_event.banner_id)
             if banner_user == None:
-                title += f' by {crossban_event.event.banner_id}'
+                title += f' by {ban_event.banner_id}'
             else:
-                title += f' by {banner_user.name}#{banner_user.discriminator}'
+                title += f' by {banner_user[0]}'
                 if icon_url == None:
-                    icon_url = banner_user.avatar.url
+                    icon_url = banner_user[1]
 
-        if crossban_event.id == None:
-            description_entries = [
-                ( 'Reason', crossban_event.event.ban_reason ),
-                ( '❌',                             'Closed' )
-            ]
-        else:
-            description_entries = [
-                ( 'Reason',                                                                crossban_event.event.ban_reason ),
-                ( '📣', f'Forwarded on {datetime_repr(crossban_event.reported)}' if crossban_event.reported else 'Forward' ),
-                ( '🔄' if crossban_event.banned else '🔨',                     'Unban' if crossban_event.banned else 'Ban' ),
-                ( '❌',                                                                                             'Close')
-            ]
+        description_entries = [( 'Reason', ban_event.ban_reason )]
+        if reported:
+            description_entries.append(( '📣', f'Forwarded on {datetime_repr(reported)}' ))
+        if closed:
+            description_entries.append(( '❌', 'Closed' ))
 
         embed = discord.Embed(
             color=color_red,
             description='\n'.join((f'{i[0]}: {i[1]}' for i in description_entries))
         )
         embed.set_author(name=title, icon_url=icon_url)
-        await message.edit(embed=embed)
+        return embed
+
+    async def forward_ban(self, guild: discord.Guild, ban_event: BanUtilBanEvent):
+
+        # subscribers and their mirrors are fetched up front, the embed is the same for
+        # every new mirror so it's rendered once, and sends run side by side
+        mirrored = set(await BanUtilCrossbanEvent.filter(event_id=ban_event.id).values_list('guild_id', flat=True))
+        targets = self.federation.subscribers.get(guild.id, set()) - mirrored
+        if not targets:
+            return
+        log_channels = dict(await BanUtilSettings.filter(
+            guild_id__in=list(targets),
+            foreign_log_channel__not_isnull=True
+        ).values_list('guild_id', 'foreign_log_channel'))
+
+        embed = await self.render_crossban_embed(ban_event, guild, False, None)
+        view = event_controls(TrackedMessage.crossban, ban_event.id, False)
+        semaphore = asyncio.Semaphore(crossban_concurrency)
+
+        async def send(guild_id: int, channel_id: int) -> Optional[discord.Message]:
+            target_channel = self.bot.get_channel(channel_id)
+            if target_channel == None:
+                return None  # set channel not valid
+            async with semaphore:
+                try:
+                    return await target_channel.send(embed=embed, view=view)
+                except discord.HTTPException:
+                    return None
+
+        sent = await asyncio.gather(*(send(guild_id, channel_id) for guild_id, channel_id in log_channels.items()))
+        new_messages = [(guild_id, new_message) for guild_id, new_message in zip(log_channels, sent) if new_message != None]
+        # a press that beats the rows here is told to try again, so there's nothing to wait for
+        await BanUtilCrossbanEvent.bulk_create([
+            BanUtilCrossbanEvent(
+                guild_id=guild_id,
+                event_id=ban_event.id,
+                message_id=new_message.id,
+                message_channel=new_message.channel.id
+            )
+            for guild_id, new_message in new_messages
+        ])
+        for _, new_message in new_messages:
+            self.tracked_messages[new_message.id] = TrackedMessage.crossban
     
     @commands.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, user: Union[discord.Member, discord.User]):
 
+        if (guild.id, user.id) in self.join_bans:
+            self.join_bans.discard((guild.id, user.id))
+            return
+
+        # indexed whether or not the ban ends up logged
+        self.recent_bans.add(guild.id, user.id)
         try:
             try:
                 ban_event = await BanUtilBanEvent.get(guild_id=guild.id, target_id=user.id)
@@ -190,10 +726,11 @@ class BanUtils(BaseModule):
                     ban_event.banned = True
                     await ban_event.save()
                     await self.update_ban_message(ban_event)
-                    return
+                # there's one event per guild and target, a ban we already logged is done
+                return
             except DoesNotExist:
                 try:
-                    crossban_event = await BanUtilCrossbanEvent.get(guild_id=guild.id, event__target_id=user.id)
+                    crossban_event = await BanUtilCrossbanEvent.get(guild_id=guild.id, event__target_id=user.id).prefetch_related('event')
                     if not crossban_event.banned:
                         crossban_event.banned = True
                         await crossban_event.save()
@@ -202,15 +739,11 @@ class BanUtils(BaseModule):
                 except DoesNotExist:
                     pass
             
-            ban_user_id = None
-            ban_reason = 'No reason given'
-            while ban_user_id == None:
-                async for log_entry in guild.audit_logs(limit=100, action=discord.AuditLogAction.ban):
-                    if log_entry.target == user:
-                        ban_user_id = log_entry.user.id
-                        ban_reason = log_entry.reason
-                        break
-                await asyncio.sleep(0.1)
+            bursting = self.ban_bursts.record(guild.id)
+            self.user_display.remember(user)
+            ban_user_id, ban_reason = await self.audit_log.attribute(guild, user.id)
+            if ban_user_id == None:
+                ban_reason = 'No reason given'
             
             module_settings: BanUtilSettings = await BanUtilSettings.get(guild_id=guild.id)
 
@@ -218,36 +751,126 @@ class BanUtils(BaseModule):
             if log_channel == None:
                 return
 
-            new_message = await log_channel.send(
-                embed=discord.Embed(
-                    color=discord.Color(0xFFFFFF),
-                    description='📨'
-                )
-            )
-
-            async with in_transaction():
-
-                ban_event = await BanUtilBanEvent.create(
+            if bursting or guild.id in self.digests:
+                self.queue_digest(guild.id, BanUtilBanEvent(
                     guild_id=guild.id,
-                    message_id=new_message.id,
-                    message_channel=module_settings.domestic_log_channel,
+                    message_channel=log_channel.id,
                     target_id=user.id,
                     banner_id=ban_user_id,
-                    ban_reason=ban_reason
-                )
+                    ban_reason=ban_reason,
+                    digest=True
+                ))
+                return
 
-                await self.update_ban_message(ban_event)
+            # the row goes in first so the buttons can carry its id, then the message is
+            # sent finished in one request
+            ban_event = await BanUtilBanEvent.create(
+                guild_id=guild.id,
+                message_id=0,
+                message_channel=log_channel.id,
+                target_id=user.id,
+                banner_id=ban_user_id,
+                ban_reason=ban_reason
+            )
+            try:
+                new_message = await log_channel.send(
+                    embed=await self.render_ban_embed(ban_event, guild),
+                    view=event_controls(TrackedMessage.ban, ban_event.id, True)
+                )
+            except discord.HTTPException:
+                await ban_event.delete()
+                raise
 
-            await new_message.add_reaction('📣')
-            await new_message.add_reaction('🔄')
-            await new_message.add_reaction('❌')
+            ban_event.message_id = new_message.id
+            await ban_event.save(update_fields=['message_id'])
+            self.tracked_messages[new_message.id] = TrackedMessage.ban
         except Exception as e:
             await self.utils.log_background_error(guild, e)
     
+    def queue_digest(self, guild_id: int, ban_event: BanUtilBanEvent):
+
+        pending = self.digests.get(guild_id)
+        if pending == None:
+            pending = self.digests[guild_id] = {}
+            self.digest_tasks[guild_id] = self.bot.loop.create_task(self.digest_later(guild_id))
+        pending[ban_event.target_id] = ban_event
+
+    async def digest_later(self, guild_id: int):
+
+        await asyncio.sleep(digest_interval)
+        await self.flush_digest(guild_id)
+
+    async def flush_digest(self, guild_id: int):
+
+        self.digest_tasks.pop(guild_id, None)
+        pending = self.digests.get(guild_id)
+        if not pending:
+            self.digests.pop(guild_id, None)
+            return
+        queued = list(pending.values())
+        guild = self.bot.get_guild(guild_id)
+
+        # the rows go in before the message, as on_member_ban does it, and the events stay
+        # queued until they're written so unbans and re-bans in the meantime still find them
+        try:
+            channel = self.bot.get_channel(queued[0].message_channel)
+            if channel == None:
+                self.digests.pop(guild_id, None)
+                return
+            # a target whose row was written some other way already has its event
+            existing = set(await BanUtilBanEvent.filter(
+                guild_id=guild_id, target_id__in=[event.target_id for event in queued]).values_list('target_id', flat=True))
+            events = [event for event in queued if event.target_id not in existing]
+            for event in events:
+                event.message_id = 0
+            if events:
+                await BanUtilBanEvent.bulk_create(events)
+        except Exception as e:
+            self.digests.pop(guild_id, None)
+            await self.utils.log_background_error(guild, e)
+            return
+        self.digests.pop(guild_id, None)
+
+        try:
+            # changes that came in while the rows were written go onto the rows, and bans
+            # queued meanwhile wait for the next digest
+            targets = [event.target_id for event in events]
+            written = {event.target_id: event for event in events}
+            queued_ids = set(map(id, queued))
+            for event in pending.values():
+                if id(event) in queued_ids:
+                    continue
+                if event.target_id in written:
+                    written[event.target_id].banned = event.banned
+                    await BanUtilBanEvent.filter(guild_id=guild_id, target_id=event.target_id).update(banned=event.banned)
+                else:
+                    self.queue_digest(guild_id, event)
+            unbanned = [event.target_id for event in events if not event.banned]
+            if unbanned:
+                await BanUtilBanEvent.filter(guild_id=guild_id, target_id__in=unbanned).update(banned=False)
+            if not events:
+                return
+
+            try:
+                new_message = await channel.send(embed=render_digest_embed(events, 0), view=digest_controls(events, 0))
+            except discord.HTTPException:
+                await BanUtilBanEvent.filter(guild_id=guild_id, target_id__in=targets, message_id=0).delete()
+                raise
+            await BanUtilBanEvent.filter(guild_id=guild_id, target_id__in=targets, message_id=0).update(
+                message_id=new_message.id)
+        except Exception as e:
+            await self.utils.log_background_error(guild, e)
+
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: Union[discord.Member, discord.User]):
 
+        self.recent_bans.remove(guild.id, user.id)
         try:
+            pending = self.digests.get(guild.id)
+            if pending and user.id in pending:
+                pending[user.id].banned = False
+                return
+
             try:
                 ban_event = await BanUtilBanEvent.get(guild_id=guild.id, target_id=user.id)
                 if ban_event.banned:
@@ -256,7 +879,7 @@ class BanUtils(BaseModule):
                     await self.update_ban_message(ban_event)
             except DoesNotExist:
                 try:
-                    crossban_event = await BanUtilCrossbanEvent.get(guild_id=guild.id, event__target_id=user.id)
+                    crossban_event = await BanUtilCrossbanEvent.get(guild_id=guild.id, event__target_id=user.id).prefetch_related('event')
                     if crossban_event.banned:
                         crossban_event.banned = False
                         await crossban_event.save()
@@ -266,14 +889,299 @@ class BanUtils(BaseModule):
         except Exception as e:
             await self.utils.log_background_error(guild, e)
     
-    # we have to use the raw reaction event because rapptz hates me
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+
+        # runs on every join, so nothing past the index lookups unless there's a hit
+        sources = self.federation.subscriptions.get(member.guild.id)
+        if not sources:
+            return
+        banned_in = self.recent_bans.banned_in(member.id, sources)
+        if not banned_in:
+            return
+
+        guild = member.guild
+        try:
+            module_settings: BanUtilSettings = await BanUtilSettings.get(guild_id=guild.id)
+            join_action = JoinAction(module_settings.join_action)
+            if join_action == JoinAction.off:
+                return
+
+            source_names = [str(self.describe_guild(guild_id)) for guild_id in banned_in]
+            reason = f'BanUtils: recently banned in {commas(source_names)}'
+            if join_action == JoinAction.kick:
+                await member.kick(reason=reason)
+                action_msg = 'Kicked'
+            elif join_action == JoinAction.ban:
+                self.join_bans.add((guild.id, member.id))
+                try:
+                    await member.ban(reason=reason)
+                except Exception:
+                    self.join_bans.discard((guild.id, member.id))
+                    raise
+                action_msg = 'Banned'
+            else:
+                action_msg = 'No action taken'
+
+            log_channel = guild.get_channel(module_settings.foreign_log_channel)
+            if log_channel == None:
+                return
+            embed = discord.Embed(
+                color=color_red,
+                description=f'Banned in {commas(source_names)} within the last {recent_ban_ttl.days} days\n{action_msg}'
+            )
+            embed.set_author(name=f'{member} ({member.id}) joined', icon_url=member.display_avatar.url)
+            await log_channel.send(embed=embed)
+        except Exception as e:
+            await self.utils.log_background_error(guild, e)
+
+    async def event_permissions(self, guild: discord.Guild, member: discord.Member,
+                                permissions: discord.Permissions) -> Dict[str, bool]:
+
+        if await check_privildged(guild, member):
+            return dict.fromkeys(('report', 'unban', 'ban', 'close'), True)
+        return {
+            'report': permissions.manage_guild,
+            'unban':  permissions.ban_members,
+            'ban':    permissions.ban_members,
+            'close':  permissions.manage_guild
+        }
+
+    async def apply_event_action(self, guild: discord.Guild, event: Union[BanUtilBanEvent, BanUtilCrossbanEvent],
+                                 is_ban_event: bool, action: str, user_id: int) -> bool:
+
+        # shared by buttons and legacy reactions. returns whether anything changed
+        ban_event = event if is_ban_event else event.event
+
+        if action == 'report':
+            async with self.report_locks[guild.id]:
+                await self.forward_ban(guild, ban_event)
+                event.reported = datetime.now()
+                await event.save(update_fields=['reported'])
+
+        elif action == 'unban' and event.banned:
+            try:
+                await guild.unban(discord.Object(ban_event.target_id), reason=f'BanUtils action by {user_id}')
+            except discord.HTTPException as e:
+                if e.code == 10026:
+                    pass
+                else:
+                    raise e
+            event.banned = False
+            await event.save()
+
+        elif action == 'ban' and not event.banned:
+            await guild.ban(discord.Object(ban_event.target_id), reason=f'BanUtils action by {user_id}')
+            event.banned = True
+            await event.save()
+
+        elif action == 'close':
+            await event.delete()
+            self.tracked_messages.pop(event.message_id, None)
+            event.id = None
+
+        else:
+            return False
+        return True
+
+    async def apply_invite_action(self, guild: discord.Guild, invite: BanUtilInvite, action: str) -> Optional[str]:
+
+        # returns what the invite message should say afterwards
+        if action == 'accept':
+
+            if not self.federation.is_subscribed(invite.from_guild_id, invite.to_guild_id):
+                await BanUtilSubscription.create(
+                    from_guild_id=invite.from_guild_id,
+                    to_guild_id=invite.to_guild_id
+                )
+                self.federation.add_subscription(invite.from_guild_id, invite.to_guild_id)
+
+                foreign_settings = await BanUtilSettings.get(guild_id=invite.from_guild_id)
+                if foreign_settings.foreign_log_channel != None:
+                    target_channel = self.bot.get_channel(foreign_settings.foreign_log_channel)
+                    if target_channel == None:
+                        foreign_settings.foreign_log_channel = None
+                        await foreign_settings.save()
+                    else:
+                        try:
+                            await target_channel.send(embed=discord.Embed(
+                                color=discord.Color.green(),
+                                description=f'Subscription from {guild.name} ({guild.id})'
+                            ))
+                        except discord.Forbidden:
+                            pass
+            action_msg = 'Accepted'
+
+        elif action == 'block':
+
+            if not self.federation.is_blocked(invite.to_guild_id, invite.from_guild_id):
+                await BanUtilBlock.create(
+                    guild_id=invite.to_guild_id,
+                    blocked_id=invite.from_guild_id
+                )
+                self.federation.add_block(invite.to_guild_id, invite.from_guild_id)
+            action_msg = 'Blocked'
+
+        elif action == 'disable':
+
+            await BanUtilSettings.filter(guild_id=invite.to_guild_id).update(receive_invite_alerts=False)
+            action_msg = 'Disabled'
+
+        else:
+            return None
+
+        await invite.delete()
+        self.federation.remove_invite(invite.from_guild_id, invite.to_guild_id)
+        if invite.message_id != None:
+            self.tracked_messages.pop(invite.message_id, None)
+        return action_msg
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+
+        if interaction.type != discord.InteractionType.component or interaction.guild == None:
+            return
+        parsed = parse_component_id((interaction.data or {}).get('custom_id', ''))
+        if parsed == None:
+            return
+        kind, target_id, action = parsed
+
+        try:
+            if kind == TrackedMessage.invite:
+                await self.invite_interaction(interaction, target_id, action)
+            elif kind in (TrackedMessage.ban, TrackedMessage.crossban):
+                await self.event_interaction(interaction, kind == TrackedMessage.ban, target_id, action)
+            elif kind == TrackedMessage.digest:
+                await self.digest_interaction(interaction, target_id, action)
+        except Exception as e:
+            await self.utils.log_background_error(interaction.guild, e)
+
+    async def event_interaction(self, interaction: discord.Interaction, is_ban_event: bool, ban_event_id: int, action: str):
+
+        guild = interaction.guild
+        try:
+            if is_ban_event:
+                event = await BanUtilBanEvent.get(id=ban_event_id, guild_id=guild.id)
+            else:
+                event = await BanUtilCrossbanEvent.get(event_id=ban_event_id, guild_id=guild.id).prefetch_related('event')
+        except DoesNotExist:
+            await interaction.response.send_message('This ban is closed or not logged yet, try again in a moment', ephemeral=True)
+            return
+
+        permissions = await self.event_permissions(guild, interaction.user, interaction.permissions)
+        if not permissions.get(action):
+            await interaction.response.send_message("You don't have permission to do that", ephemeral=True)
+            return
+
+        if action == 'report':
+            # forwarding can outlast the interaction deadline
+            await interaction.response.defer()
+            edit = interaction.edit_original_response
+        else:
+            edit = interaction.response.edit_message
+
+        # a stale button (say, ban on an event that's banned already) re-renders the current state
+        await self.apply_event_action(guild, event, is_ban_event, action, interaction.user.id)
+        rendered = await self.render_event(event, is_ban_event)
+        if rendered == None:
+            await edit(view=None)
+        else:
+            embed, view = rendered
+            await edit(embed=embed, view=view)
+
+    async def apply_digest_action(self, guild: discord.Guild, events: List[BanUtilBanEvent], action: str, user_id: int):
+
+        if action == 'report':
+            now = datetime.now()
+            reported = []
+            async with self.report_locks[guild.id]:
+                try:
+                    for event in events:
+                        if event.reported == None:
+                            await self.forward_ban(guild, event)
+                            event.reported = now
+                            reported.append(event.id)
+                finally:
+                    if reported:
+                        await BanUtilBanEvent.filter(id__in=reported).update(reported=now)
+
+        elif action == 'unban':
+            unbanned = []
+            try:
+                for event in events:
+                    if event.banned:
+                        try:
+                            await guild.unban(discord.Object(event.target_id), reason=f'BanUtils action by {user_id}')
+                        except discord.HTTPException as e:
+                            if e.code == 10026:
+                                pass
+                            else:
+                                raise e
+                        event.banned = False
+                        unbanned.append(event.id)
+            finally:
+                if unbanned:
+                    await BanUtilBanEvent.filter(id__in=unbanned).update(banned=False)
+
+    async def digest_interaction(self, interaction: discord.Interaction, page: int, action: str):
+
+        guild = interaction.guild
+        events = await BanUtilBanEvent.filter(guild_id=guild.id, message_id=interaction.message.id, digest=True).order_by('id')
+        if not events:
+            await interaction.response.edit_message(view=None)
+            return
+
+        if action in ('report', 'unban'):
+            permissions = await self.event_permissions(guild, interaction.user, interaction.permissions)
+            if not permissions[action]:
+                await interaction.response.send_message("You don't have permission to do that", ephemeral=True)
+                return
+            # a whole wave takes a while
+            await interaction.response.defer()
+            edit = interaction.edit_original_response
+            await self.apply_digest_action(guild, events, action, interaction.user.id)
+        else:
+            edit = interaction.response.edit_message
+            if action == 'prev':
+                page -= 1
+            elif action == 'next':
+                page += 1
+
+        page = min(max(page, 0), digest_page_count(len(events)) - 1)
+        await edit(embed=render_digest_embed(events, page), view=digest_controls(events, page))
+
+    async def invite_interaction(self, interaction: discord.Interaction, from_guild_id: int, action: str):
+
+        guild = interaction.guild
+        if not interaction.permissions.administrator and not await check_privildged(guild, interaction.user):
+            await interaction.response.send_message("You don't have permission to do that", ephemeral=True)
+            return
+        try:
+            invite = await BanUtilInvite.get(from_guild_id=from_guild_id, to_guild_id=guild.id)
+        except DoesNotExist:
+            await interaction.response.edit_message(view=None)
+            return
+
+        action_msg = await self.apply_invite_action(guild, invite, action)
+        if action_msg == None:
+            return
+        embed = interaction.message.embeds[0].copy()
+        embed.description = action_msg
+        await interaction.response.edit_message(embed=embed, view=None)
+
+    # reactions only drive messages sent before buttons. we have to use the raw reaction
+    # event because rapptz hates me
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
 
         try:
             if payload.user_id == self.bot.user.id \
                 or payload.emoji.is_custom_emoji() \
-                or payload.emoji.name not in ['📣', '🔄', '🔨', '❌', '✅', '⏹️', '⛔']:
+                or payload.emoji.name not in event_reactions + invite_reactions:
+                return
+
+            kind = self.tracked_messages.get(payload.message_id)
+            if kind == None or (payload.emoji.name in invite_reactions) != (kind == TrackedMessage.invite):
                 return
 
             guild = self.bot.get_guild(payload.guild_id)
@@ -287,207 +1195,60 @@ class BanUtils(BaseModule):
                     return
                 else:
                     raise e
-            user = await guild.fetch_member(payload.user_id)
+            user = payload.member or await guild.fetch_member(payload.user_id)
 
             if message.author != self.bot.user or len(message.embeds) != 1:
                 return
             
-            if payload.emoji.name in ['✅', '⏹️', '⛔']:
+            if kind == TrackedMessage.invite:
                 # invite alerts
 
+                if not channel.permissions_for(user).administrator and not await check_privildged(guild, user):
+                    return
                 try:
-                    invite = await BanUtilInvite.filter(message_id=message.id).prefetch_related('from_guild', 'to_guild').get()
+                    invite = await BanUtilInvite.get(message_id=message.id)
                 except DoesNotExist:
+                    self.tracked_messages.pop(message.id, None)
                     await message.clear_reactions()
                     return
                 
-                action_msg = None
-                
-                if payload.emoji.name == '✅':
-
-                    action_msg = 'Accepted'
-
-                    try:
-                        await BanUtilSubscription.get(
-                            from_guild_id=invite.from_guild.id,
-                            to_guild_id=invite.to_guild.id
-                        )
-                    except DoesNotExist:
-                        await BanUtilSubscription.create(
-                            from_guild_id=invite.from_guild.id,
-                            to_guild_id=invite.to_guild.id
-                        )
-
-                        foreign_settings = await BanUtilSettings.get(guild_id=invite.from_guild.id)
-                        if foreign_settings.foreign_log_channel != None:
-                            target_channel = self.bot.get_channel(foreign_settings.foreign_log_channel)
-                            if target_channel == None:
-                                foreign_settings.foreign_log_channel = None
-                                await foreign_settings.save()
-                            else:
-                                try:
-                                    await target_channel.send(embed=discord.Embed(
-                                        color=discord.Color.green(),
-                                        description=f'Subscription from {guild.name} ({guild.id})'
-                                    ))
-                                except discord.Forbidden:
-                                    pass
-                
-                elif payload.emoji.name == '⏹️':
-
-                    action_msg = 'Blocked'
-
-                    try:
-                        block = await BanUtilBlock.get(
-                            guild_id=invite.to_guild.id,
-                            blocked_id=invite.from_guild.id
-                        )
-                    except DoesNotExist:
-                        await BanUtilBlock.create(
-                            guild_id=invite.to_guild.id,
-                            blocked_id=invite.from_guild.id
-                        )
-
-                elif payload.emoji.name == '⛔':
-
-                    action_msg = 'Disabled'
-
-                    await BanUtilSettings.filter(guild_id=invite.to_guild.id).update(receive_invite_alerts=False)
-
-                await invite.delete()
+                action_msg = await self.apply_invite_action(guild, invite, invite_actions[payload.emoji.name])
                 embed = message.embeds[0].copy()
                 embed.description = action_msg
-                await message.edit(embed=embed)
+                await message.edit(embed=embed, view=None)
                 await message.clear_reactions()
 
             else:
                 # bans
 
                 # we reuse the same code for both event types. get ready for a mess!
+                is_ban_event = kind == TrackedMessage.ban
                 try:
-                    event = await BanUtilBanEvent.get(message_id=message.id)
-                except DoesNotExist:
-                    try:
-                        event = await BanUtilCrossbanEvent.get(message_id=message.id).prefetch_related('event')
-                    except DoesNotExist:
-                        await message.clear_reactions()
-                        return
-                    else:
-                        is_ban_event = False
-                else:
-                    is_ban_event = True
-
-                privilidged = await check_privildged(guild, guild.get_member(user.id))
-                if privilidged:
-                    ban_perms = True
-                    crosspost_perms = True
-                    delete_perms = True
-                else:
-                    permissions = channel.permissions_for(user)
-                    ban_perms = permissions.ban_members
-                    crosspost_perms = permissions.manage_guild
-                    delete_perms = permissions.manage_guild
-                
-                if payload.emoji.name == '📣' and crosspost_perms:
-                    await message.add_reaction('📨')
-
-                    async with self.report_locks[guild.id]:
-                        if is_ban_event:
-                            ban_event = event
-                        else:
-                            ban_event = event.event
-
-                        subscribed: List[BanUtilSubscription] = await BanUtilSubscription.filter(from_guild_id=guild.id).prefetch_related('to_guild').all()
-                        for subscriber in subscribed:
-                            existing_mirrors = await BanUtilCrossbanEvent.filter(event=ban_event, guild=subscriber.to_guild).exists()
-                            if not existing_mirrors:
-                                module_settings: BanUtilSettings = await BanUtilSettings.get(guild=subscriber.to_guild)
-                                if module_settings.foreign_log_channel:
-
-                                    target_channel = self.bot.get_channel(module_settings.foreign_log_channel)
-                                    if target_channel == None:
-                                        # set channel not valid
-                                        continue
-                                    new_message = await target_channel.send(
-                                        embed=discord.Embed(
-                                            color=discord.Color(0xFFFFFF),
-                                            description='📨'
-                                        )
-                                    )
-
-                                    new_event = await BanUtilCrossbanEvent.create(
-                                        guild=subscriber.to_guild,
-                                        event=ban_event,
-                                        message_id=new_message.id,
-                                        message_channel=module_settings.foreign_log_channel
-                                    )
-
-                                    await new_message.add_reaction('📣')
-                                    await new_message.add_reaction('🔨')
-                                    await new_message.add_reaction('❌')
-                                    await self.update_crossban_message(new_event)
-
-                        event.reported = datetime.now()
-                        await event.save(update_fields=['reported'])
-
                     if is_ban_event:
-                        await self.update_ban_message(event)
+                        event = await BanUtilBanEvent.get(message_id=message.id)
                     else:
-                        await self.update_crossban_message(event)
-                    await message.remove_reaction('📨', self.bot.user)
-
-                elif payload.emoji.name == '🔄' and event.banned and ban_perms:
+                        event = await BanUtilCrossbanEvent.get(message_id=message.id).prefetch_related('event')
+                except DoesNotExist:
+                    self.tracked_messages.pop(message.id, None)
+                    await message.clear_reactions()
+                    return
 
-                    if is_ban_event:
-                        ban_event = event
-                    else:
-                        ban_event = event.event
-                    try:
-                        await guild.unban(discord.Object(ban_event.target_id), reason=f'BanUtils action by {user.id}')
-                    except discord.HTTPException as e:
-                        if e.code == 10026:
-                            pass
-                        else:
-                            raise e
-                    event.banned = False
-                    await event.save()
-                    await message.remove_reaction('🔄', self.bot.user)
-                    await message.add_reaction('🔨')
-                    if is_ban_event:
-                        await self.update_ban_message(event)
-                    else:
-                        await self.update_crossban_message(event)
-                
-                elif payload.emoji.name == '🔨' and not event.banned and ban_perms:
+                action = event_actions[payload.emoji.name]
+                permissions = await self.event_permissions(guild, user, channel.permissions_for(user))
+                if not permissions[action]:
+                    return
 
-                    if is_ban_event:
-                        ban_event = event
-                    else:
-                        ban_event = event.event
-                    await guild.ban(discord.Object(ban_event.target_id), reason=f'BanUtils action by {user.id}')
-                    event.banned = True
-                    await event.save()
-                    await message.remove_reaction('🔨', self.bot.user)
-                    await message.add_reaction('🔄')
-                    if is_ban_event:
-                        await self.update_ban_message(event)
-                    else:
-                        await self.update_crossban_message(event)
-                
-                elif payload.emoji.name == '❌' and delete_perms:
+                if action == 'report':
+                    await message.add_reaction('📨')
+                if not await self.apply_event_action(guild, event, is_ban_event, action, user.id):
+                    return
 
-                    await event.delete()
-                    await message.clear_reactions()
-                    event.id = None
-                    if is_ban_event:
-                        await self.update_ban_message(event)
-                    else:
-                        await self.update_crossban_message(event)
-                
+                # the message moves over to buttons on its first action
+                await message.clear_reactions()
+                if is_ban_event:
+                    await self.update_ban_message(event)
                 else:
-                    return
-            
-                await message.remove_reaction(payload.emoji, user)
+                    await self.update_crossban_message(event)
         except Exception as e:
             await self.utils.log_background_error(guild, e)
         
@@ -504,13 +1265,9 @@ class BanUtils(BaseModule):
             await self.utils.respond(ctx, ResponseLevel.general_error, "That's you!")
             return
 
-        try:
-            await BanUtilSubscription.get(from_guild_id=ctx.guild.id, to_guild_id=target_guild_id)
-        except DoesNotExist:
-            try:
-                await BanUtilInvite.get(from_guild_id=ctx.guild.id, to_guild_id=target_guild_id)
-            except DoesNotExist:
-                if await BanUtilBlock.filter(blocked_id=ctx.guild.id).exists():
+        if not self.federation.is_subscribed(ctx.guild.id, target_guild_id):
+            if not self.federation.is_invited(ctx.guild.id, target_guild_id):
+                if self.federation.is_blocked(target_guild_id, ctx.guild.id):
                     await self.utils.respond(ctx, ResponseLevel.forbidden, 'You are blocked from inviting this guild')
                 else:
 
@@ -521,18 +1278,13 @@ class BanUtils(BaseModule):
                         target_channel = target_guild.get_channel(foreign_settings.foreign_log_channel)
                         if target_channel != None:
 
-                            new_message = await target_channel.send(embed=discord.Embed(
-                                color=discord.Color.green(),
-                                title=f'Invite from {ctx.guild.name} ({ctx.guild.id})',
-                                description='\n'.join([
-                                    'Accept with ✅',
-                                    'Block guild with ⏹️',
-                                    'Disable alerts with ⛔'
-                                ])
-                            ))
-                            await new_message.add_reaction('✅')
-                            await new_message.add_reaction('⏹️')
-                            await new_message.add_reaction('⛔')
+                            new_message = await target_channel.send(
+                                embed=discord.Embed(
+                                    color=discord.Color.green(),
+                                    title=f'Invite from {ctx.guild.name} ({ctx.guild.id})'
+                                ),
+                                view=invite_controls(ctx.guild.id)
+                            )
                             message_id = new_message.id
                             
                     await BanUtilInvite.create(
@@ -540,6 +1292,9 @@ class BanUtils(BaseModule):
                         to_guild_id=target_guild_id,
                         message_id=message_id
                     )
+                    self.federation.add_invite(ctx.guild.id, target_guild_id)
+                    if message_id != None:
+                        self.tracked_messages[message_id] = TrackedMessage.invite
                     
                     await self.utils.respond(ctx, ResponseLevel.success)
             else:
@@ -551,26 +1306,18 @@ class BanUtils(BaseModule):
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_subscribe(self, ctx: commands.Context, source_guild_id: int):
 
-        try:
-            await BanUtilSubscription.get(
-                from_guild_id=source_guild_id,
-                to_guild_id=ctx.guild.id
-            )
-        except DoesNotExist:
-            try:
-                invite = await BanUtilInvite.get(
-                    from_guild_id=source_guild_id,
-                    to_guild_id=ctx.guild.id
-                )
-            except DoesNotExist:
+        if not self.federation.is_subscribed(source_guild_id, ctx.guild.id):
+            if not self.federation.is_invited(source_guild_id, ctx.guild.id):
                 await self.utils.respond(ctx, ResponseLevel.forbidden, 'That guild has not invited this guild')
             else:
 
-                await invite.delete()
+                await self.delete_invites(source_guild_id, ctx.guild.id)
+                self.federation.remove_invite(source_guild_id, ctx.guild.id)
                 await BanUtilSubscription.create(
                     from_guild_id=source_guild_id,
                     to_guild_id=ctx.guild.id
                 )
+                self.federation.add_subscription(source_guild_id, ctx.guild.id)
                 await self.utils.respond(ctx, ResponseLevel.success)
 
                 module_settings: BanUtilSettings = await BanUtilSettings.get(guild_id=ctx.guild.id)
@@ -594,40 +1341,28 @@ class BanUtils(BaseModule):
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_unsubscribe(self, ctx: commands.Context, source_guild_id: int):
 
-        try:
-            subscription = await BanUtilSubscription.get(
-                from_guild_id=source_guild_id,
-                to_guild_id=ctx.guild.id
-            )
-        except DoesNotExist:
+        if not self.federation.is_subscribed(source_guild_id, ctx.guild.id):
             await self.utils.respond(ctx, ResponseLevel.general_error, f'Not subscribed to guild {source_guild_id}')
         else:
-            await subscription.delete()
+            await BanUtilSubscription.filter(from_guild_id=source_guild_id, to_guild_id=ctx.guild.id).delete()
+            self.federation.remove_subscription(source_guild_id, ctx.guild.id)
             await self.utils.respond(ctx, ResponseLevel.success)
     
     @commands.command('bu.kick')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_kick(self, ctx: commands.Context, target_guild_id: int):
 
-        try:
-            subscription = await BanUtilSubscription.get(
-                from_guild_id=ctx.guild.id,
-                to_guild_id=target_guild_id
-            )
-        except DoesNotExist:
-            try:
-                invite = await BanUtilInvite.get(
-                    from_guild_id=ctx.guild.id,
-                    to_guild_id=target_guild_id
-                )
-            except DoesNotExist:
+        if not self.federation.is_subscribed(ctx.guild.id, target_guild_id):
+            if not self.federation.is_invited(ctx.guild.id, target_guild_id):
                 await self.utils.respond(ctx, ResponseLevel.general_error, 'Guild not subscribed or invited')
             else:
-                await invite.delete()
+                await self.delete_invites(ctx.guild.id, target_guild_id)
+                self.federation.remove_invite(ctx.guild.id, target_guild_id)
                 await self.utils.respond(ctx, ResponseLevel.success)
 
         else:
-            await subscription.delete()
+            await BanUtilSubscription.filter(from_guild_id=ctx.guild.id, to_guild_id=target_guild_id).delete()
+            self.federation.remove_subscription(ctx.guild.id, target_guild_id)
             await self.utils.respond(ctx, ResponseLevel.success)
 
             foreign_settings = await BanUtilSettings.get(guild_id=target_guild_id)
@@ -654,39 +1389,32 @@ class BanUtils(BaseModule):
         await BanUtilSettings.filter(guild_id=ctx.guild.id).update(domestic_log_channel=log_channel.id)
         await self.utils.respond(ctx, ResponseLevel.success)
     
+    def describe_guild(self, guild_id: int):
+
+        guild = self.bot.get_guild(guild_id)
+        if guild == None:
+            return guild_id
+        return f'{guild.name} ({guild.id})'
+
     @commands.command('bu.subscribers')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_subscribers(self, ctx: commands.Context):
 
-        subscribers: List[BanUtilSubscription] = await BanUtilSubscription.filter(from_guild_id=ctx.guild.id).prefetch_related('to_guild').all()
+        subscribers = sorted(self.federation.subscribers.get(ctx.guild.id, ()))
         if len(subscribers) == 0:
             await self.utils.respond(ctx, ResponseLevel.success, 'No subscribers')
         else:
-            entries = []
-            for subscriber in subscribers:
-                guild = self.bot.get_guild(subscriber.to_guild.id)
-                if guild == None:
-                    entries.append(subscriber.to_guild.id)
-                else:
-                    entries.append(f'{guild.name} ({guild.id})')
-            await self.utils.list_items(ctx, entries)
+            await self.utils.list_items(ctx, [self.describe_guild(guild_id) for guild_id in subscribers])
     
     @commands.command('bu.subscriptions')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_subscriptions(self, ctx: commands.Context):
 
-        subscriptions: List[BanUtilSubscription] = await BanUtilSubscription.filter(to_guild=ctx.guild.id).prefetch_related('from_guild').all()
+        subscriptions = sorted(self.federation.subscriptions.get(ctx.guild.id, ()))
         if len(subscriptions) == 0:
             await self.utils.respond(ctx, ResponseLevel.success, 'No subscriptions')
         else:
-            entries = []
-            for subscriber in subscriptions:
-                guild = self.bot.get_guild(subscriber.from_guild.id)
-                if guild == None:
-                    entries.append(subscriber.from_guild.id)
-                else:
-                    entries.append(f'{guild.name} ({guild.id})')
-            await self.utils.list_items(ctx, entries)
+            await self.utils.list_items(ctx, [self.describe_guild(guild_id) for guild_id in subscriptions])
     
     @commands.command('bu.block')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
@@ -697,16 +1425,12 @@ class BanUtils(BaseModule):
             await self.utils.respond(ctx, ResponseLevel.general_error, f'Guild with id {target_guild_id} not found')
             return
 
-        try:
-            block = await BanUtilBlock.get(
-                guild_id=ctx.guild.id,
-                blocked_id=target_guild_id
-            )
-        except DoesNotExist:
+        if not self.federation.is_blocked(ctx.guild.id, target_guild_id):
             await BanUtilBlock.create(
                 guild_id=ctx.guild.id,
                 blocked_id=target_guild_id
             )
+            self.federation.add_block(ctx.guild.id, target_guild_id)
             await self.utils.respond(ctx, ResponseLevel.success)
         else:
             await self.utils.respond(ctx, ResponseLevel.general_error, 'Guild already blocked')
@@ -720,33 +1444,22 @@ class BanUtils(BaseModule):
             await self.utils.respond(ctx, ResponseLevel.general_error, f'Guild with id {target_guild_id} not found')
             return
 
-        try:
-            block = await BanUtilBlock.get(
-                guild_id=ctx.guild.id,
-                blocked_id=target_guild_id
-            )
-        except DoesNotExist:
+        if not self.federation.is_blocked(ctx.guild.id, target_guild_id):
             await self.utils.respond(ctx, ResponseLevel.general_error, 'Guild not blocked')
         else:
-            await block.delete()
+            await BanUtilBlock.filter(guild_id=ctx.guild.id, blocked_id=target_guild_id).delete()
+            self.federation.remove_block(ctx.guild.id, target_guild_id)
             await self.utils.respond(ctx, ResponseLevel.success)
 
     @commands.command('bu.blocked')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def bu_blocks(self, ctx: commands.Context):
 
-        blocks: List[BanUtilBlock] = await BanUtilBlock.filter(guild_id=ctx.guild.id).prefetch_related('blocked').all()
+        blocks = sorted(self.federation.blocks.get(ctx.guild.id, ()))
         if len(blocks) == 0:
             await self.utils.respond(ctx, ResponseLevel.success, 'No blocks')
         else:
-            entries = []
-            for block_entry in blocks:
-                guild = self.bot.get_guild(block_entry.blocked.id)
-                if guild == None:
-                    entries.append(block_entry.blocked.id)
-                else:
-                    entries.append(f'{guild.name} ({guild.id})')
-            await self.utils.list_items(ctx, entries)
+            await self.utils.list_items(ctx, [self.describe_guild(guild_id) for guild_id in blocks])
 
     @commands.command('bu.alerts')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
@@ -765,6 +1478,24 @@ class BanUtils(BaseModule):
             await module_settings.save(update_fields=['receive_invite_alerts'])
             await self.utils.respond(ctx, ResponseLevel.success)
     
+    @commands.command('bu.join_action')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def bu_join_action(self, ctx: commands.Context, new_value: Optional[str] = None):
+
+        module_settings = await BanUtilSettings.get(guild_id=ctx.guild.id)
+        if new_value == None:
+            await self.utils.respond(ctx, ResponseLevel.success, JoinAction(module_settings.join_action).name)
+        else:
+            try:
+                join_action = JoinAction[new_value.lower()]
+            except KeyError:
+                await self.utils.respond(ctx, ResponseLevel.general_error,
+                                         f'Expected one of {commas([action.name for action in JoinAction])}')
+                return
+            module_settings.join_action = join_action.value
+            await module_settings.save(update_fields=['join_action'])
+            await self.utils.respond(ctx, ResponseLevel.success)
+    
     async def massban_loop(self):
 
         await self.initialized.wait()
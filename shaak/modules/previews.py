@@ -16,18 +16,18 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import re
-from typing import Optional
+from typing import Optional, Set, Tuple
 
 import discord
 from discord.ext         import commands
-from tortoise.exceptions import DoesNotExist
 
 from shaak.base_module import BaseModule
 from shaak.checks      import has_privlidged_role_check
 from shaak.consts      import ModuleInfo, ResponseLevel
 from shaak.errors      import InvalidId
-from shaak.helpers     import MentionType, mention2id, id2mention, pluralize, commas
-from shaak.models      import PreviewSettings, PreviewFilter, Guild
+from shaak.helpers     import (MentionType, mention2id, id2mention, pluralize, commas,
+                               bulk_insert_missing, bulk_delete_present)
+from shaak.models      import PreviewSettings, PreviewFilter
 
 message_link_regex = re.compile(r'https://(?:\w+\.)?discord(?:app)?.com/channels/\d+/\d+/\d+')
 
@@ -132,9 +132,7 @@ class Previews(BaseModule):
         elif err == 6:
             await self.utils.respond(ctx, ResponseLevel.general_error, 'Message not found')
     
-    @commands.command('pv.add')
-    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
-    async def pv_add(self, ctx: commands.Context, *channels: str):
+    def parse_channels(self, channels: Tuple[str]) -> Tuple[Set[int], int]:
 
         channel_ids = set()
         malformed = 0
@@ -148,17 +146,21 @@ class Previews(BaseModule):
                     malformed += 1
                     continue
             channel_ids.add(channel_id)
+        return channel_ids, malformed
 
-        additions = 0
-        duplicates = 0
-        for channel_id in channel_ids:
-            try:
-                await PreviewFilter.get(guild_id=ctx.guild.id, channel_id=channel_id)
-            except DoesNotExist:
-                await PreviewFilter.create(guild_id=ctx.guild.id, channel_id=channel_id)
-                additions += 1
-            else:
-                duplicates += 1
+    async def get_filtered_channels(self, guild_id: int, channel_ids: Set[int]) -> Set[int]:
+
+        return set(await PreviewFilter.filter(guild_id=guild_id, channel_id__in=list(channel_ids)).values_list('channel_id', flat=True))
+
+    @commands.command('pv.add')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def pv_add(self, ctx: commands.Context, *channels: str):
+
+        channel_ids, malformed = self.parse_channels(channels)
+        existing = await self.get_filtered_channels(ctx.guild.id, channel_ids)
+        added, skipped = await bulk_insert_missing(PreviewFilter, 'channel_id', channel_ids, existing, guild_id=ctx.guild.id)
+        additions = len(added)
+        duplicates = len(skipped)
         
         if duplicates or malformed:
             message_parts = []
@@ -176,30 +178,11 @@ class Previews(BaseModule):
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def pv_remove(self, ctx: commands.Context, *channels: str):
 
-        channel_ids = set()
-        malformed = 0
-        for channel_reference in channels:
-            try:
-                channel_id = int(channel_reference)
-            except ValueError:
-                try:
-                    channel_id = mention2id(channel_reference, MentionType.channel)
-                except InvalidId:
-                    malformed += 1
-                    continue
-            channel_ids.add(channel_id)
-        
-        db_guild = await Guild.get(id=ctx.guild.id)
-
-        deletions = 0
-        nonexistant = 0
-        for channel_id in channel_ids:
-            try:
-                await PreviewFilter.filter(guild=db_guild, channel_id=channel_id).delete()
-            except DoesNotExist:
-                nonexistant += 1
-            else:
-                deletions += 1
+        channel_ids, malformed = self.parse_channels(channels)
+        existing = await self.get_filtered_channels(ctx.guild.id, channel_ids)
+        removed, missing = await bulk_delete_present(PreviewFilter, 'channel_id', channel_ids, existing, guild_id=ctx.guild.id)
+        deletions = len(removed)
+        nonexistant = len(missing)
         
         if nonexistant or malformed:
             message_parts = []
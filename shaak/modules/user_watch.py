@@ -16,17 +16,17 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import time
-from typing import Dict, Set, Optional
+from typing import Dict, Set, Optional, Tuple
 
 import discord
 from discord.ext import commands
-from tortoise.exceptions import DoesNotExist
 
 from shaak.base_module import BaseModule
 from shaak.consts      import ModuleInfo, ResponseLevel, MentionType
 from shaak.checks      import has_privlidged_role_check
 from shaak.errors      import InvalidId
-from shaak.helpers     import get_or_create, time_ms, link_to_message, mention2id, id2mention, pluralize, commas
+from shaak.helpers     import (get_or_create, time_ms, link_to_message, mention2id, id2mention, pluralize, commas,
+                               bulk_insert_missing, bulk_delete_present)
 from shaak.models      import UserWatchSettings, UserWatchWatch
 
 class UserWatch(BaseModule):
@@ -56,6 +56,12 @@ class UserWatch(BaseModule):
             self.user_watch_cache[watch.guild_id].add(watch.user_id)
 
         await super().initialize()
+
+    async def reload_guild(self, guild_id: int):
+
+        self.user_watch_cache[guild_id] = set(await UserWatchWatch.filter(guild_id=guild_id).values_list('user_id', flat=True))
+        self.last_report_time[guild_id] = {}
+        self.watch_cooldown_cache.pop(guild_id, None)
     
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
@@ -155,31 +161,35 @@ class UserWatch(BaseModule):
             module_settings: UserWatchSettings = await UserWatchSettings.filter(guild_id=ctx.guild.id).only('cooldown_time').get()
             await self.utils.respond(ctx, ResponseLevel.success, f'{module_settings.cooldown_time}ms')
     
+    def parse_users(self, target_users: Tuple[str]) -> Tuple[Set[int], int]:
+
+        target_ids = set()
+        invalid_ids = 0
+        for target_user in target_users:
+            try:
+                target_ids.add(mention2id(target_user, MentionType.user))
+            except InvalidId:
+                invalid_ids += 1
+        return target_ids, invalid_ids
+
     @commands.command(name='uw.watch')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def uw_watch(self, ctx: commands.Context, *target_users: str):
 
         if len(target_users) == 0:
             await self.utils.respond(ctx, ResponseLevel.success, "You're not giving me much to work with here")
+            return
 
-        invalid_ids = 0
-        duplicates = 0
-        additions = 0
+        watched = get_or_create(self.user_watch_cache, ctx.guild.id, set())
+        report_times = get_or_create(self.last_report_time, ctx.guild.id, {})
 
-        for target_user in target_users:
-            try:
-                target_id = mention2id(target_user, MentionType.user)
-            except InvalidId:
-                invalid_ids += 1
-                continue
-
-            if target_id in get_or_create(self.user_watch_cache, ctx.guild.id, set()):
-                duplicates += 1
-            else:
-                await UserWatchWatch.create(guild_id=ctx.guild.id, user_id=target_id)
-                self.user_watch_cache[ctx.guild.id].add(target_id)
-                self.last_report_time[ctx.guild.id][target_id] = 0
-                additions += 1
+        target_ids, invalid_ids = self.parse_users(target_users)
+        added, skipped = await bulk_insert_missing(UserWatchWatch, 'user_id', target_ids, watched, guild_id=ctx.guild.id)
+        watched.update(added)
+        for target_id in added:
+            report_times[target_id] = 0
+        additions = len(added)
+        duplicates = len(skipped)
         
         message_parts = []
         if additions:
@@ -201,26 +211,18 @@ class UserWatch(BaseModule):
 
         if len(target_users) == 0:
             await self.utils.respond(ctx, ResponseLevel.success, 'Cmon man')
+            return
 
-        invalid_ids = 0
-        not_found = 0
-        removals = 0
+        watched = get_or_create(self.user_watch_cache, ctx.guild.id, set())
+        report_times = get_or_create(self.last_report_time, ctx.guild.id, {})
 
-        for target_user in target_users:
-            try:
-                target_id = mention2id(target_user, MentionType.user)
-            except InvalidId:
-                invalid_ids += 1
-
-            await UserWatchWatch.filter(guild_id=ctx.guild.id, user_id=target_id).delete()
-            try:
-                self.user_watch_cache[ctx.guild.id].remove(target_id)
-            except KeyError:
-                not_found += 1
-            else:
-                if target_id in self.last_report_time[ctx.guild.id]:
-                    del self.last_report_time[ctx.guild.id][target_id]
-                removals += 1
+        target_ids, invalid_ids = self.parse_users(target_users)
+        removed, missing = await bulk_delete_present(UserWatchWatch, 'user_id', target_ids, watched, guild_id=ctx.guild.id)
+        watched.difference_update(removed)
+        for target_id in removed:
+            report_times.pop(target_id, None)
+        removals = len(removed)
+        not_found = len(missing)
         
         message_parts = []
         if removals:
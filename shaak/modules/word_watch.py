@@ -16,31 +16,47 @@ along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import asyncio
+import codecs
+import itertools
 import time
 import logging
 import io
-import string
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple, Set
-
+import string
+import tempfile
+from pathlib import Path
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Set
+
+import aiohttp
 import discord
+import humanize
 from discord.errors import HTTPException
 from discord.ext import commands
 from tortoise.exceptions import DoesNotExist
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
 
 from shaak.base_module import BaseModule
 from shaak.checks import has_privlidged_role_check, is_owner_check
 from shaak.consts import MatchType, ModuleInfo, watch_setting_map
+from shaak.errors import InvalidId, ScansDropped
 from shaak.helpers import (MentionType, between_segments, bool2str, commas,
                            get_int_ranges, getrange_s, id2mention,
                            link_to_message, mention2id, pluralize,
                            resolve_mention, possesivize, str2bool,
-                           DiscardingQueue, RollingStats)
-from shaak.matcher import pattern_preprocess, text_preprocess, word_matches, find_all_contains
+                           get_or_create, bulk_insert_missing, bulk_delete_present,
+                           chunks, duration_parse, DiscardingQueue, RollingStats,
+                           BoundedTextBuffer, FairQueue, escape_formatting)
+from shaak.matcher import compile_pattern, find_matches, find_matches_batch, pattern_registry
+from shaak.scan_workers import ScanPool, ScanWorkerDied, test_pattern
 from shaak.models import (WordWatchSettings, WordWatchPingGroup, WordWatchPing,
-                          WordWatchWatch, WordWatchIgnore, Guild)
-from shaak.settings import product_settings
+                          WordWatchWatch, WordWatchIgnore, WordWatchHit, WordWatchSharedList,
+                          WordWatchListWatch, WordWatchSubscription, WordWatchListExclusion, WordWatchScope,
+                          Guild)
+from shaak.settings import app_settings, product_settings
 from shaak.utils import ResponseLevel
 
 logger = logging.getLogger('shaak_word_watch')
@@ -56,11 +72,106 @@ class WatchCacheEntry:
     match_type:  int
     pattern:     str
     ban:         int
+    distance:    int = 0
 
     def __hash__(self):
         return self.id
 
 
+# a subscription to a shared list. the list supplies patterns, the subscriber its own actions
+@dataclass
+class SubscriptionCacheEntry:
+
+    id:          int
+    list_id:     int
+    auto_delete: bool
+    ban:         Optional[int]
+    group_id:    Optional[int]
+    excluded:    Set[str]
+
+
+# stands in for a WordWatchWatch when a shared list matches
+@dataclass(frozen=True)
+class SharedWatchMatch:
+
+    id:      int
+    list_id: int
+    pattern: str
+    group:   Optional[WordWatchPingGroup]
+
+
+backscan_concurrency  = 2
+backscan_batch_size   = 100
+backscan_report_limit = 7 * 1024**2
+bulk_delete_max_age   = timedelta(days=14)
+
+# attachment bodies are streamed through the matcher a chunk at a time, never held whole
+attachment_chunk_size    = 64 * 1024
+attachment_concurrency   = 4  # downloads at once, over every guild
+attachment_timeout       = 30
+attachment_size_max      = 8 * 1024  # kilobytes
+attachment_overlap_min   = 64
+attachment_overlap_max   = 1024  # regexes can be any length, longer matches across chunks are missed
+attachment_snippet_chars = 80
+attachment_text_suffixes = {'.txt', '.md', '.log', '.csv'}
+
+recent_buffer_chars = 256 * 1024  # per guild
+recent_text_limit   = 512
+test_sample_count   = 5
+test_timeout        = 10  # seconds, the test runs in a process that is killed past this
+
+# scans are queued per guild and served fairly by a shared set of workers. a guild
+# whose queue is full gets shed scans instead: only watches that delete or ban, no log.
+# shed scans have a much deeper queue and workers of their own, and only messages past
+# that are dropped, which is reported to the guild's error channel
+scan_workers     = 4
+scan_queue_depth = 50
+scan_quantum     = 100  # watch entries a guild may scan per turn
+shed_workers     = 2
+shed_queue_depth = 1000
+drop_report_interval = 300  # seconds between dropped scan reports to a guild
+
+store_retry_delay = 60  # seconds between attempts at a failed pattern store rebuild
+
+# hits are written behind in batches so a raid doesn't turn into one insert per match
+hit_flush_size     = 200
+hit_flush_interval = 10
+hit_buffer_limit   = 10000
+
+
+@dataclass
+class BackscanState:
+
+    channel_ids: List[int]
+    after:       datetime
+    delete:      bool
+    scan_bots:   bool
+    report_to:   int
+    progress:    Dict[int, int] = field(default_factory=dict)  # channel id -> last scanned message id
+    finished:    Set[int]       = field(default_factory=set)
+    scanned:     int            = 0
+    hits:        int            = 0
+    deleted:     int            = 0
+    patterns:    Counter        = field(default_factory=Counter)
+    channels:    Counter        = field(default_factory=Counter)
+    report_size: int            = 0
+    task:        Optional[asyncio.Task] = None
+    stopping:    bool           = False  # set by ww.backscan stop, any other cancel is a shutdown
+
+    def __post_init__(self):
+        # spills to disk past a megabyte so long scans don't grow the heap
+        self.report = tempfile.SpooledTemporaryFile(1024**2, mode='w+', encoding='utf8')
+        self.write_report('timestamp\tchannel_id\tmessage_id\tauthor_id\tdeleted\tpatterns')
+
+    def write_report(self, line: str):
+        if self.report_size < backscan_report_limit:
+            self.report.write(line + '\n')
+            self.report_size += len(line) + 1
+
+    def is_running(self) -> bool:
+        return self.task != None and not self.task.done()
+
+
 class WordWatch(BaseModule):
 
     meta = ModuleInfo(
@@ -74,14 +185,36 @@ class WordWatch(BaseModule):
 
         self.watch_cache:  Dict[int, List[WatchCacheEntry]] = {}
         self.ignore_cache: Dict[int, Set[int]] = {}
+        self.shared_lists: Dict[int, List[WatchCacheEntry]] = {}
+        self.scope_cache:  Dict[int, Dict[int, Set[int]]] = {}  # guild id -> watch id -> channel, category and role ids
+        self.scoped_entries: Dict[int, Tuple[List[WatchCacheEntry], Dict[int, List[WatchCacheEntry]]]] = {}
+        self.subscriptions: Dict[int, List[SubscriptionCacheEntry]] = {}
+        self.backscans:    Dict[int, BackscanState] = {}
+        self.recent:       Dict[int, BoundedTextBuffer] = {}
+        self.attachment_tasks: Set[asyncio.Task] = set()
+        self.attachment_downloads = asyncio.Semaphore(attachment_concurrency)
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.pending_hits: List[WordWatchHit] = []
+        self.hit_flush_lock = asyncio.Lock()
+        self.hit_flusher: Optional[asyncio.Task] = None
+        self.scan_queue = FairQueue(scan_queue_depth, scan_quantum)
+        self.scan_tasks: List[asyncio.Task] = []
+        self.shed = RollingStats()
+        self.dropped = RollingStats()
+        self.shed_queue = FairQueue(shed_queue_depth, scan_quantum)
+        self.drop_reports: Dict[int, float] = {}  # guild id -> when dropped scans were last reported
+        self.scan_pool: Optional[ScanPool] = None
+        self.dirty_guilds: Set[int] = set()
+        self.store_task: Optional[asyncio.Task] = None
+        self.store_dirty = False
         self.scans = RollingStats()
         self.hits = RollingStats()
         self.bot.add_on_error_hooks(self.after_invoke_hook)
 
     async def add_to_cache(self, watch: WordWatchWatch) -> None:
 
-        if watch.guild.id not in self.watch_cache:
-            self.watch_cache[watch.guild.id] = []
+        if watch.guild_id not in self.watch_cache:
+            self.watch_cache[watch.guild_id] = []
 
         cache_entry = WatchCacheEntry(
             id=watch.id,
@@ -90,32 +223,214 @@ class WordWatch(BaseModule):
             auto_delete=watch.auto_delete,
             match_type=watch.match_type,
             pattern=watch.pattern,
-            ban=watch.ban
+            ban=watch.ban,
+            distance=watch.distance or 0
         )
 
+        if watch.match_type not in [match_type.value for match_type in MatchType]:
+            logger.error(
+                f'bad watch cache entry with id {watch.id}: {watch.match_type} is not a valid match type. this should never happen!')
+            return
+
         try:
-            if watch.match_type == MatchType.word.value:
-                cache_entry.compiled = pattern_preprocess(watch.pattern)
-            elif watch.match_type == MatchType.contains.value:
-                pass
-            elif watch.match_type == MatchType.regex.value:
-                cache_entry.compiled = re.compile(
-                    watch.pattern, re.IGNORECASE if watch.ignore_case else 0)
-            else:
-                logger.error(
-                    f'bad watch cache entry with id {watch.id}: {watch.match_type} is not a valid match type. this should never happen!')
-                return
+            cache_entry.compiled = pattern_registry.acquire(watch.pattern, watch.match_type, watch.ignore_case,
+                                                            cache_entry.distance)
         except Exception:
             # if preprocessing fails, remove it from the database. if we don't do this,
             # invalid entries will be added to startup and cause modules to never fully load
             await watch.delete()
             return
 
-        self.watch_cache[watch.guild.id].append(cache_entry)
+        self.watch_cache[watch.guild_id].append(cache_entry)
+        self.watches_changed(watch.guild_id)
         return
 
+    def remove_from_cache(self, guild_id: int, watch_ids: Set[int]) -> None:
+
+        if guild_id in self.watch_cache:
+            kept = []
+            for entry in self.watch_cache[guild_id]:
+                if entry.id in watch_ids:
+                    pattern_registry.release(entry.pattern, entry.match_type, entry.ignore_case, entry.distance)
+                else:
+                    kept.append(entry)
+            self.watch_cache[guild_id] = kept
+            self.watches_changed(guild_id)
+
+    def shared_entry(self, watch: WordWatchListWatch) -> Optional[WatchCacheEntry]:
+
+        try:
+            compiled = pattern_registry.acquire(watch.pattern, watch.match_type, watch.ignore_case)
+        except Exception:
+            logger.error(f'bad shared list watch with id {watch.id}')
+            return None
+        return WatchCacheEntry(
+            id=watch.id,
+            compiled=compiled,
+            ignore_case=watch.ignore_case,
+            auto_delete=False,
+            match_type=watch.match_type,
+            pattern=watch.pattern,
+            ban=None
+        )
+
+    def unload_shared_list(self, list_id: int) -> None:
+
+        for entry in self.shared_lists.pop(list_id, []):
+            pattern_registry.release(entry.pattern, entry.match_type, entry.ignore_case, entry.distance)
+
+    async def load_shared_list(self, list_id: int) -> None:
+
+        # subscribers all read this one list, so an update is seen by every one of them at once
+        entries = []
+        for watch in await WordWatchListWatch.filter(list_id=list_id).order_by('id').all():
+            entry = self.shared_entry(watch)
+            if entry != None:
+                entries.append(entry)
+        self.unload_shared_list(list_id)
+        self.shared_lists[list_id] = entries
+
+    def subscription_entry(self, subscription: WordWatchSubscription) -> SubscriptionCacheEntry:
+
+        return SubscriptionCacheEntry(
+            id=subscription.id,
+            list_id=subscription.list_id,
+            auto_delete=subscription.auto_delete,
+            ban=subscription.ban,
+            group_id=subscription.group_id,
+            excluded=set(exclusion.pattern for exclusion in subscription.exclusions)
+        )
+
+    async def load_subscriptions(self, guild_id: int) -> None:
+
+        self.subscriptions[guild_id] = [
+            self.subscription_entry(subscription) for subscription in
+            await WordWatchSubscription.filter(guild_id=guild_id).prefetch_related('exclusions').all()
+        ]
+
+    def clear_cache(self, guild_id: int, forget: bool = False) -> None:
+
+        for entry in self.watch_cache.get(guild_id, []):
+            pattern_registry.release(entry.pattern, entry.match_type, entry.ignore_case, entry.distance)
+        if forget:
+            self.watch_cache.pop(guild_id, None)
+            self.scope_cache.pop(guild_id, None)
+        else:
+            self.watch_cache[guild_id] = []
+            self.scope_cache[guild_id] = {}
+        self.watches_changed(guild_id)
+
+    def guild_scopes(self, guild_id: int) -> Tuple[List[WatchCacheEntry], Dict[int, List[WatchCacheEntry]]]:
+
+        # built lazily after every change: the watches that apply everywhere, and for each
+        # channel, category and role the watches scoped to it
+        if guild_id not in self.scoped_entries:
+            scopes = self.scope_cache.get(guild_id, {})
+            unscoped = []
+            by_target = {}
+            for entry in self.watch_cache.get(guild_id, []):
+                if entry.id in scopes and scopes[entry.id]:
+                    for target_id in scopes[entry.id]:
+                        get_or_create(by_target, target_id, []).append(entry)
+                else:
+                    unscoped.append(entry)
+            self.scoped_entries[guild_id] = (unscoped, by_target)
+        return self.scoped_entries[guild_id]
+
+    def entries_for(self, message: discord.Message) -> List[WatchCacheEntry]:
+
+        if not self.scope_cache.get(message.guild.id):
+            return self.watch_cache[message.guild.id]
+
+        unscoped, by_target = self.guild_scopes(message.guild.id)
+        targets = [
+            message.channel.id,
+            getattr(message.channel, 'parent_id', None),  # threads follow their channel's scopes
+            getattr(message.channel, 'category_id', None)
+        ]
+        if isinstance(message.author, discord.Member):
+            targets.extend(role.id for role in message.author.roles)
+
+        entries = list(unscoped)
+        seen = set()
+        for target_id in targets:
+            for entry in by_target.get(target_id, ()):
+                if entry.id not in seen:
+                    seen.add(entry.id)
+                    entries.append(entry)
+        return entries
+
+    def watches_changed(self, guild_id: int):
+
+        self.scoped_entries.pop(guild_id, None)
+
+        # changes are coalesced and each dirty guild is sent whole to its worker once per loop iteration
+        if self.scan_pool == None:
+            return
+        if not self.dirty_guilds:
+            asyncio.get_running_loop().call_soon(self.sync_scan_workers)
+        self.dirty_guilds.add(guild_id)
+
+    def sync_scan_workers(self):
+
+        if self.scan_pool.store_path != None:
+            self.store_dirty = True
+            if self.store_task == None or self.store_task.done():
+                self.store_task = asyncio.create_task(self.rebuild_pattern_store())
+            if self.scan_pool.store_ready:
+                self.dirty_guilds.clear()
+                return
+
+        # until a store has loaded everywhere, workers match with their own per-guild copies
+        for guild_id in self.dirty_guilds:
+            if guild_id in self.watch_cache:
+                self.scan_pool.update_guild(guild_id, [
+                    (entry.id, entry.pattern, entry.match_type, entry.ignore_case, entry.auto_delete, entry.ban,
+                     entry.distance)
+                    for entry in self.watch_cache[guild_id]
+                ])
+            else:
+                self.scan_pool.remove_guild(guild_id)
+        self.dirty_guilds.clear()
+
+    async def rebuild_pattern_store(self):
+
+        # the store holds every guild, so any change rebuilds it whole. changes made
+        # during a rebuild are picked up by another pass, and a failed rebuild is retried
+        while self.store_dirty:
+            self.store_dirty = False
+            records = [
+                (guild_id, entry.id, entry.pattern, entry.match_type, entry.ignore_case, entry.auto_delete, entry.ban,
+                 entry.distance)
+                for guild_id, entries in self.watch_cache.items()
+                for entry in entries
+            ]
+            try:
+                loaded = await self.scan_pool.rebuild_store(records)
+                if not loaded:
+                    logger.error('scan workers failed to load the pattern store')
+            except Exception:
+                logger.exception('failed to rebuild the pattern store')
+                loaded = False
+            if not loaded:
+                self.store_dirty = True
+                await asyncio.sleep(store_retry_delay)
+
+    async def pool_matches(self, guild_id: int, content: str, entries: List[WatchCacheEntry], shed: bool) -> List[Tuple[WatchCacheEntry, int, int]]:
+
+        try:
+            hits = await self.scan_pool.scan(guild_id, content, shed)
+        except ScanWorkerDied:
+            return find_matches(entries, content)
+        by_id = {entry.id: entry for entry in entries}
+        return [(by_id[watch_id], start, end) for watch_id, start, end in hits if watch_id in by_id]
+
     async def initialize(self):
 
+        if app_settings.scan_workers > 0:
+            self.scan_pool = ScanPool(app_settings.scan_workers,
+                                      Path(app_settings.pattern_store) if app_settings.pattern_store else None)
+
         for guild in self.bot.guilds:
             self.watch_cache[guild.id] = []
             self.ignore_cache[guild.id] = set()
@@ -123,6 +438,17 @@ class WordWatch(BaseModule):
         for watch in await WordWatchWatch.all().prefetch_related('guild', 'group'):
             await self.add_to_cache(watch)
 
+        for guild_id, watch_id, target_id in await WordWatchScope.all().values_list('watch__guild_id', 'watch_id', 'target_id'):
+            get_or_create(get_or_create(self.scope_cache, guild_id, {}), watch_id, set()).add(target_id)
+
+        for watch in await WordWatchListWatch.all().order_by('id'):
+            entry = self.shared_entry(watch)
+            if entry != None:
+                get_or_create(self.shared_lists, watch.list_id, []).append(entry)
+
+        for subscription in await WordWatchSubscription.all().prefetch_related('exclusions'):
+            get_or_create(self.subscriptions, subscription.guild_id, []).append(self.subscription_entry(subscription))
+
         for ignore in await WordWatchIgnore.all().prefetch_related('guild'):
             if ignore.guild.id in self.ignore_cache:
                 self.ignore_cache[ignore.guild.id].add(ignore.target_id)
@@ -130,8 +456,89 @@ class WordWatch(BaseModule):
                 logger.warn(f'orphaned ignore entry with id {ignore.id}')
                 await ignore.delete()
 
+        self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=attachment_timeout))
+        self.hit_flusher = asyncio.create_task(self.hit_flush_loop())
+        self.scan_tasks = [asyncio.create_task(self.scan_worker(self.scan_queue)) for _ in range(scan_workers)]
+        self.scan_tasks += [asyncio.create_task(self.scan_worker(self.shed_queue, shed=True)) for _ in range(shed_workers)]
+
         await super().initialize()
 
+    async def scan_worker(self, scan_queue: FairQueue, shed: bool = False):
+
+        while True:
+            _, message = await scan_queue.get()
+            try:
+                await asyncio.wait_for(self.scan_message(message, shed), timeout=60)
+            except asyncio.TimeoutError:
+                logger.warn(f'{"shed " if shed else ""}message scan for {message.jump_url} timed out')
+            except Exception:
+                logger.exception(f'message scan for {message.jump_url} failed')
+
+    async def enqueue_scan(self, message: discord.Message):
+
+        if message.guild is None:
+            return
+
+        cost = len(self.watch_cache.get(message.guild.id, ())) + 1
+        if self.scan_queue.put(message.guild.id, message, cost):
+            return
+
+        if self.shed_queue.put(message.guild.id, message, cost):
+            self.shed.record()
+            return
+
+        self.dropped.record()
+        now = time.monotonic()
+        if now - self.drop_reports.get(message.guild.id, -drop_report_interval) >= drop_report_interval:
+            self.drop_reports[message.guild.id] = now
+            await self.utils.log_background_error(message.guild, ScansDropped(
+                f'Word watch is {shed_queue_depth} messages behind in this server, new messages are not being scanned'))
+
+    async def hit_flush_loop(self):
+
+        while True:
+            await asyncio.sleep(hit_flush_interval)
+            await self.flush_hits()
+
+    async def flush_hits(self):
+
+        async with self.hit_flush_lock:
+            if not self.pending_hits:
+                return
+            batch, self.pending_hits = self.pending_hits, []
+            try:
+                await WordWatchHit.bulk_create(batch)
+            except Exception:
+                logger.exception(f'dropping {len(batch)} word watch hits')
+
+    def queue_hits(self, hits: List[WordWatchHit]):
+
+        self.pending_hits.extend(hits)
+        if len(self.pending_hits) > hit_buffer_limit:
+            logger.warn('hit buffer full, discarding oldest hits')
+            del self.pending_hits[:len(self.pending_hits) - hit_buffer_limit]
+        if len(self.pending_hits) >= hit_flush_size and not self.hit_flush_lock.locked():
+            asyncio.create_task(self.flush_hits())
+
+    async def reload_guild(self, guild_id: int):
+
+        self.clear_cache(guild_id)
+        for watch in await WordWatchWatch.filter(guild_id=guild_id).order_by('id').all():
+            await self.add_to_cache(watch)
+
+        self.ignore_cache[guild_id] = set(await WordWatchIgnore.filter(guild_id=guild_id).values_list('target_id', flat=True))
+
+        await self.load_subscriptions(guild_id)
+        await self.load_scopes(guild_id)
+
+    async def load_scopes(self, guild_id: int):
+
+        scopes = {}
+        for watch_id, target_id in await WordWatchScope.filter(watch__guild_id=guild_id).values_list('watch_id', 'target_id'):
+            get_or_create(scopes, watch_id, set()).add(target_id)
+        self.scope_cache[guild_id] = scopes
+        self.scoped_entries.pop(guild_id, None)
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
 
@@ -151,12 +558,20 @@ class WordWatch(BaseModule):
         await self.initialized.wait()
 
         if guild.id in self.watch_cache:
-            del self.watch_cache[guild.id]
+            self.clear_cache(guild.id, forget=True)
 
         if guild.id in self.ignore_cache:
             del self.ignore_cache[guild.id]
 
-    async def scan_message(self, message: discord.Message):
+        if guild.id in self.recent:
+            del self.recent[guild.id]
+
+        if guild.id in self.subscriptions:
+            del self.subscriptions[guild.id]
+
+        self.drop_reports.pop(guild.id, None)
+
+    async def scan_message(self, message: discord.Message, shed: bool = False):
 
         start_time = time.time()
         try:
@@ -198,187 +613,380 @@ class WordWatch(BaseModule):
                     if role.id in self.ignore_cache[message.guild.id]:
                         return
 
-            delete_message = False
-            ban_time = None
-            matches = set()
-            processed_text = None
-            text_lower = None
-            for entry in self.watch_cache[message.guild.id]:
-
-                self.scans.record()
-
-                if entry.match_type == MatchType.regex.value:
-                    found = list(entry.compiled.finditer(message.content))
-                    if found:
-                        delete_message = delete_message or entry.auto_delete
-                        if entry.ban != None:
-                            if ban_time == None:
-                                ban_time = 0
-                            ban_time = max(ban_time, entry.ban)
-                        watch = await WordWatchWatch.filter(id=entry.id).prefetch_related('group').get()
-                        for match in found:
-                            matches.add((
-                                watch, match.start(0), match.end(0)
-                            ))
-
-                elif entry.match_type == MatchType.word.value:
-                    if processed_text == None:
-                        processed_text = text_preprocess(message.content)
-                    found = word_matches(processed_text, entry.compiled)
-                    if found:
-                        delete_message = delete_message or entry.auto_delete
-                        if entry.ban != None:
-                            if ban_time == None:
-                                ban_time = 0
-                            ban_time = max(ban_time, entry.ban)
-                        watch = await WordWatchWatch.filter(id=entry.id).prefetch_related('group').get()
-                        for match in found:
-                            matches.add((
-                                watch, match[0], match[1]
-                            ))
-
-                elif entry.match_type == MatchType.contains.value:
-                    if entry.ignore_case and text_lower == None:
-                        text_lower = message.content.lower()
-                    found = list(find_all_contains(
-                        text_lower if entry.ignore_case else message.content, entry.pattern))
-                    if found:
-                        delete_message = delete_message or entry.auto_delete
-                        if entry.ban != None:
-                            if ban_time == None:
-                                ban_time = 0
-                            ban_time = max(ban_time, entry.ban)
-                        watch = await WordWatchWatch.filter(id=entry.id).prefetch_related('group').get()
-                        for match in found:
-                            matches.add((
-                                watch, match[0], match[1]
-                            ))
-
-            if delete_message:
-                try:
-                    await message.delete()
-                except discord.NotFound:
-                    pass  # the message may be deleted before we get to it; this shouldn't cause us to not log the message
+            if message.content:
+                if message.guild.id not in self.recent:
+                    self.recent[message.guild.id] = BoundedTextBuffer(recent_buffer_chars, recent_text_limit)
+                self.recent[message.guild.id].push(message.content, message.channel.id)
+
+            entries = self.entries_for(message)
+            if shed:
+                entries = [entry for entry in entries if entry.auto_delete or entry.ban != None]
+            self.scans.record(len(entries))
+
+            found, shared_found = await self.match_text(message.guild.id, message.content, entries, shed)
+            acted = await self.act_on_matches(message, module_settings, message.content, found, shared_found, shed)
+
+            # attachments are downloaded on their own so a slow one never holds up this scan.
+            # edits can't add attachments, so they were already scanned with the original
+            if message.attachments and message.edited_at == None and not acted:
+                handled = set(entry.id for entry, _, _ in found) | \
+                          set((subscription.list_id, entry.id) for subscription, entry, _, _ in shared_found)
+                task = asyncio.create_task(self.scan_attachments(message, entries, shed, handled))
+                self.attachment_tasks.add(task)
+                task.add_done_callback(self.attachment_tasks.discard)
+        finally:
+            end_time = time.time()
+            if end_time - start_time >= 1:
+                logger.warn(
+                    f'message scan took {round(end_time-start_time, 3)} seconds!')
 
-            if ban_time != None and not message.author.bot:
-                try:
-                    await message.author.ban(delete_message_days=ban_time)
-                except discord.NotFound:
-                    pass  # user could already be banned
+    async def match_text(self, guild_id: int, text: str, entries: List[WatchCacheEntry],
+                         shed: bool) -> Tuple[List[Tuple[WatchCacheEntry, int, int]], List[Tuple[SubscriptionCacheEntry, WatchCacheEntry, int, int]]]:
 
-            if matches:
-                self.hits.record()
+        if self.scan_pool != None:
+            found = await self.pool_matches(guild_id, text, entries, shed)
+        else:
+            found = find_matches(entries, text)
 
-                if module_settings == None:
-                    try:
-                        module_settings = await WordWatchSettings.get(guild_id=message.guild.id)
-                    except DoesNotExist:
-                        return
-                if module_settings.log_channel == None:
-                    return
+        shared_found = []
+        for subscription in self.subscriptions.get(guild_id, []):
+            if shed and not subscription.auto_delete and subscription.ban == None:
+                continue
+            for entry, match_start, match_end in find_matches(self.shared_lists.get(subscription.list_id, []), text):
+                if entry.pattern not in subscription.excluded:
+                    shared_found.append((subscription, entry, match_start, match_end))
+        return found, shared_found
+
+    async def act_on_matches(self, message: discord.Message, module_settings: Optional[WordWatchSettings], text: str,
+                             found: List[Tuple[WatchCacheEntry, int, int]],
+                             shared_found: List[Tuple[SubscriptionCacheEntry, WatchCacheEntry, int, int]],
+                             shed: bool, attachment: Optional[str] = None) -> bool:
+
+        delete_message = False
+        ban_time = None
+        matches = set()
+        watches = {}
+        for entry, match_start, match_end in found:
+            if entry.id not in watches:
+                delete_message = delete_message or entry.auto_delete
+                if entry.ban != None:
+                    if ban_time == None:
+                        ban_time = 0
+                    ban_time = max(ban_time, entry.ban)
+                watches[entry.id] = await WordWatchWatch.filter(id=entry.id).prefetch_related('group').get()
+            matches.add((
+                watches[entry.id], match_start, match_end
+            ))
+
+        groups_by_id = {}
+        for subscription, entry, match_start, match_end in shared_found:
+            key = (subscription.list_id, entry.id)
+            if key not in watches:
+                delete_message = delete_message or subscription.auto_delete
+                if subscription.ban != None:
+                    ban_time = max(ban_time or 0, subscription.ban)
+                if subscription.group_id != None and subscription.group_id not in groups_by_id:
+                    groups_by_id[subscription.group_id] = await WordWatchPingGroup.get_or_none(id=subscription.group_id)
+                watches[key] = SharedWatchMatch(entry.id, subscription.list_id, entry.pattern,
+                                                groups_by_id.get(subscription.group_id))
+            matches.add((
+                watches[key], match_start, match_end
+            ))
+
+        if delete_message:
+            try:
+                await message.delete()
+            except discord.NotFound:
+                pass  # the message may be deleted before we get to it; this shouldn't cause us to not log the message
 
-                log_channel = self.bot.get_channel(module_settings.log_channel)
-                if log_channel == None:
-                    return
+        banned = ban_time != None and not message.author.bot
+        if banned:
+            try:
+                await message.author.ban(delete_message_days=ban_time)
+            except discord.NotFound:
+                pass  # user could already be banned
+
+        if matches:
+            self.hits.record()
+
+            now = datetime.now()
+            self.queue_hits([
+                WordWatchHit(
+                    guild_id=message.guild.id,
+                    watch_id=watch.id,
+                    list_id=watch.list_id if isinstance(watch, SharedWatchMatch) else None,
+                    pattern=watch.pattern,
+                    user_id=message.author.id,
+                    channel_id=message.channel.id,
+                    message_id=message.id,
+                    timestamp=now,
+                    deleted=delete_message,
+                    banned=banned
+                )
+                for watch in watches.values()
+            ])
+
+            if not shed:
+                await self.log_matches(message, module_settings, text, matches, delete_message, attachment)
+
+        return delete_message or banned
 
-                pings = set()
-                groups = set()
-                for match in matches:
-                    if match[0].group != None and match[0].group.id not in groups:
-                        groups.add(match[0].group.id)
-                        await match[0].group.fetch_related('pings')
-                        for ping in match[0].group.pings:
-                            pings.add(id2mention(
-                                ping.target_id, ping.ping_type))
-
-                deduped_patterns = set([o[0].pattern for o in matches])
-                pattern_list = commas([str(i) for i in deduped_patterns])
-                pattern_list_code = commas(
-                    [f"`{i}`" for i in deduped_patterns])
-
-                ranges = get_int_ranges(set(
-                    (index for range_ in
-                     (range(match[1], match[2]+1) for match in matches)
-                     for index in range_)
-                ))  # p y t h o n i c
-
-                message_embed = discord.Embed(
+    async def log_matches(self, message: discord.Message, module_settings: Optional[WordWatchSettings], text: str,
+                          matches: Set[Tuple[Any, int, int]], delete_message: bool, attachment: Optional[str]):
+
+        if module_settings == None:
+            try:
+                module_settings = await WordWatchSettings.get(guild_id=message.guild.id)
+            except DoesNotExist:
+                return
+        if module_settings.log_channel == None:
+            return
+
+        log_channel = self.bot.get_channel(module_settings.log_channel)
+        if log_channel == None:
+            return
+
+        pings = set()
+        groups = set()
+        for match in matches:
+            if match[0].group != None and match[0].group.id not in groups:
+                groups.add(match[0].group.id)
+                await match[0].group.fetch_related('pings')
+                for ping in match[0].group.pings:
+                    pings.add(id2mention(
+                        ping.target_id, ping.ping_type))
+
+        deduped_patterns = set([o[0].pattern for o in matches])
+        pattern_list = commas([str(i) for i in deduped_patterns])
+        pattern_list_code = commas(
+            [f"`{i}`" for i in deduped_patterns])
+
+        ranges = get_int_ranges(set(
+            (index for range_ in
+             (range(match[1], match[2]+1) for match in matches)
+             for index in range_)
+        ))  # p y t h o n i c
+
+        message_embed = discord.Embed(
+            color=discord.Color(0xd22513),
+            description='\n'.join([
+                between_segments(text, ranges).replace(
+                    '](', ']\\('),
+                f'[Jump to message]({link_to_message(message)})'
+            ]),
+            timestamp=message.created_at
+        )
+        message_embed.set_author(
+            name=f'{message.author.name}#{message.author.discriminator} triggered {pattern_list} in #{message.channel.name}',
+            icon_url=message.author.display_avatar.url
+        )
+        if message.guild.icon:
+            message_embed.set_footer(
+                text=f'User ID: {message.author.id}', icon_url=message.guild.icon.url)
+        else:
+            message_embed.set_footer(
+                text=f'User ID: {message.author.id}')
+        message_embed.add_field(name='User', value=id2mention(
+            message.author.id, MentionType.user), inline=True)
+        message_embed.add_field(name='Channel', value=id2mention(
+            message.channel.id, MentionType.channel), inline=True)
+        message_embed.add_field(name='Deleted', value=bool2str(
+            delete_message, 'Yes', 'No'), inline=True)
+        if attachment != None:
+            message_embed.add_field(name='Attachment', value=escape_formatting(attachment), inline=True)
+        message_embed.add_field(name='Pattern' + pluralize("", "s", len(pattern_list_code)),
+                                value=pattern_list_code, inline=False)
+
+        content = module_settings.header
+        if content:
+            template = string.Template(content)
+            content = template.safe_substitute(
+                patterns=pattern_list_code,
+                channel=message.channel.name,
+                channel_reference=id2mention(
+                    message.channel.id, MentionType.channel),
+                user=f'{message.author.name}#{message.author.discriminator}',
+                user_ping=id2mention(
+                    message.author.id, MentionType.user),
+                user_id=message.author.id
+            )
+        else:
+            content = ''
+        if pings:
+            if content:
+                content += ' '
+            content += ''.join(pings)
+            if len(content) > 2000:
+                content = content[len(content)-2000:]
+
+        try:
+            await log_channel.send(content=content, embed=message_embed)
+        except HTTPException as e:
+            if e.code == 50035:  # embed too long
+                logger.warn(
+                    f'fallback embed raw: {message_embed.to_dict()}')
+                # fallback
+                fallback_embed = discord.Embed(
                     color=discord.Color(0xd22513),
-                    description='\n'.join([
-                        between_segments(message.content, ranges).replace(
-                            '](', ']\\('),
-                        f'[Jump to message]({link_to_message(message)})'
-                    ]),
-                    timestamp=message.created_at
+                    description=f'[Jump to message]({link_to_message(message)})'
                 )
-                message_embed.set_author(
-                    name=f'{message.author.name}#{message.author.discriminator} triggered {pattern_list} in #{message.channel.name}',
+                fallback_embed.set_author(
+                    name=f'{message.author.name}#{message.author.discriminator} triggered Word Watch in #{message.channel.name}',
                     icon_url=message.author.display_avatar.url
                 )
-                if message.guild.icon:
-                    message_embed.set_footer(
-                        text=f'User ID: {message.author.id}', icon_url=message.guild.icon.url)
-                else:
-                    message_embed.set_footer(
-                        text=f'User ID: {message.author.id}')
-                message_embed.add_field(name='User', value=id2mention(
-                    message.author.id, MentionType.user), inline=True)
-                message_embed.add_field(name='Channel', value=id2mention(
-                    message.channel.id, MentionType.channel), inline=True)
-                message_embed.add_field(name='Deleted', value=bool2str(
-                    delete_message, 'Yes', 'No'), inline=True)
-                message_embed.add_field(name='Pattern' + pluralize("", "s", len(pattern_list_code)),
-                                        value=pattern_list_code, inline=False)
-
-                content = module_settings.header
-                if content:
-                    template = string.Template(content)
-                    content = template.safe_substitute(
-                        patterns=pattern_list_code,
-                        channel=message.channel.name,
-                        channel_reference=id2mention(
-                            message.channel.id, MentionType.channel),
-                        user=f'{message.author.name}#{message.author.discriminator}',
-                        user_ping=id2mention(
-                            message.author.id, MentionType.user),
-                        user_id=message.author.id
-                    )
+                fallback_embed.set_footer(
+                    text=f'Fallback embed • Ping {product_settings.author_name}!')
+                await log_channel.send(content=content, embed=fallback_embed)
+
+    def is_text_attachment(self, attachment: discord.Attachment) -> bool:
+
+        if (attachment.content_type or '').startswith('text/'):
+            return True
+        return Path(attachment.filename).suffix.lower() in attachment_text_suffixes
+
+    async def read_attachment(self, attachment: discord.Attachment, limit: int) -> AsyncIterator[str]:
+
+        # decoded incrementally, so a character split between two chunks comes out whole
+        decoder = codecs.getincrementaldecoder('utf8')(errors='replace')
+        read = 0
+        async with self.http_session.get(attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(attachment_chunk_size):
+                chunk = chunk[:limit - read]
+                read += len(chunk)
+                yield decoder.decode(chunk)
+                if read >= limit:
+                    break
+        yield decoder.decode(b'', final=True)
+
+    async def scan_attachment_body(self, message: discord.Message, attachment: discord.Attachment, entries: List[WatchCacheEntry],
+                                   limit: int, on_window: Callable[[str, list, list], None]):
+
+        # consecutive windows share `overlap` characters on each side of their boundary. a window
+        # only keeps matches ending in its own stretch, so nothing is reported twice, and those
+        # are far enough from either edge that word boundaries on both sides can be seen
+        overlap = attachment_overlap_min
+        for entry in itertools.chain(entries, *(self.shared_lists.get(subscription.list_id, [])
+                                                for subscription in self.subscriptions.get(message.guild.id, []))):
+            if entry.match_type != MatchType.regex.value:
+                overlap = max(overlap, len(entry.pattern) + entry.distance + 1)
+        overlap = min(overlap, attachment_overlap_max)
+
+        async def scan_window(window: str, accept_from: int, accept_to: int):
+            found, shared_found = await self.match_text(message.guild.id, window, entries, False)
+            on_window(window,
+                      [hit for hit in found if accept_from < hit[2] <= accept_to],
+                      [hit for hit in shared_found if accept_from < hit[3] <= accept_to])
+
+        carry = ''
+        accept_from = -1
+        async with self.attachment_downloads:
+            async for text in self.read_attachment(attachment, limit):
+                window = carry + text
+                accept_to = len(window) - overlap
+                if accept_to <= accept_from:
+                    carry = window
+                    continue
+                await scan_window(window, accept_from, accept_to)
+                cut = max(0, accept_to - overlap)
+                carry = window[cut:]
+                accept_from = accept_to - cut
+        if len(carry) > accept_from:
+            await scan_window(carry, accept_from, len(carry))
+
+    async def scan_attachment(self, message: discord.Message, attachment: discord.Attachment,
+                              entries: List[WatchCacheEntry], shed: bool, limit: int) -> Tuple[str, list, list]:
+
+        # the log shows the file name followed by a snippet around the first hit of each watch
+        text = attachment.filename
+        found, shared_found = await self.match_text(message.guild.id, text, entries, shed)
+        seen = set(entry.id for entry, _, _ in found) | set((subscription.list_id, entry.id) for subscription, entry, _, _ in shared_found)
+
+        def on_window(window: str, window_found: list, window_shared: list):
+            nonlocal text
+            for hit in window_found + window_shared:
+                key = hit[0].id if len(hit) == 3 else (hit[0].list_id, hit[1].id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                match_start, match_end = hit[-2], min(hit[-1], hit[-2] + attachment_snippet_chars)
+                snippet_start = max(0, match_start - attachment_snippet_chars // 2)
+                snippet = window[snippet_start:match_end + attachment_snippet_chars // 2].replace('\n', ' ')
+                offset = len(text) + 1 - snippet_start
+                text += '\n' + snippet
+                if len(hit) == 3:
+                    found.append((hit[0], match_start + offset, match_end + offset))
                 else:
-                    content = ''
-                if pings:
-                    if content:
-                        content += ' '
-                    content += ''.join(pings)
-                    if len(content) > 2000:
-                        content = content[len(content)-2000:]
+                    shared_found.append((hit[0], hit[1], match_start + offset, match_end + offset))
 
-                try:
-                    await log_channel.send(content=content, embed=message_embed)
-                except HTTPException as e:
-                    if e.code == 50035:  # embed too long
-                        logger.warn(
-                            f'fallback embed raw: {message_embed.to_dict()}')
-                        # fallback
-                        fallback_embed = discord.Embed(
-                            color=discord.Color(0xd22513),
-                            description=f'[Jump to message]({link_to_message(message)})'
-                        )
-                        fallback_embed.set_author(
-                            name=f'{message.author.name}#{message.author.discriminator} triggered Word Watch in #{message.channel.name}',
-                            icon_url=message.author.display_avatar.url
-                        )
-                        fallback_embed.set_footer(
-                            text=f'Fallback embed • Ping {product_settings.author_name}!')
-                        await log_channel.send(content=content, embed=fallback_embed)
-        finally:
-            end_time = time.time()
-            if end_time - start_time >= 1:
-                logger.warn(
-                    f'message scan took {round(end_time-start_time, 3)} seconds!')
+        if not shed and limit and attachment.size <= limit and self.is_text_attachment(attachment):
+            try:
+                await asyncio.wait_for(self.scan_attachment_body(message, attachment, entries, limit, on_window),
+                                       timeout=attachment_timeout)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                logger.warn(f'failed to scan attachment {attachment.url}: {e!r}')
+
+        return text, found, shared_found
+
+    async def scan_attachments(self, message: discord.Message, entries: List[WatchCacheEntry], shed: bool,
+                               handled: Set[Any]):
+
+        # every attachment's hits are acted on together, once per message, leaving out
+        # watches the content already matched. `handled` holds their watch and list keys
+        try:
+            module_settings = await WordWatchSettings.get_or_none(guild_id=message.guild.id)
+            limit = module_settings.attachment_size if module_settings != None else None
+            results = await asyncio.gather(*(
+                self.scan_attachment(message, attachment, entries, shed, (limit or 0) * 1024)
+                for attachment in message.attachments
+            ))
+
+            text = ''
+            found, shared_found = [], []
+            names = []
+            for attachment, (attachment_text, attachment_found, attachment_shared) in zip(message.attachments, results):
+                attachment_found = [hit for hit in attachment_found if hit[0].id not in handled]
+                attachment_shared = [hit for hit in attachment_shared if (hit[0].list_id, hit[1].id) not in handled]
+                if not attachment_found and not attachment_shared:
+                    continue
+                handled.update(hit[0].id for hit in attachment_found)
+                handled.update((hit[0].list_id, hit[1].id) for hit in attachment_shared)
+                offset = len(text) + 1 if text else 0
+                text = text + '\n' + attachment_text if text else attachment_text
+                found += [(entry, start + offset, end + offset) for entry, start, end in attachment_found]
+                shared_found += [(subscription, entry, start + offset, end + offset)
+                                 for subscription, entry, start, end in attachment_shared]
+                names.append(attachment.filename)
+
+            if names:
+                await self.act_on_matches(message, None, text, found, shared_found, shed, ', '.join(names))
+        except Exception:
+            logger.exception(f'attachment scan for {message.jump_url} failed')
 
     async def close(self):
 
-        pass
+        for state in self.backscans.values():
+            if state.is_running():
+                state.task.cancel()
+
+        for task in self.scan_tasks:
+            task.cancel()
+
+        for task in list(self.attachment_tasks):
+            task.cancel()
+
+        if self.http_session != None:
+            await self.http_session.close()
+
+        if self.hit_flusher != None:
+            self.hit_flusher.cancel()
+
+        if self.store_task != None:
+            self.store_task.cancel()
+
+        if self.scan_pool != None:
+            await asyncio.get_running_loop().run_in_executor(None, self.scan_pool.close)
+        await self.flush_hits()
 
     def cog_unload(self):
 
@@ -402,19 +1010,13 @@ class WordWatch(BaseModule):
 
         guild_prefix = await self.bot.command_prefix(self.bot, message)
         if not message.content.startswith(guild_prefix):
-            try:
-                await asyncio.wait_for(self.scan_message(message), timeout=60)
-            except TimeoutError:
-                logger.warn(f'message scan for {message.jump_url} timed out')
+            await self.enqueue_scan(message)
 
     @commands.Cog.listener()
     async def on_message_edit(self, old: discord.Message, new: discord.Message):
 
         if old.content != new.content:
-            try:
-                await asyncio.wait_for(self.scan_message(new), timeout=60)
-            except TimeoutError:
-                logger.warn(f'message scan for {new.jump_url} timed out')
+            await self.enqueue_scan(new)
 
     @commands.Cog.listener()
     async def on_thread_join(self, thread: discord.Thread):
@@ -423,13 +1025,7 @@ class WordWatch(BaseModule):
         if thread.me is None:
             await thread.join()
 
-    @commands.command(name='ww.watch')
-    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
-    async def ww_watch(self, ctx: commands.Context, watch_settings: str, *patterns: str):
-
-        if len(patterns) == 0:
-            await self.utils.respond(ctx, ResponseLevel.general_error, 'Please specify some patterns')
-            return
+    async def parse_watch_settings(self, ctx: commands.Context, watch_settings: str, require_type: bool = True) -> Optional[Dict[str, Any]]:
 
         split_settings = [i.split('.')
                           for i in watch_settings.replace(' ', '').split(',')]
@@ -438,10 +1034,11 @@ class WordWatch(BaseModule):
             'cased': False,
             'type': None,
             'ping': None,
-            'ban': None
+            'ban': None,
+            'dist': None
         }
         for setting in split_settings:
-            if len(setting) == 0:
+            if len(setting) == 0 or setting == ['']:
                 continue
             elif len(setting) == 1:
                 raw_settings[setting[0]] = True
@@ -449,44 +1046,84 @@ class WordWatch(BaseModule):
                 raw_settings[setting[0]] = setting[1]
             else:
                 await self.utils.respond(ctx, ResponseLevel.general_error, f'Malformed setting {".".join(setting)}')
-                return
-        if raw_settings['type'] == None:
+                return None
+        if raw_settings['type'] == None and require_type:
             await self.utils.respond(ctx, ResponseLevel.general_error, "Didn't specify a pattern type")
-            return
+            return None
 
         parsed_settings = {}
         for setting_name in raw_settings:
+            if setting_name == 'type' and raw_settings['type'] == None:
+                parsed_settings['type'] = None
+                continue
             if setting_name not in watch_setting_map:
                 await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid setting name {setting_name}')
-                return
+                return None
             try:
                 parsed_settings[setting_name] = watch_setting_map[setting_name](
                     raw_settings[setting_name])
             except (ValueError, IndexError, AttributeError):
                 await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid setting {setting_name}.{raw_settings[setting_name]}')
-                return
-
-        if not parsed_settings['cased']:
-            patterns = [i.lower() for i in patterns]
+                return None
 
         if parsed_settings['type'] == MatchType.word and parsed_settings['cased']:
             await self.utils.respond(ctx, ResponseLevel.general_error, 'Match type `word` cannot be case sensitive')
+            return None
+        if parsed_settings['type'] == MatchType.fuzzy:
+            if parsed_settings['cased']:
+                await self.utils.respond(ctx, ResponseLevel.general_error, 'Match type `fuzzy` cannot be case sensitive')
+                return None
+            if parsed_settings['dist'] == None:
+                parsed_settings['dist'] = 1
+        elif parsed_settings['dist'] != None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, '`dist` only applies to match type `fuzzy`')
+            return None
+
+        return parsed_settings
+
+    async def get_ping_group(self, ctx: commands.Context, name: Optional[str]) -> Tuple[bool, Optional[WordWatchPingGroup]]:
+
+        if not name:
+            return True, None
+        try:
+            return True, await WordWatchPingGroup.get(guild_id=ctx.guild.id, name=name)
+        except DoesNotExist:
+            if str2bool(name) == False:
+                return True, None
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid ping group {name}')
+            return False, None
+
+    @commands.command(name='ww.watch')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_watch(self, ctx: commands.Context, watch_settings: str, *patterns: str):
+
+        if len(patterns) == 0:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Please specify some patterns')
             return
 
-        if parsed_settings['ping']:
-            try:
-                group = await WordWatchPingGroup.get(
-                    guild_id=ctx.guild.id,
-                    name=parsed_settings['ping']
-                )
-            except DoesNotExist:
-                if str2bool(parsed_settings['ping']) == False:
-                    group = None
-                else:
-                    await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid ping group {parsed_settings["ping"]}')
-                    return
-        else:
-            group = None
+        parsed_settings = await self.parse_watch_settings(ctx, watch_settings)
+        if parsed_settings == None:
+            return
+
+        if not parsed_settings['cased']:
+            patterns = [i.lower() for i in patterns]
+
+        if parsed_settings['type'] == MatchType.fuzzy:
+            # a watch that fails to compile is dropped from the database when cached
+            too_short = []
+            for pattern in patterns:
+                try:
+                    compile_pattern(pattern, MatchType.fuzzy.value, True, parsed_settings['dist'])
+                except ValueError:
+                    too_short.append(pattern)
+            if too_short:
+                await self.utils.respond(ctx, ResponseLevel.general_error,
+                                         f'Fuzzy patterns must be longer than their distance: {commas(too_short)}')
+                return
+
+        found, group = await self.get_ping_group(ctx, parsed_settings['ping'])
+        if not found:
+            return
 
         duplicates = 0
         updates = 0
@@ -506,7 +1143,8 @@ class WordWatch(BaseModule):
                     group=group,
                     auto_delete=parsed_settings['del'],
                     ignore_case=not parsed_settings['cased'],
-                    ban=parsed_settings['ban']
+                    ban=parsed_settings['ban'],
+                    distance=parsed_settings['dist']
                 )
                 await self.add_to_cache(added)
                 additions += 1
@@ -532,12 +1170,12 @@ class WordWatch(BaseModule):
                 if existing.ban != parsed_settings['ban']:
                     existing.ban = parsed_settings['ban']
                     something_changed = True
+                if existing.distance != parsed_settings['dist']:
+                    existing.distance = parsed_settings['dist']
+                    something_changed = True
                 if something_changed:
                     await existing.save()
-                    for index, word in enumerate(self.watch_cache[ctx.guild.id]):
-                        if word.id == existing.id:
-                            del self.watch_cache[ctx.guild.id][index]
-                            break
+                    self.remove_from_cache(ctx.guild.id, {existing.id})
                     await self.add_to_cache(existing)
                     updates += 1
                 else:
@@ -576,13 +1214,17 @@ class WordWatch(BaseModule):
                 field_name += 'contains'
             elif watch.match_type == MatchType.regex.value:
                 field_name += 'regex'
+            elif watch.match_type == MatchType.fuzzy.value:
+                field_name += f'fuzzy (dist {item.distance})'
             else:
                 field_name += 'unknown'
+            scopes = self.scope_cache.get(ctx.guild.id, {}).get(item.id)
             name_extras = [i for i in (
                 'Autodelete' if watch.auto_delete else None,
                 None if watch.ignore_case else 'Cased',
                 None if watch.group == None else f'Pings `{watch.group.name}`',
-                f'Ban ({item.ban})' if item.ban != None else None
+                f'Ban ({item.ban})' if item.ban != None else None,
+                f'Scoped to {len(scopes)} target{pluralize("", "s", len(scopes))}' if scopes else None
             ) if i != None]
             if name_extras:
                 field_name += ' - ' + ', '.join(name_extras)
@@ -593,6 +1235,96 @@ class WordWatch(BaseModule):
             )
         return embed
 
+    @commands.command(name='ww.test')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_test(self, ctx: commands.Context, watch_settings: str, *, pattern: str):
+
+        parsed_settings = await self.parse_watch_settings(ctx, watch_settings)
+        if parsed_settings == None:
+            return
+
+        if not parsed_settings['cased']:
+            pattern = pattern.lower()
+
+        # only text from channels the invoker can read themselves
+        texts = []
+        for channel_id, text in self.recent[ctx.guild.id].snapshot() if ctx.guild.id in self.recent else []:
+            channel = ctx.guild.get_channel_or_thread(channel_id)
+            if channel != None and channel.permissions_for(ctx.author).read_messages:
+                texts.append(text)
+        if not texts:
+            await self.utils.respond(ctx, ResponseLevel.general_error, "I haven't seen any messages here yet")
+            return
+
+        spec = (0, pattern, parsed_settings['type'].value, not parsed_settings['cased'], False, None,
+                parsed_settings['dist'] or 0)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, test_pattern, spec, texts, test_sample_count, test_timeout)
+        except ScanWorkerDied:
+            await self.utils.respond(ctx, ResponseLevel.internal_error, 'Pattern test failed')
+            return
+        except re.error as e:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid regex: {e}')
+            return
+        except ValueError as e:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid pattern: {e}')
+            return
+        if result == None:
+            await self.utils.respond(ctx, ResponseLevel.general_error,
+                                     f'Pattern took longer than {test_timeout} seconds to test, it is too expensive to watch')
+            return
+        hits, samples = result
+
+        lines = [f'Would have matched {hits} of the last {len(texts)} message{pluralize("", "s", len(texts))}']
+        for text, spans in samples:
+            ranges = get_int_ranges(set(
+                index for start, end in spans for index in range(start, end+1)
+            ))
+            lines.append('> ' + between_segments(text, ranges).replace('](', ']\\(').replace('\n', ' '))
+        await self.utils.respond(ctx, ResponseLevel.success, '\n'.join(lines))
+
+    @commands.command(name='ww.hits')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_hits(self, ctx: commands.Context, since: str = '7d'):
+
+        seconds = duration_parse(since)
+        if seconds == None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid duration {since}')
+            return
+
+        await self.flush_hits()
+        hits = WordWatchHit.filter(guild_id=ctx.guild.id, timestamp__gte=datetime.now() - timedelta(seconds=seconds))
+        total = await hits.count()
+        if total == 0:
+            await self.utils.respond(ctx, ResponseLevel.success, f'No hits in the last {since}')
+            return
+
+        patterns = await hits.annotate(count=Count('id')).group_by('pattern', 'list_id').order_by('-count').limit(10).values(
+            'pattern', 'list_id', 'count')
+        list_ids = set(row['list_id'] for row in patterns if row['list_id'] != None)
+        list_names = dict(await WordWatchSharedList.filter(id__in=list_ids).values_list('id', 'name')) if list_ids else {}
+        users = await hits.annotate(count=Count('id')).group_by('user_id').order_by('-count').limit(5).values('user_id', 'count')
+
+        embed = discord.Embed(
+            title=f'{total} hit{pluralize("", "s", total)} in the last {since}'
+        )
+        embed.add_field(
+            name='Top patterns',
+            value='\n'.join(
+                f'`{row["pattern"]}` ({list_names.get(row["list_id"], "deleted list")}): {row["count"]}'
+                if row['list_id'] != None else f'`{row["pattern"]}`: {row["count"]}'
+                for row in patterns
+            )[:1024],
+            inline=False
+        )
+        embed.add_field(
+            name='Top users',
+            value='\n'.join(f'{id2mention(row["user_id"], MentionType.user)}: {row["count"]}' for row in users),
+            inline=False
+        )
+        await ctx.send(embed=embed)
+
     @commands.command(name='ww.list')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def ww_list(self, ctx: commands.Context):
@@ -611,28 +1343,11 @@ class WordWatch(BaseModule):
 
         if ctx.guild.id in self.watch_cache:
             await WordWatchWatch.filter(guild_id=ctx.guild.id).delete()
-            self.watch_cache[ctx.guild.id] = []
+            self.clear_cache(ctx.guild.id)
             await self.utils.respond(ctx, ResponseLevel.success)
         else:
             await self.utils.respond(ctx, ResponseLevel.internal_error, 'I have no idea where I am')
 
-    async def remove_watch(self, ctx: commands.Context, index: int) -> bool:
-
-        try:
-            cache_entry: WatchCacheEntry = self.watch_cache[ctx.guild.id][index-1]
-        except IndexError:
-            return True
-
-        try:
-            watch = await WordWatchWatch.get(id=cache_entry.id)
-        except DoesNotExist:
-            await self.utils.respond(ctx, ResponseLevel.internal_error, f'Index {index} not mapped to a valid ID')
-            return False
-
-        await watch.delete()
-        del self.watch_cache[ctx.guild.id][index-1]
-        return False
-
     @commands.command(name='ww.remove')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def ww_remove(self, ctx: commands.Context, *terms: str):
@@ -645,14 +1360,12 @@ class WordWatch(BaseModule):
             else:
                 to_delete.add(int(term))
 
-        indices = sorted(list(to_delete))
-        errors = []
-        offset = 0
-        for index in indices:
-            if await self.remove_watch(ctx, index - offset):
-                errors.append(index)
-            else:
-                offset += 1
+        cache = self.watch_cache[ctx.guild.id]
+        errors = sorted(index for index in to_delete if not 1 <= index <= len(cache))
+        watch_ids = set(cache[index-1].id for index in to_delete if 1 <= index <= len(cache))
+        if watch_ids:
+            await WordWatchWatch.filter(guild_id=ctx.guild.id, id__in=list(watch_ids)).delete()
+            self.remove_from_cache(ctx.guild.id, watch_ids)
 
         if errors:
             await self.utils.respond(ctx, ResponseLevel.general_error,
@@ -664,19 +1377,12 @@ class WordWatch(BaseModule):
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def ww_qremove(self, ctx: commands.Context, *patterns: str):
 
-        errors = []
-        for pattern in patterns:
-
-            try:
-                watch = await WordWatchWatch.get(guild_id=ctx.guild.id, pattern=pattern)
-            except DoesNotExist:
-                errors.append(pattern)
-            else:
-                await watch.delete()
-                for index, item in enumerate(self.watch_cache[ctx.guild.id]):
-                    if item.id == watch.id:
-                        del self.watch_cache[ctx.guild.id][index]
-                        break
+        watch_ids = {entry.pattern: entry.id for entry in self.watch_cache[ctx.guild.id]}
+        errors = [pattern for pattern in patterns if pattern not in watch_ids]
+        found = set(watch_ids[pattern] for pattern in patterns if pattern in watch_ids)
+        if found:
+            await WordWatchWatch.filter(guild_id=ctx.guild.id, id__in=list(found)).delete()
+            self.remove_from_cache(ctx.guild.id, found)
 
         if errors:
             await self.utils.respond(ctx, ResponseLevel.general_error,
@@ -684,37 +1390,93 @@ class WordWatch(BaseModule):
         else:
             await self.utils.respond(ctx, ResponseLevel.success)
 
+    @commands.command(name='ww.scope')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_scope(self, ctx: commands.Context, pattern: str, *references: str):
+
+        watch_ids = {entry.pattern: entry.id for entry in self.watch_cache[ctx.guild.id]}
+        if pattern not in watch_ids:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Pattern {pattern} not found')
+            return
+
+        resolved, errors = await self.utils.resolve_references(references, ctx.guild)
+        # only channels, categories and roles can be scoped to
+        users = [id for id, mention_type in resolved.items() if mention_type == MentionType.user]
+        for id in users:
+            del resolved[id]
+        if users:
+            await self.utils.respond(ctx, ResponseLevel.general_error, "Watches can't be scoped to users")
+            return
+
+        watch_id = watch_ids[pattern]
+        scopes = get_or_create(get_or_create(self.scope_cache, ctx.guild.id, {}), watch_id, set())
+        added, duplicates = await bulk_insert_missing(
+            WordWatchScope, 'target_id', resolved, scopes,
+            lambda id: {'scope_type': resolved[id]},
+            watch_id=watch_id
+        )
+        scopes.update(added)
+        self.scoped_entries.pop(ctx.guild.id, None)
+
+        if len(errors) > 0:
+            await self.utils.respond(ctx, ResponseLevel.general_error,
+                                     f'Error scoping to item{pluralize("", "s", len(errors))} {commas(getrange_s(sorted(errors)))}')
+        elif len(duplicates) > 0:
+            await self.utils.respond(ctx, ResponseLevel.success, f'Skipped {len(duplicates)} duplicates')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.unscope')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_unscope(self, ctx: commands.Context, pattern: str, *references: str):
+
+        watch_ids = {entry.pattern: entry.id for entry in self.watch_cache[ctx.guild.id]}
+        if pattern not in watch_ids:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Pattern {pattern} not found')
+            return
+
+        watch_id = watch_ids[pattern]
+        scopes = get_or_create(get_or_create(self.scope_cache, ctx.guild.id, {}), watch_id, set())
+        if len(references) == 0:
+            # no references makes the watch apply everywhere again
+            await WordWatchScope.filter(watch_id=watch_id).delete()
+            scopes.clear()
+            errors = []
+        else:
+            indices = {}
+            for index, reference in enumerate(references):
+                indices.setdefault(mention2id(reference), index+1)
+            removed, missing = await bulk_delete_present(WordWatchScope, 'target_id', indices, scopes, watch_id=watch_id)
+            scopes.difference_update(removed)
+            errors = sorted(indices[id] for id in missing)
+        self.scoped_entries.pop(ctx.guild.id, None)
+
+        if len(errors) > 0:
+            await self.utils.respond(ctx, ResponseLevel.general_error,
+                                     f'Item{pluralize("", "s", len(errors))} {commas(getrange_s(errors))} not found')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
     @commands.command(name='ww.ignore')
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def ww_ignore(self, ctx: commands.Context, *references: str):
 
-        if ctx.guild.id not in self.ignore_cache:
-            self.ignore_cache[ctx.guild.id] = set()
+        ignores = get_or_create(self.ignore_cache, ctx.guild.id, set())
 
-        errors = []
-        duplicates = 0
-        for index, reference in enumerate(references):
-            try:
-                id = int(reference)
-            except ValueError:
-                mention_type, id = resolve_mention(reference)
-            else:
-                mention_type = await self.utils.guess_id(id, ctx.guild)
-            if mention_type in [MentionType.channel, MentionType.role, MentionType.user]:
-                if id in self.ignore_cache[ctx.guild.id]:
-                    duplicates += 1
-                else:
-                    await WordWatchIgnore.create(guild_id=ctx.guild.id, target_id=id, mention_type=mention_type)
-                    self.ignore_cache[ctx.guild.id].add(id)
-            else:
-                errors.append(index+1)
+        resolved, errors = await self.utils.resolve_references(references, ctx.guild)
+        added, duplicates = await bulk_insert_missing(
+            WordWatchIgnore, 'target_id', resolved, ignores,
+            lambda id: {'mention_type': resolved[id]},
+            guild_id=ctx.guild.id
+        )
+        ignores.update(added)
 
         if len(errors) > 0:
             await self.utils.respond(ctx, ResponseLevel.general_error,
                                      f'Error ignoring item{pluralize("", "s", len(errors))} {commas(getrange_s(errors))}')
         else:
-            if duplicates > 0:
-                await self.utils.respond(ctx, ResponseLevel.success, f'Skipped {duplicates} duplicates')
+            if len(duplicates) > 0:
+                await self.utils.respond(ctx, ResponseLevel.success, f'Skipped {len(duplicates)} duplicates')
             else:
                 await self.utils.respond(ctx, ResponseLevel.success)
 
@@ -735,16 +1497,15 @@ class WordWatch(BaseModule):
     @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
     async def ww_unignore(self, ctx: commands.Context, *references: str):
 
-        errors = []
+        ignores = get_or_create(self.ignore_cache, ctx.guild.id, set())
+
+        indices = {}
         for index, reference in enumerate(references):
-            id = mention2id(reference)
-            try:
-                target_ignore = await WordWatchIgnore.get(target_id=id, guild_id=ctx.guild.id)
-            except DoesNotExist:
-                errors.append(index+1)
-            else:
-                await target_ignore.delete()
-                self.ignore_cache[ctx.guild.id].remove(id)
+            indices.setdefault(mention2id(reference), index+1)
+
+        removed, missing = await bulk_delete_present(WordWatchIgnore, 'target_id', indices, ignores, guild_id=ctx.guild.id)
+        ignores.difference_update(removed)
+        errors = sorted(indices[id] for id in missing)
 
         if len(errors) > 0:
             await self.utils.respond(ctx, ResponseLevel.general_error,
@@ -799,37 +1560,23 @@ class WordWatch(BaseModule):
         for not_allowed in string.whitespace + '.':
             if not_allowed in group_name:
                 await self.utils.respond(ctx, ResponseLevel.general_error, 'Illegal character in group name')
+                return
 
-        errors = 0
-        duplicates = 0
-        additions = 0
-        for ping in pings:
-            try:
-                id = int(ping)
-            except ValueError:
-                mention_type, id = resolve_mention(ping)
-            else:
-                mention_type = await self.utils.guess_id(id, ctx.guild)
+        resolved, errors = await self.utils.resolve_references(pings, ctx.guild)
 
-            if mention_type == None:
-                errors += 1
-            else:
-                try:
-                    group: WordWatchPingGroup = await WordWatchPingGroup.get(guild_id=ctx.guild.id, name=group_name)
-                except DoesNotExist:
-                    group: WordWatchPingGroup = await WordWatchPingGroup.create(guild_id=ctx.guild.id, name=group_name)
-                pings = await WordWatchPing.filter(group=group).all()
-                for db_ping in pings:
-                    if db_ping.target_id == id:
-                        duplicates += 1
-                        break
-                else:
-                    await WordWatchPing.create(
-                        ping_type=mention_type,
-                        target_id=id,
-                        group=group
-                    )
-                    additions += 1
+        additions = 0
+        duplicates = 0
+        if resolved:
+            group, _ = await WordWatchPingGroup.get_or_create(guild_id=ctx.guild.id, name=group_name)
+            existing = set(await WordWatchPing.filter(group=group).values_list('target_id', flat=True))
+            added, skipped = await bulk_insert_missing(
+                WordWatchPing, 'target_id', resolved, existing,
+                lambda id: {'ping_type': resolved[id]},
+                group=group
+            )
+            additions = len(added)
+            duplicates = len(skipped)
+        errors = len(errors)
 
         if duplicates or errors:
             message_parts = []
@@ -862,22 +1609,20 @@ class WordWatch(BaseModule):
             try:
                 id = int(ping)
             except ValueError:
-                _, id = resolve_mention(ping)
+                try:
+                    _, id = resolve_mention(ping)
+                except InvalidId:
+                    id = None
 
             if id == None:
                 malformed += 1
             else:
                 to_delete.add(id)
 
-        nonexistant = 0
-        deletions = 0
-
-        db_pings = await WordWatchPing.filter(group=group).all()
-        for db_ping in db_pings:
-            if db_ping.target_id in to_delete:
-                await db_ping.delete()
-                deletions += 1
-        nonexistant = len(to_delete) - deletions - malformed
+        existing = set(await WordWatchPing.filter(group=group).values_list('target_id', flat=True))
+        removed, missing = await bulk_delete_present(WordWatchPing, 'target_id', to_delete, existing, group=group)
+        deletions = len(removed)
+        nonexistant = len(missing)
 
         if nonexistant or malformed:
             message_parts = []
@@ -934,11 +1679,276 @@ class WordWatch(BaseModule):
         else:
             await self.utils.list_items(ctx, entries)
 
+    async def get_shared_list(self, ctx: commands.Context, name: str) -> Optional[WordWatchSharedList]:
+
+        shared_list = await WordWatchSharedList.get_or_none(name=name)
+        if shared_list == None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'List {name} not found')
+        return shared_list
+
+    async def get_editable_list(self, ctx: commands.Context, name: str) -> Optional[WordWatchSharedList]:
+
+        shared_list = await self.get_shared_list(ctx, name)
+        if shared_list == None:
+            return None
+        if shared_list.guild_id == None:
+            allowed = await self.bot.is_owner(ctx.author)
+        else:
+            allowed = shared_list.guild_id == ctx.guild.id
+        if not allowed:
+            await self.utils.respond(ctx, ResponseLevel.forbidden, f'List {name} belongs to someone else')
+            return None
+        return shared_list
+
+    async def get_subscription(self, ctx: commands.Context, name: str) -> Optional[WordWatchSubscription]:
+
+        shared_list = await self.get_shared_list(ctx, name)
+        if shared_list == None:
+            return None
+        subscription = await WordWatchSubscription.get_or_none(guild_id=ctx.guild.id, list_id=shared_list.id)
+        if subscription == None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Not subscribed to {name}')
+        return subscription
+
+    async def create_shared_list(self, ctx: commands.Context, name: str, guild_id: Optional[int]):
+
+        if await WordWatchSharedList.exists(name=name):
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'A list named {name} already exists')
+            return
+        shared_list = await WordWatchSharedList.create(name=name, guild_id=guild_id)
+        self.shared_lists[shared_list.id] = []
+        await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.create_list')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_create_list(self, ctx: commands.Context, name: str):
+
+        await self.create_shared_list(ctx, name, ctx.guild.id)
+
+    @commands.command(name='debug.create_list')
+    @is_owner_check()
+    async def debug_create_list(self, ctx: commands.Context, name: str):
+
+        await self.create_shared_list(ctx, name, None)
+
+    @commands.command(name='ww.delete_list')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_delete_list(self, ctx: commands.Context, name: str):
+
+        shared_list = await self.get_editable_list(ctx, name)
+        if shared_list == None:
+            return
+
+        await shared_list.delete()
+        self.unload_shared_list(shared_list.id)
+        for guild_id, subscriptions in self.subscriptions.items():
+            self.subscriptions[guild_id] = [subscription for subscription in subscriptions if subscription.list_id != shared_list.id]
+        await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.list_add')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_list_add(self, ctx: commands.Context, name: str, watch_settings: str, *patterns: str):
+
+        if len(patterns) == 0:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Please specify some patterns')
+            return
+
+        shared_list = await self.get_editable_list(ctx, name)
+        if shared_list == None:
+            return
+
+        parsed_settings = await self.parse_watch_settings(ctx, watch_settings)
+        if parsed_settings == None:
+            return
+        if parsed_settings['del'] or parsed_settings['ping'] or parsed_settings['ban'] != None:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Lists only take `type` and `cased`, subscribers choose their own actions')
+            return
+        if parsed_settings['type'] == MatchType.fuzzy:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Lists cannot hold fuzzy patterns')
+            return
+
+        if not parsed_settings['cased']:
+            patterns = [i.lower() for i in patterns]
+
+        match_type = parsed_settings['type'].value
+        errors = []
+        for pattern in patterns:
+            try:
+                compile_pattern(pattern, match_type, not parsed_settings['cased'])
+            except Exception:
+                errors.append(pattern)
+        if errors:
+            await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid pattern{pluralize("", "s", len(errors))} {commas(errors)}')
+            return
+
+        existing = set(await WordWatchListWatch.filter(list_id=shared_list.id).values_list('pattern', flat=True))
+        added, duplicates = await bulk_insert_missing(
+            WordWatchListWatch, 'pattern', patterns, existing,
+            lambda _: {'match_type': match_type, 'ignore_case': not parsed_settings['cased']},
+            list_id=shared_list.id
+        )
+        await self.load_shared_list(shared_list.id)
+
+        if duplicates:
+            await self.utils.respond(ctx, ResponseLevel.success, f'Skipped {len(duplicates)} duplicates')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.list_remove')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_list_remove(self, ctx: commands.Context, name: str, *patterns: str):
+
+        shared_list = await self.get_editable_list(ctx, name)
+        if shared_list == None:
+            return
+
+        existing = set(await WordWatchListWatch.filter(list_id=shared_list.id).values_list('pattern', flat=True))
+        removed, missing = await bulk_delete_present(WordWatchListWatch, 'pattern', patterns, existing, list_id=shared_list.id)
+        if removed:
+            await self.load_shared_list(shared_list.id)
+
+        if missing:
+            await self.utils.respond(ctx, ResponseLevel.general_error,
+                                     f'Error removing pattern{"s" if len(missing) != 1 else ""} {commas(sorted(missing))}')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.list_show')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_list_show(self, ctx: commands.Context, name: str):
+
+        shared_list = await self.get_shared_list(ctx, name)
+        if shared_list == None:
+            return
+
+        entries = self.shared_lists.get(shared_list.id, [])
+        if len(entries) == 0:
+            await self.utils.respond(ctx, ResponseLevel.success, 'No watches found')
+            return
+
+        await self.utils.list_items(ctx, [
+            f'`{entry.pattern}` ({MatchType(entry.match_type).name}{"" if entry.ignore_case else ", cased"})'
+            for entry in entries
+        ])
+
+    @commands.command(name='ww.lists')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_lists(self, ctx: commands.Context):
+
+        subscribed = set(subscription.list_id for subscription in self.subscriptions.get(ctx.guild.id, []))
+        items = []
+        for shared_list in await WordWatchSharedList.all().order_by('name'):
+            if shared_list.guild_id == None:
+                owner = 'global'
+            elif shared_list.guild_id == ctx.guild.id:
+                owner = 'yours'
+            else:
+                owner = 'shared'
+            count = len(self.shared_lists.get(shared_list.id, []))
+            items.append(f'{shared_list.name} ({owner}, {count} watch{pluralize("", "es", count)})'
+                         + (' - subscribed' if shared_list.id in subscribed else ''))
+
+        if len(items) == 0:
+            await self.utils.respond(ctx, ResponseLevel.success, 'No lists found')
+        else:
+            await self.utils.list_items(ctx, items)
+
+    @commands.command(name='ww.subscribe')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_subscribe(self, ctx: commands.Context, name: str, watch_settings: str = ''):
+
+        shared_list = await self.get_shared_list(ctx, name)
+        if shared_list == None:
+            return
+
+        parsed_settings = await self.parse_watch_settings(ctx, watch_settings, require_type=False)
+        if parsed_settings == None:
+            return
+        if parsed_settings['type'] != None or parsed_settings['cased']:
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'Subscriptions only take `del`, `ping` and `ban`')
+            return
+
+        found, group = await self.get_ping_group(ctx, parsed_settings['ping'])
+        if not found:
+            return
+
+        await WordWatchSubscription.update_or_create(
+            guild_id=ctx.guild.id,
+            list_id=shared_list.id,
+            defaults={
+                'group_id': group.id if group != None else None,
+                'auto_delete': parsed_settings['del'],
+                'ban': parsed_settings['ban']
+            }
+        )
+        await self.load_subscriptions(ctx.guild.id)
+        await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.unsubscribe')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_unsubscribe(self, ctx: commands.Context, name: str):
+
+        subscription = await self.get_subscription(ctx, name)
+        if subscription == None:
+            return
+
+        await subscription.delete()
+        await self.load_subscriptions(ctx.guild.id)
+        await self.utils.respond(ctx, ResponseLevel.success)
+
+    def normalize_exclusions(self, list_id: int, patterns: Tuple[str, ...]) -> List[str]:
+
+        # list patterns are stored lowercased unless they're cased, so an exclusion is
+        # lowercased too unless it names a cased pattern of the list as written
+        cased = set(entry.pattern for entry in self.shared_lists.get(list_id, []) if not entry.ignore_case)
+        return [pattern if pattern in cased else pattern.lower() for pattern in patterns]
+
+    @commands.command(name='ww.exclude')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_exclude(self, ctx: commands.Context, name: str, *patterns: str):
+
+        subscription = await self.get_subscription(ctx, name)
+        if subscription == None:
+            return
+
+        patterns = self.normalize_exclusions(subscription.list_id, patterns)
+        existing = set(await WordWatchListExclusion.filter(subscription_id=subscription.id).values_list('pattern', flat=True))
+        _, duplicates = await bulk_insert_missing(WordWatchListExclusion, 'pattern', patterns, existing, subscription_id=subscription.id)
+        await self.load_subscriptions(ctx.guild.id)
+
+        if duplicates:
+            await self.utils.respond(ctx, ResponseLevel.success, f'Skipped {len(duplicates)} duplicates')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
+    @commands.command(name='ww.unexclude')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_unexclude(self, ctx: commands.Context, name: str, *patterns: str):
+
+        subscription = await self.get_subscription(ctx, name)
+        if subscription == None:
+            return
+
+        existing = set(await WordWatchListExclusion.filter(subscription_id=subscription.id).values_list('pattern', flat=True))
+        # exclusions stored before they were normalised can still be removed as written
+        patterns = [pattern if pattern in existing else normalized
+                    for pattern, normalized in zip(patterns, self.normalize_exclusions(subscription.list_id, patterns))]
+        _, missing = await bulk_delete_present(WordWatchListExclusion, 'pattern', patterns, existing, subscription_id=subscription.id)
+        await self.load_subscriptions(ctx.guild.id)
+
+        if missing:
+            await self.utils.respond(ctx, ResponseLevel.general_error,
+                                     f'Error unexcluding pattern{"s" if len(missing) != 1 else ""} {commas(sorted(missing))}')
+        else:
+            await self.utils.respond(ctx, ResponseLevel.success)
+
     @commands.command(name='debug.list_cache')
     @is_owner_check()
     async def debug_list_cache(self, ctx: commands.Context, guild_id: int = None):
 
         if guild_id == None:
+            unique, references, saved = pattern_registry.stats()
+            await ctx.send(f'{references} cached watches share {unique} compiled patterns, saving about {humanize.naturalsize(saved)}')
             await self.utils.list_items(ctx, [str(i) for i in self.watch_cache])
         else:
             if guild_id in self.watch_cache:
@@ -969,33 +1979,32 @@ class WordWatch(BaseModule):
 
         await ctx.message.add_reaction('🔄')
 
-        target_guild = await Guild.get(id=target_server_id)
-
-        for watch in await WordWatchWatch.filter(group_id=source.pk).all():
-            try:
-                existing: WordWatchWatch = await WordWatchWatch.get(
+        watches = await WordWatchWatch.filter(group_id=source.pk).all()
+        # scopes go along, a scoped watch without them would act in every channel
+        scopes = await WordWatchScope.filter(watch_id__in=[watch.id for watch in watches]).values_list(
+            'watch__pattern', 'target_id', 'scope_type')
+        async with in_transaction():
+            await WordWatchWatch.filter(guild_id=target_server_id, pattern__in=[watch.pattern for watch in watches]).delete()
+            await WordWatchWatch.bulk_create([
+                WordWatchWatch(
                     guild_id=target_server_id,
-                    pattern=watch.pattern
-                ).prefetch_related('guild', 'group')
-                await existing.delete()
-                for i in self.watch_cache[target_server_id]:
-                    if i.id == existing.id:
-                        self.watch_cache[target_server_id].remove(i)
-                        break
-                else:
-                    print('???')
-            except DoesNotExist:
-                pass
-            added = await WordWatchWatch.create(
-                guild=target_guild,
-                pattern=watch.pattern,
-                match_type=watch.match_type,
-                group=dest,
-                auto_delete=watch.auto_delete,
-                ignore_case=watch.ignore_case,
-                ban=watch.ban
-            )
-            await self.add_to_cache(added)
+                    pattern=watch.pattern,
+                    match_type=watch.match_type,
+                    group_id=dest.id,
+                    auto_delete=watch.auto_delete,
+                    ignore_case=watch.ignore_case,
+                    ban=watch.ban,
+                    distance=watch.distance
+                ) for watch in watches
+            ])
+            if scopes:
+                watch_ids = dict(await WordWatchWatch.filter(
+                    guild_id=target_server_id, pattern__in=[watch.pattern for watch in watches]).values_list('pattern', 'id'))
+                await WordWatchScope.bulk_create([
+                    WordWatchScope(watch_id=watch_ids[pattern], target_id=target_id, scope_type=scope_type)
+                    for pattern, target_id, scope_type in scopes
+                ])
+        await self.reload_guild(target_server_id)
 
         await ctx.message.remove_reaction('🔄', self.bot.user)
         await self.utils.respond(ctx, ResponseLevel.success)
@@ -1013,3 +2022,260 @@ class WordWatch(BaseModule):
         else:
             module_settings: WordWatchSettings = await WordWatchSettings.get(guild_id=ctx.guild.id)
             await self.utils.respond(ctx, ResponseLevel.success, 'Yes' if module_settings.scan_bots else 'No')
+
+
+    @commands.command(name='ww.attachment_size')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_attachment_size(self, ctx: commands.Context, kilobytes: Optional[str] = None):
+
+        if kilobytes == None:
+            module_settings: WordWatchSettings = await WordWatchSettings.get(guild_id=ctx.guild.id)
+            if module_settings.attachment_size:
+                await self.utils.respond(ctx, ResponseLevel.success, f'{module_settings.attachment_size}KB')
+            else:
+                await self.utils.respond(ctx, ResponseLevel.success, 'Off')
+            return
+
+        if str2bool(kilobytes) == False:
+            size = None
+        else:
+            try:
+                size = int(kilobytes)
+            except ValueError:
+                await self.utils.respond(ctx, ResponseLevel.general_error, f'Invalid size {kilobytes}')
+                return
+            if size < 0 or size > attachment_size_max:
+                await self.utils.respond(ctx, ResponseLevel.general_error, f'Size must be between 0 and {attachment_size_max}KB')
+                return
+        await WordWatchSettings.filter(guild_id=ctx.guild.id).update(attachment_size=size or None)
+        await self.utils.respond(ctx, ResponseLevel.success)
+
+    def backscan_skipped(self, state: BackscanState, message: discord.Message) -> bool:
+
+        if message.author == self.bot.user or (message.author.bot and not state.scan_bots):
+            return True
+        ignores = self.ignore_cache.get(message.guild.id, set())
+        if message.author.id in ignores:
+            return True
+        if isinstance(message.author, discord.Member):
+            for role in message.author.roles:
+                if role.id in ignores:
+                    return True
+        return False
+
+    async def backscan_delete(self, channel: discord.abc.Messageable, messages: List[discord.Message]) -> int:
+
+        # bulk deletes only work on messages younger than two weeks
+        cutoff = discord.utils.utcnow() - bulk_delete_max_age
+        deleted = 0
+        for chunk in chunks([message for message in messages if message.created_at > cutoff], 100):
+            try:
+                await channel.delete_messages(chunk)
+                deleted += len(chunk)
+            except (discord.NotFound, discord.Forbidden):
+                pass
+        for message in messages:
+            if message.created_at <= cutoff:
+                try:
+                    await message.delete()
+                    deleted += 1
+                except (discord.NotFound, discord.Forbidden):
+                    pass
+        return deleted
+
+    async def backscan_batch(self, state: BackscanState, channel: discord.abc.Messageable, batch: List[discord.Message]):
+
+        scanned = [message for message in batch if not self.backscan_skipped(state, message)]
+        if channel.guild.id not in self.watch_cache:
+            scanned = []
+
+        # scoped watches only apply where scan_message would apply them, so messages are
+        # grouped by the entries they get and each group is matched in bulk
+        groups: Dict[Tuple[int, ...], Tuple[List[WatchCacheEntry], List[int]]] = {}
+        for index, message in enumerate(scanned):
+            entries = self.entries_for(message)
+            get_or_create(groups, tuple(map(id, entries)), (entries, []))[1].append(index)
+
+        results = [[] for _ in scanned]
+        for entries, indexes in groups.values():
+            group_results = await asyncio.get_running_loop().run_in_executor(
+                None, find_matches_batch, list(entries), [scanned[index].content for index in indexes])
+            for index, found in zip(indexes, group_results):
+                results[index] = found
+
+        to_delete = []
+        for message, found in zip(scanned, results):
+            if not found:
+                continue
+            patterns = set(entry.pattern for entry, _, _ in found)
+            delete = state.delete and any(entry.auto_delete for entry, _, _ in found)
+            if delete:
+                to_delete.append(message)
+            state.hits += 1
+            state.channels[channel.id] += 1
+            state.patterns.update(patterns)
+            state.write_report('\t'.join((message.created_at.isoformat(), str(channel.id), str(message.id),
+                                          str(message.author.id), bool2str(delete, 'yes', 'no'),
+                                          ', '.join(sorted(patterns)).replace('\t', ' ').replace('\n', ' '))))
+
+        if to_delete:
+            state.deleted += await self.backscan_delete(channel, to_delete)
+        state.scanned += len(batch)
+        state.progress[channel.id] = batch[-1].id
+
+    async def backscan_channel(self, state: BackscanState, channel: discord.abc.Messageable, semaphore: asyncio.Semaphore):
+
+        async with semaphore:
+            if channel.id in state.progress:
+                after = discord.Object(state.progress[channel.id])
+            else:
+                after = state.after
+            # history is paged lazily, so only one batch of messages is held at a time
+            batch = []
+            async for message in channel.history(limit=None, after=after, oldest_first=True):
+                batch.append(message)
+                if len(batch) >= backscan_batch_size:
+                    await self.backscan_batch(state, channel, batch)
+                    batch = []
+            if batch:
+                await self.backscan_batch(state, channel, batch)
+            state.finished.add(channel.id)
+
+    async def send_backscan_report(self, guild: discord.Guild, state: BackscanState, status: str):
+
+        report_channel = self.bot.get_channel(state.report_to)
+        if report_channel == None:
+            return
+
+        lines = [
+            f'Backscan {status}',
+            f'Scanned `{state.scanned}` message{pluralize("", "s", state.scanned)} in '
+            f'`{len(state.finished)}/{len(state.channel_ids)}` channels',
+            f'`{state.hits}` message{pluralize("", "s", state.hits)} matched',
+        ]
+        if state.delete:
+            lines.append(f'`{state.deleted}` message{pluralize("", "s", state.deleted)} deleted')
+        if state.patterns:
+            lines.append('Top patterns: ' + commas([f'`{pattern}` ({count})' for pattern, count in state.patterns.most_common(10)]))
+        if state.channels:
+            lines.append('Top channels: ' + commas([f'{id2mention(channel_id, MentionType.channel)} ({count})'
+                                                    for channel_id, count in state.channels.most_common(5)]))
+        if state.report_size >= backscan_report_limit:
+            lines.append('Report truncated')
+
+        state.report.seek(0)
+        report = state.report.read().encode('utf8')
+        state.report.seek(0, io.SEEK_END)
+        await report_channel.send(
+            embed=discord.Embed(description='\n'.join(lines)),
+            file=discord.File(io.BytesIO(report), filename=f'backscan-{guild.id}.tsv')
+        )
+
+    async def run_backscan(self, guild: discord.Guild, state: BackscanState):
+
+        semaphore = asyncio.Semaphore(backscan_concurrency)
+        channels = []
+        for channel_id in state.channel_ids:
+            if channel_id in state.finished:
+                continue
+            channel = guild.get_channel(channel_id) or guild.get_thread(channel_id)
+            if channel == None:
+                state.finished.add(channel_id)
+            else:
+                channels.append(channel)
+
+        try:
+            await asyncio.gather(*(self.backscan_channel(state, channel, semaphore) for channel in channels))
+        except asyncio.CancelledError:
+            # progress is already in the state, so only a stop asked for gets a report
+            if state.stopping:
+                state.stopping = False
+                await self.send_backscan_report(guild, state, 'stopped, continue it with `ww.backscan resume`')
+            raise
+        except Exception as e:
+            await self.utils.log_background_error(guild, e)
+            await self.send_backscan_report(guild, state, 'failed, continue it with `ww.backscan resume`')
+            return
+
+        await self.send_backscan_report(guild, state, 'finished')
+        state.report.close()
+        if self.backscans.get(guild.id) is state:
+            del self.backscans[guild.id]
+
+    @commands.command(name='ww.backscan')
+    @commands.check_any(commands.has_permissions(administrator=True), has_privlidged_role_check())
+    async def ww_backscan(self, ctx: commands.Context, target: str, since: Optional[str] = None, *options: str):
+
+        state = self.backscans.get(ctx.guild.id)
+
+        if target == 'stop':
+            if state == None or not state.is_running():
+                await self.utils.respond(ctx, ResponseLevel.general_error, 'No backscan running')
+            else:
+                state.stopping = True
+                state.task.cancel()
+                await self.utils.respond(ctx, ResponseLevel.success)
+            return
+
+        if target == 'status':
+            if state == None:
+                await self.utils.respond(ctx, ResponseLevel.success, 'No backscan')
+            else:
+                await self.utils.respond(ctx, ResponseLevel.success, '\n'.join([
+                    'Running' if state.is_running() else 'Stopped',
+                    f'`{state.scanned}` scanned, `{state.hits}` matched, `{state.deleted}` deleted',
+                    f'`{len(state.finished)}/{len(state.channel_ids)}` channels done'
+                ]))
+            return
+
+        if state != None and state.is_running():
+            await self.utils.respond(ctx, ResponseLevel.general_error, 'A backscan is already running')
+            return
+
+        if target == 'resume':
+            if state == None:
+                await self.utils.respond(ctx, ResponseLevel.general_error, 'Nothing to resume')
+                return
+            state.report_to = ctx.channel.id
+        else:
+            duration = duration_parse(since) if since else None
+            if duration == None:
+                await self.utils.respond(ctx, ResponseLevel.general_error, 'Invalid duration')
+                return
+
+            ignores = self.ignore_cache.get(ctx.guild.id, set())
+            if target == 'all':
+                candidates = ctx.guild.text_channels + list(ctx.guild.threads)
+            else:
+                try:
+                    channel_id = int(target)
+                except ValueError:
+                    channel_id = mention2id(target, MentionType.channel)
+                channel = ctx.guild.get_channel(channel_id) or ctx.guild.get_thread(channel_id)
+                if channel == None or not hasattr(channel, 'history'):
+                    await self.utils.respond(ctx, ResponseLevel.general_error, 'Channel not found')
+                    return
+                candidates = [channel]
+            channel_ids = [
+                channel.id for channel in candidates
+                if channel.permissions_for(ctx.guild.me).read_message_history
+                and channel.id not in ignores and getattr(channel, 'category_id', None) not in ignores
+            ]
+            if len(channel_ids) == 0:
+                await self.utils.respond(ctx, ResponseLevel.general_error, 'No scannable channels')
+                return
+
+            module_settings: WordWatchSettings = await WordWatchSettings.get(guild_id=ctx.guild.id)
+            if state != None:
+                state.report.close()
+            state = BackscanState(
+                channel_ids=channel_ids,
+                after=datetime.now(timezone.utc) - timedelta(seconds=duration),
+                delete='del' in options,
+                scan_bots=bool(module_settings.scan_bots),
+                report_to=ctx.channel.id
+            )
+            self.backscans[ctx.guild.id] = state
+
+        state.task = self.bot.loop.create_task(self.run_backscan(ctx.guild, state))
+        await self.utils.respond(ctx, ResponseLevel.success)
\ No newline at end of file
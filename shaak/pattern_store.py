@@ -0,0 +1,235 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# a read-only pattern index for every guild, mmap'd by each scanner process so the pages
+# are shared instead of every process holding its own compiled copy of every watch.
+#
+# word and contains patterns go into two flat tries, walked over case folded text (with
+# format markers stripped for words, since word matching skips them). a trie hit only
+# makes a watch a candidate: candidates are confirmed by the exact matcher, so results
+# are identical to find_matches. regexes, fuzzy patterns and words made only of format
+# markers can't be indexed and are compiled per process instead
+#
+# layout, little endian, every section padded to 8 bytes:
+#   header
+#   output guilds  u64 per output, guild of the record each output points at
+#   nodes          (edge start, edge count, output start, output count) u32 each
+#   edges          (codepoint, child) u32 each, sorted by codepoint per node
+#   outputs        record index u32, sorted by guild per node
+#   unindexed      record index u32
+#   records        see record_struct
+#   blob           utf8 patterns
+
+import bisect
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing  import Dict, List, Optional, Set, Tuple
+
+from shaak.matcher import MatchType, compile_pattern, find_matches, format_markers
+from shaak.scanner import ScanEntry
+
+store_magic   = b'SHPS'
+store_version = 2
+
+# magic, version, nodes, edges, outputs, unindexed, records, blob size, word root, contains root
+header_struct = struct.Struct('<4sIIIIIIIII')
+# guild id, watch id, match type, ignore case, auto delete, distance, ban (-1 for none), pattern offset, pattern length
+record_struct = struct.Struct('<QIBBBBhII')
+
+# (guild id, watch id, pattern, match type, ignore case, auto delete, ban, distance)
+StoreRecord = Tuple[int, int, str, int, bool, bool, Optional[int], int]
+
+def fold_word(text: str) -> str:
+    return ''.join(char for char in text.lower() if char not in format_markers).casefold()
+
+def fold_contains(text: str) -> str:
+    return text.casefold()
+
+def padded(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 8)
+
+def build_store(records: List[StoreRecord], path: Path):
+
+    # tries are built as lists of dicts first, node 0 and 1 being the two roots
+    children: List[Dict[int, int]] = [{}, {}]
+    outputs: List[List[int]] = [[], []]
+    unindexed = []
+
+    for index, (_, _, pattern, match_type, _, _, _, _) in enumerate(records):
+        if match_type == MatchType.word.value:
+            root, key = 0, fold_word(pattern)
+        elif match_type == MatchType.contains.value:
+            root, key = 1, fold_contains(pattern)
+        else:
+            key = ''
+        if not key:
+            unindexed.append(index)
+            continue
+        node = root
+        for char in key:
+            child = children[node].get(ord(char))
+            if child == None:
+                child = len(children)
+                children[node][ord(char)] = child
+                children.append({})
+                outputs.append([])
+            node = child
+        outputs[node].append(index)
+
+    blob = bytearray()
+    packed_records = []
+    for guild_id, watch_id, pattern, match_type, ignore_case, auto_delete, ban, distance in records:
+        encoded = pattern.encode('utf8')
+        packed_records.append(record_struct.pack(guild_id, watch_id, match_type, ignore_case, auto_delete, distance,
+                                                 -1 if ban == None else ban, len(blob), len(encoded)))
+        blob += encoded
+
+    node_table = []
+    edge_table = []
+    output_table = []
+    output_guilds = []
+    for node, node_children in enumerate(children):
+        node_outputs = sorted(outputs[node], key=lambda index: records[index][0])
+        node_table.extend((len(edge_table) // 2, len(node_children), len(output_table), len(node_outputs)))
+        for codepoint in sorted(node_children):
+            edge_table.extend((codepoint, node_children[codepoint]))
+        output_table.extend(node_outputs)
+        output_guilds.extend(records[index][0] for index in node_outputs)
+
+    header = header_struct.pack(store_magic, store_version, len(children), len(edge_table) // 2, len(output_table),
+                                len(unindexed), len(records), len(blob), 0, 1)
+    sections = [
+        header,
+        struct.pack(f'<{len(output_guilds)}Q', *output_guilds),
+        struct.pack(f'<{len(node_table)}I', *node_table),
+        struct.pack(f'<{len(edge_table)}I', *edge_table),
+        struct.pack(f'<{len(output_table)}I', *output_table),
+        struct.pack(f'<{len(unindexed)}I', *unindexed),
+        b''.join(packed_records),
+        bytes(blob)
+    ]
+
+    # readers keep their old mapping until told to reopen, so the file is swapped in whole
+    temp_path = path.with_name(path.name + '.tmp')
+    with temp_path.open('wb') as f:
+        for section in sections:
+            f.write(padded(section))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class PatternStore:
+
+    def __init__(self, path: Path):
+
+        with path.open('rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+
+        (magic, version, node_count, edge_count, output_count, unindexed_count,
+         self.record_count, blob_size, self.word_root, self.contains_root) = header_struct.unpack_from(self.map)
+        if magic != store_magic or version != store_version:
+            raise ValueError(f'{path} is not a version {store_version} pattern store')
+
+        offset = header_struct.size + (-header_struct.size % 8)
+        def section(size: int, fmt: Optional[str]):
+            nonlocal offset
+            data = view[offset:offset+size]
+            offset += size + (-size % 8)
+            return data.cast(fmt) if fmt else data
+
+        self.output_guilds = section(output_count * 8, 'Q')
+        self.nodes         = section(node_count * 16, 'I')
+        self.edges         = section(edge_count * 8, 'I')
+        self.outputs       = section(output_count * 4, 'I')
+        unindexed          = section(unindexed_count * 4, 'I')
+        self.records       = section(self.record_count * record_struct.size, None)
+        self.blob          = section(blob_size, None)
+
+        self.unindexed: Dict[int, List[ScanEntry]] = {}
+        for index in unindexed:
+            entry = self.entry(index)
+            if entry != None:
+                self.unindexed.setdefault(self.guild_of(index), []).append(entry)
+
+    def guild_of(self, index: int) -> int:
+        return record_struct.unpack_from(self.records, index * record_struct.size)[0]
+
+    def entry(self, index: int) -> Optional[ScanEntry]:
+
+        (_, watch_id, match_type, ignore_case, auto_delete, distance, ban,
+         pattern_offset, pattern_length) = record_struct.unpack_from(self.records, index * record_struct.size)
+        pattern = bytes(self.blob[pattern_offset:pattern_offset+pattern_length]).decode('utf8')
+        try:
+            compiled = compile_pattern(pattern, match_type, bool(ignore_case), distance)
+        except Exception:
+            return None
+        return ScanEntry(watch_id, pattern, match_type, bool(ignore_case), bool(auto_delete),
+                         None if ban == -1 else ban, compiled, distance)
+
+    def child(self, node: int, codepoint: int) -> Optional[int]:
+
+        low = self.nodes[node*4]
+        high = low + self.nodes[node*4+1]
+        while low < high:
+            middle = (low + high) // 2
+            found = self.edges[middle*2]
+            if found == codepoint:
+                return self.edges[middle*2+1]
+            if found < codepoint:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def walk(self, root: int, text: str, guild_id: int, candidates: Set[int]):
+
+        for start in range(len(text)):
+            node = root
+            for char in text[start:]:
+                node = self.child(node, ord(char))
+                if node == None:
+                    break
+                output_start = self.nodes[node*4+2]
+                output_end = output_start + self.nodes[node*4+3]
+                if output_start == output_end:
+                    continue
+                first = bisect.bisect_left(self.output_guilds, guild_id, output_start, output_end)
+                while first < output_end and self.output_guilds[first] == guild_id:
+                    candidates.add(self.outputs[first])
+                    first += 1
+
+    def find_matches(self, guild_id: int, text: str, shed: bool = False) -> List[Tuple[ScanEntry, int, int]]:
+
+        candidates = set()
+        self.walk(self.word_root, fold_word(text), guild_id, candidates)
+        self.walk(self.contains_root, fold_contains(text), guild_id, candidates)
+
+        entries = [entry for entry in map(self.entry, sorted(candidates)) if entry != None]
+        entries.extend(self.unindexed.get(guild_id, []))
+        if shed:
+            entries = [entry for entry in entries if entry.auto_delete or entry.ban != None]
+        return find_matches(entries, text)
+
+    def close(self):
+
+        # the casts hold exports on the map, so they have to go first
+        for name in ('output_guilds', 'nodes', 'edges', 'outputs', 'records', 'blob'):
+            getattr(self, name).release()
+        self.map.close()
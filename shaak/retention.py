@@ -0,0 +1,113 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# bounded deletes for the cleanup tasks. rows are removed a primary key range at a time
+# with a pause in between, so live handlers never wait behind one long delete
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing      import List, Tuple, Type
+
+from tortoise        import Tortoise
+from tortoise.models import Model
+
+from shaak.helpers import chunks
+from shaak.models  import Guild
+
+logger = logging.getLogger('shaak_retention')
+
+retention_batch_size = 1000
+retention_pause      = 0.1  # seconds between batches
+purge_guild_chunk    = 100  # guilds purged together
+
+@dataclass
+class RetentionStats:
+    table:   str
+    deleted: int   = 0
+    batches: int   = 0
+    elapsed: float = 0
+
+    def __str__(self):
+        return f'{self.table}: {self.deleted} rows in {self.batches} batches over {self.elapsed:.2f}s'
+
+async def delete_in_batches(model: Type[Model], stats: RetentionStats, batch_size: int = retention_batch_size,
+                            pause: float = retention_pause, **filters):
+
+    # each batch finds the next batch_size matching keys and deletes the key range they span.
+    # the range only holds matching rows past the previous batch, so nothing else is touched
+    start = time.perf_counter()
+    last_key = None
+    while True:
+        query = model.filter(**filters)
+        if last_key != None:
+            query = query.filter(id__gt=last_key)
+        keys = await query.order_by('id').limit(batch_size).values_list('id', flat=True)
+        if not keys:
+            break
+        range_filters = {'id__lte': keys[-1]}
+        if last_key != None:
+            range_filters['id__gt'] = last_key
+        stats.deleted += await model.filter(**filters, **range_filters).delete()
+        stats.batches += 1
+        last_key = keys[-1]
+        if len(keys) < batch_size:
+            break
+        await asyncio.sleep(pause)
+    stats.elapsed += time.perf_counter() - start
+
+def guild_owned_tables() -> List[Tuple[Type[Model], str]]:
+
+    # (model, guild field) for every foreign key to Guild. tables referencing other
+    # guild owned tables come first, so their rows aren't cascaded or nulled in one go
+    owned = []
+    for model in Tortoise.apps['models'].values():
+        for name in model._meta.fk_fields:
+            if model._meta.fields_map[name].related_model is Guild:
+                owned.append((model, f'{name}_id'))
+
+    def references(model: Type[Model]) -> set:
+        return {model._meta.fields_map[name].related_model for name in model._meta.fk_fields} - {model}
+
+    ordered = []
+    remaining = owned
+    while remaining:
+        referenced = set().union(*(references(model) for model, _ in remaining))
+        ready = [entry for entry in remaining if entry[0] not in referenced] or remaining  # or a cycle
+        ordered.extend(ready)
+        remaining = [entry for entry in remaining if entry not in ready]
+    return ordered
+
+async def purge_guilds(guild_ids: List[int]) -> List[RetentionStats]:
+
+    tables = guild_owned_tables()
+    stats = {model: RetentionStats(model.__name__) for model, _ in tables}
+    stats[Guild] = RetentionStats(Guild.__name__)
+    for chunk in chunks(guild_ids, purge_guild_chunk):
+        for model, key in tables:
+            await delete_in_batches(model, stats[model], **{f'{key}__in': chunk})
+        await delete_in_batches(Guild, stats[Guild], id__in=chunk)
+    return list(stats.values())
+
+def log_stats(task: str, stats: List[RetentionStats]):
+
+    deleted = [entry for entry in stats if entry.deleted]
+    if not deleted:
+        logger.info(f'{task}: nothing to delete')
+        return
+    logger.info(f'{task}: ' + ', '.join(str(entry) for entry in deleted))
@@ -0,0 +1,262 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# word watch matching in separate processes. the bot process stays the gateway: it does
+# the ignore checks and carries out actions, while guilds are sharded over workers by id
+# and each worker keeps its own compiled copy of its guilds' watches, or shares a mmap'd
+# pattern store with the others when one is configured
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+from pathlib import Path
+from typing  import Dict, List, Optional, Tuple
+
+from shaak.matcher       import compile_pattern, find_matches
+from shaak.pattern_store import PatternStore, StoreRecord, build_store
+from shaak.scanner import ScanEntry, WatchSpec, compile_watches
+
+logger = logging.getLogger('shaak_scan_workers')
+
+# (watch id, start, end)
+ScanHit = Tuple[int, int, int]
+
+class ScanWorkerDied(Exception):
+    pass
+
+def worker_main(conn):
+
+    guilds: Dict[int, List[ScanEntry]] = {}
+    store: Optional[PatternStore] = None
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if request == None:
+            return
+
+        kind = request[0]
+        if kind == 'scan':
+            _, token, guild_id, content, shed = request
+            try:
+                if store != None:
+                    found = store.find_matches(guild_id, content, shed)
+                else:
+                    entries = guilds.get(guild_id, [])
+                    if shed:
+                        entries = [entry for entry in entries if entry.auto_delete or entry.ban != None]
+                    found = find_matches(entries, content)
+                hits = [(entry.id, start, end) for entry, start, end in found]
+            except Exception:
+                logger.exception(f'scan failed in guild {guild_id}')
+                hits = []
+            conn.send((token, hits))
+        elif kind == 'update':
+            _, guild_id, specs = request
+            guilds[guild_id] = compile_watches(specs)
+        elif kind == 'remove':
+            guilds.pop(request[1], None)
+        elif kind == 'store':
+            _, token, path = request
+            try:
+                new_store = PatternStore(Path(path))
+            except Exception:
+                logger.exception(f'failed to open pattern store {path}')
+                conn.send((token, False))
+                continue
+            if store != None:
+                store.close()
+            store = new_store
+            # the store covers every guild from here on, the per-guild copies aren't read again
+            guilds.clear()
+            conn.send((token, True))
+
+def pattern_test_main(conn, spec: WatchSpec, texts: List[str], sample_count: int):
+
+    try:
+        watch_id, pattern, match_type, ignore_case, auto_delete, ban, distance = spec
+        entries = [ScanEntry(watch_id, pattern, match_type, ignore_case, auto_delete, ban,
+                             compile_pattern(pattern, match_type, ignore_case, distance), distance)]
+        hits = 0
+        samples = []
+        for text in reversed(texts):
+            found = find_matches(entries, text)
+            if found:
+                hits += 1
+                if len(samples) < sample_count:
+                    samples.append((text, [(start, end) for _, start, end in found]))
+        conn.send((hits, samples))
+    except Exception as e:
+        conn.send(e)
+
+def test_pattern(spec: WatchSpec, texts: List[str], sample_count: int,
+                 timeout: float) -> Optional[Tuple[int, List[Tuple[str, List[Tuple[int, int]]]]]]:
+
+    # blocks, so run it in an executor. the pattern gets a process of its own so a
+    # runaway regex is killed at the timeout instead of holding a thread and the gil.
+    # returns None on timeout and raises whatever compiling the pattern raised
+    context = multiprocessing.get_context('spawn')
+    conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=pattern_test_main, args=(child_conn, spec, texts, sample_count),
+                              name='shaak-pattern-test', daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if not conn.poll(timeout):
+            return None
+        result = conn.recv()
+    except EOFError:
+        raise ScanWorkerDied()
+    finally:
+        conn.close()
+        process.terminate()
+        process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+class ScanWorker:
+
+    def __init__(self, index: int, loop: asyncio.AbstractEventLoop):
+
+        context = multiprocessing.get_context('spawn')
+        self.index = index
+        self.loop = loop
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn,), name=f'shaak-scanner-{index}', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.alive = True
+        # sends and receives block, so each direction gets a thread and the loop never waits on the pipe
+        self.outbox = queue.SimpleQueue()
+        threading.Thread(target=self.send_loop, daemon=True).start()
+        threading.Thread(target=self.receive_loop, daemon=True).start()
+
+    def send_loop(self):
+
+        while True:
+            request = self.outbox.get()
+            try:
+                self.conn.send(request)
+            except (OSError, ValueError):
+                return
+            if request == None:
+                return
+
+    def receive_loop(self):
+
+        while True:
+            try:
+                token, hits = self.conn.recv()
+            except (EOFError, OSError):
+                try:
+                    self.loop.call_soon_threadsafe(self.died)
+                except RuntimeError:
+                    pass  # loop already closed
+                return
+            try:
+                self.loop.call_soon_threadsafe(self.resolve, token, hits)
+            except RuntimeError:
+                return
+
+    def resolve(self, token: int, hits: List[ScanHit]):
+
+        future = self.pending.pop(token, None)
+        if future != None and not future.done():
+            future.set_result(hits)
+
+    def died(self):
+
+        if self.alive:
+            logger.error(f'scan worker {self.index} exited')
+        self.alive = False
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ScanWorkerDied())
+        self.pending.clear()
+
+    def submit(self, request: tuple):
+
+        self.outbox.put(request)
+
+class ScanPool:
+
+    def __init__(self, workers: int, store_path: Optional[Path] = None):
+
+        loop = asyncio.get_running_loop()
+        self.workers = [ScanWorker(index, loop) for index in range(workers)]
+        self.tokens = itertools.count()
+        self.store_path = store_path
+        self.store_ready = False  # set once every worker has loaded a store
+
+    def worker_for(self, guild_id: int) -> ScanWorker:
+
+        return self.workers[guild_id % len(self.workers)]
+
+    async def call(self, worker: ScanWorker, kind: str, *args):
+
+        if not worker.alive:
+            raise ScanWorkerDied()
+        token = next(self.tokens)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[token] = future
+        worker.submit((kind, token, *args))
+        try:
+            return await future
+        finally:
+            worker.pending.pop(token, None)
+
+    async def scan(self, guild_id: int, content: str, shed: bool = False) -> List[ScanHit]:
+
+        return await self.call(self.worker_for(guild_id), 'scan', guild_id, content, shed)
+
+    def update_guild(self, guild_id: int, specs: List[WatchSpec]):
+
+        self.worker_for(guild_id).submit(('update', guild_id, specs))
+
+    def remove_guild(self, guild_id: int):
+
+        self.worker_for(guild_id).submit(('remove', guild_id))
+
+    async def rebuild_store(self, records: List[StoreRecord]) -> bool:
+
+        # returns whether every live worker opened the new store. dead workers are
+        # skipped, their guilds are matched in the bot process anyway
+        await asyncio.get_running_loop().run_in_executor(None, build_store, records, self.store_path)
+        workers = [worker for worker in self.workers if worker.alive]
+        results = await asyncio.gather(*[self.call(worker, 'store', str(self.store_path)) for worker in workers],
+                                       return_exceptions=True)
+        loaded = all(result == True or isinstance(result, ScanWorkerDied) for result in results)
+        if loaded:
+            self.store_ready = True
+        return loaded
+
+    def close(self, timeout: Optional[float] = 5):
+
+        for worker in self.workers:
+            worker.alive = False
+            worker.submit(None)
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
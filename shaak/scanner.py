@@ -0,0 +1,168 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# offline bulk matching of message dumps against a guild's watches, spread over a process pool
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses        import dataclass
+from pathlib            import Path
+from typing             import Any, Iterator, List, Optional, Tuple
+
+from tortoise import Tortoise
+
+from shaak.matcher  import compile_pattern, find_matches_batch
+from shaak.models   import WordWatchWatch
+from shaak.snapshot import init_db, load_snapshot
+
+logger = logging.getLogger('shaak_scanner')
+
+# (id, pattern, match type, ignore case, auto delete, ban, distance)
+WatchSpec = Tuple[int, str, int, bool, bool, Optional[int], int]
+
+@dataclass
+class ScanEntry:
+    id:          int
+    pattern:     str
+    match_type:  int
+    ignore_case: bool
+    auto_delete: bool
+    ban:         Optional[int]
+    compiled:    Any
+    distance:    int = 0
+
+async def load_watches_from_db(guild_id: int) -> List[WatchSpec]:
+
+    await init_db()
+    try:
+        return [(*row, distance or 0) for *row, distance in await WordWatchWatch.filter(guild_id=guild_id).order_by('id').values_list(
+            'id', 'pattern', 'match_type', 'ignore_case', 'auto_delete', 'ban', 'distance')]
+    finally:
+        await Tortoise.close_connections()
+
+def load_watches_from_snapshot(path: Path) -> List[WatchSpec]:
+
+    snapshot = load_snapshot(path.read_bytes())
+    return [
+        (index+1, pattern, match_type, ignore_case, auto_delete, ban, distance or 0)
+        for index, (pattern, match_type, auto_delete, ignore_case, ban, _, distance, _) in enumerate(snapshot['watches'])
+    ]
+
+def compile_watches(specs: List[WatchSpec]) -> List[ScanEntry]:
+
+    entries = []
+    for watch_id, pattern, match_type, ignore_case, auto_delete, ban, distance in specs:
+        try:
+            compiled = compile_pattern(pattern, match_type, ignore_case, distance)
+        except Exception as e:
+            logger.warning(f'skipping watch {watch_id} ({pattern!r}): {e}')
+            continue
+        entries.append(ScanEntry(watch_id, pattern, match_type, ignore_case, auto_delete, ban, compiled, distance))
+    return entries
+
+_worker_entries: List[ScanEntry] = []
+
+def init_worker(specs: List[WatchSpec]):
+
+    global _worker_entries
+    logging.disable(logging.WARNING)  # the parent already reported bad patterns
+    _worker_entries = compile_watches(specs)
+
+def scan_chunk(chunk: List[Tuple[Any, str]]) -> List[Tuple[Any, int, str, int, int]]:
+
+    hits = []
+    results = find_matches_batch(_worker_entries, [text for _, text in chunk])
+    for (record_id, _), found in zip(chunk, results):
+        for entry, start, end in found:
+            hits.append((record_id, entry.id, entry.pattern, start, end))
+    return hits
+
+def read_messages(path: Path, jsonl: bool) -> Iterator[Tuple[Any, str]]:
+
+    with path.open(encoding='utf8', errors='replace') as f:
+        for line_number, line in enumerate(f, 1):
+            if jsonl:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f'skipping malformed line {line_number}')
+                    continue
+                yield record.get('id', line_number), record.get('content') or ''
+            else:
+                yield line_number, line.rstrip('\n')
+
+def read_chunks(messages: Iterator[Tuple[Any, str]], size: int) -> Iterator[List[Tuple[Any, str]]]:
+
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run_scan(specs: List[WatchSpec], input_path: Path, output, jsonl: bool, workers: int, chunk_size: int):
+
+    compile_watches(specs)  # reports bad patterns once, before the pool starts
+
+    messages = 0
+    hit_count = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(specs,)) as pool:
+        # a bounded window of chunks keeps memory flat and the output in input order
+        pending = collections.deque()
+        for chunk in read_chunks(read_messages(input_path, jsonl), chunk_size):
+            messages += len(chunk)
+            pending.append(pool.submit(scan_chunk, chunk))
+            while len(pending) >= workers * 4:
+                hit_count += write_hits(output, pending.popleft().result())
+        while pending:
+            hit_count += write_hits(output, pending.popleft().result())
+    elapsed = time.perf_counter() - start
+
+    print(f'{messages} messages, {hit_count} hits, {len(specs)} watches in {elapsed:.2f}s '
+          f'({messages / elapsed if elapsed else 0:.0f} messages/s over {workers} workers)', file=sys.stderr)
+
+def write_hits(output, hits: List[Tuple[Any, int, str, int, int]]) -> int:
+
+    for record_id, watch_id, pattern, start, end in hits:
+        output.write(json.dumps({'id': record_id, 'watch': watch_id, 'pattern': pattern, 'start': start, 'end': end}) + '\n')
+    return len(hits)
+
+def cli_scan(args):
+
+    if args.snapshot:
+        specs = load_watches_from_snapshot(args.snapshot)
+    else:
+        specs = asyncio.run(load_watches_from_db(args.guild))
+
+    jsonl = args.format == 'jsonl' or (args.format == None and args.input.suffix == '.jsonl')
+    workers = args.workers or os.cpu_count() or 1
+    if args.output:
+        with args.output.open('w', encoding='utf8') as output:
+            run_scan(specs, args.input, output, jsonl, workers, args.chunk_size)
+    else:
+        run_scan(specs, args.input, sys.stdout, jsonl, workers, args.chunk_size)
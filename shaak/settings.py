@@ -20,7 +20,7 @@ import json
 import logging
 import os
 from pathlib import Path
-from typing  import Tuple
+from typing  import Any, List, Tuple
 
 logger = logging.getLogger('shaak_settings')
 
@@ -35,7 +35,13 @@ def load_from_env(field_name: str):
             logging.fatal(f'{field_name} field missing and {key} var not present')
             exit(1)
 
-def load_from_file(file_name: str, required_fields: Tuple[str, type]):
+def load_optional_from_env(field_name: str):
+    for key in (f'SHAAK_{field_name.upper()}', field_name.upper()):
+        if key in os.environ:
+            return os.environ[key]
+    return None
+
+def load_from_file(file_name: str, required_fields: Tuple[str, type], optional_fields: List[Tuple[str, type, Any]] = []):
 
     file_path = Path(file_name)
     raw_data = {}
@@ -55,6 +61,11 @@ def load_from_file(file_name: str, required_fields: Tuple[str, type]):
     
     for meta in required_fields:
         raw_data[meta[0]] = meta[1](raw_data[meta[0]])
+
+    for name, convert, default in optional_fields:
+        if name not in raw_data:
+            raw_data[name] = load_optional_from_env(name)
+        raw_data[name] = default if raw_data[name] == None else convert(raw_data[name])
     
     return raw_data
 
@@ -66,6 +77,8 @@ class AppSettings:
     status:       str
     owner_id:     int
     max_guilds:   bool
+    scan_workers: int = 0  # word watch scanner processes, 0 scans in the bot process
+    pattern_store: str = ''  # where scanner processes share a mmap'd pattern index, unset gives each its own copy
 
 @dataclasses.dataclass
 class ProductSettings:
@@ -78,7 +91,8 @@ class ProductSettings:
     author_page:   str
     author_donate: str
 
-raw_settings = load_from_file('settings.json', [('token', str), ('database_url', str), ('status', str), ('owner_id', int), ('max_guilds', bool)])
+raw_settings = load_from_file('settings.json', [('token', str), ('database_url', str), ('status', str), ('owner_id', int), ('max_guilds', bool)],
+                              [('scan_workers', int, 0), ('pattern_store', str, '')])
 app_settings = AppSettings(**raw_settings)
 
 raw_product = load_from_file('product.json', [('bot_name', str), ('bot_version', str), ('bot_docs', str),
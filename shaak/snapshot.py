@@ -0,0 +1,301 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+# guild configuration snapshots. a snapshot is a gzipped json document holding
+# everything an admin configures, so it can be backed up or cloned to another guild
+
+import gzip
+import json
+from pathlib import Path
+from typing  import Any, Callable, Dict
+
+from tortoise              import Tortoise
+from tortoise.transactions import in_transaction
+
+from shaak.errors import InvalidSnapshot
+from shaak.models import (Guild, GuildSettings, WordWatchSettings, WordWatchPingGroup, WordWatchPing,
+                          WordWatchWatch, WordWatchScope, WordWatchIgnore, WordWatchSharedList,
+                          WordWatchSubscription, WordWatchListExclusion, PreviewSettings, PreviewFilter,
+                          BanUtilSettings, UserWatchSettings, UserWatchWatch, HotlineSettings,
+                          HotlineTemplate)
+
+snapshot_version = 3
+
+# settings keys a snapshot never sets, the row always belongs to the importing guild
+settings_protected_fields = {'id', 'guild', 'guild_id'}
+
+settings_models = [GuildSettings, WordWatchSettings, PreviewSettings, BanUtilSettings,
+                   UserWatchSettings, HotlineSettings]
+
+class ListOf:
+    def __init__(self, item):
+        self.item = item
+
+# fixed length rows are lists of shapes, alternatives are tuples and None stands for null
+def matches_shape(value: Any, shape: Any) -> bool:
+
+    if isinstance(shape, ListOf):
+        return isinstance(value, list) and all(matches_shape(item, shape.item) for item in value)
+    if isinstance(shape, list):
+        return isinstance(value, list) and len(value) == len(shape) and all(map(matches_shape, value, shape))
+    if isinstance(shape, tuple):
+        return any(matches_shape(value, option) for option in shape)
+    if shape == None:
+        return value == None
+    if shape is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, shape)
+
+snapshot_shapes = {
+    'ping_groups':       ListOf([str, ListOf([str, int])]),
+    'watches':           ListOf([str, int, bool, bool, (int, None), (str, None), (int, None), ListOf([int, str])]),
+    'subscriptions':     ListOf([str, bool, (int, None), (str, None), ListOf(str)]),
+    'ignores':           ListOf([int, str]),
+    'preview_filters':   ListOf(int),
+    'user_watches':      ListOf(int),
+    'hotline_templates': ListOf([str, str]),
+}
+
+async def export_guild(guild_id: int) -> Dict[str, Any]:
+
+    settings = {}
+    for model in settings_models:
+        rows = await model.filter(guild_id=guild_id).values()
+        if rows:
+            row = rows[0]
+            del row['id'], row['guild_id']
+            settings[model.__name__] = row
+
+    groups = {}
+    group_names = {}
+    for group in await WordWatchPingGroup.filter(guild_id=guild_id).all():
+        groups[group.name] = []
+        group_names[group.id] = group.name
+    for ping in await WordWatchPing.filter(group__guild_id=guild_id).values('group_id', 'ping_type', 'target_id'):
+        groups[group_names[ping['group_id']]].append([ping['ping_type'], ping['target_id']])
+
+    # a scoped watch left without its scopes would act in every channel, so they travel with it
+    scopes = {}
+    for watch_id, target_id, scope_type in await WordWatchScope.filter(watch__guild_id=guild_id).values_list(
+            'watch_id', 'target_id', 'scope_type'):
+        scopes.setdefault(watch_id, []).append([target_id, scope_type])
+
+    # shared lists live outside any guild, so subscriptions name them. list names are unique
+    exclusions = {}
+    for subscription_id, pattern in await WordWatchListExclusion.filter(subscription__guild_id=guild_id).values_list(
+            'subscription_id', 'pattern'):
+        exclusions.setdefault(subscription_id, []).append(pattern)
+    subscriptions = [
+        [subscription.list.name, subscription.auto_delete, subscription.ban, group_names.get(subscription.group_id),
+         exclusions.get(subscription.id, [])]
+        for subscription in await WordWatchSubscription.filter(guild_id=guild_id).order_by('id').prefetch_related('list')
+    ]
+
+    return {
+        'version': snapshot_version,
+        'settings': settings,
+        'ping_groups': groups,
+        'watches': [
+            [watch.pattern, watch.match_type, watch.auto_delete, watch.ignore_case, watch.ban,
+             group_names.get(watch.group_id), watch.distance, scopes.get(watch.id, [])]
+            for watch in await WordWatchWatch.filter(guild_id=guild_id).order_by('id').all()
+        ],
+        'subscriptions': subscriptions,
+        'ignores': [
+            list(ignore) for ignore in
+            await WordWatchIgnore.filter(guild_id=guild_id).values_list('target_id', 'mention_type')
+        ],
+        'preview_filters': await PreviewFilter.filter(guild_id=guild_id).values_list('channel_id', flat=True),
+        'user_watches': await UserWatchWatch.filter(guild_id=guild_id).values_list('user_id', flat=True),
+        'hotline_templates': [
+            list(template) for template in
+            await HotlineTemplate.filter(guild_id=guild_id).values_list('name', 'text')
+        ]
+    }
+
+def sanitize_references(snapshot: Dict[str, Any], is_valid_channel: Callable[[int], bool],
+                        is_valid_role: Callable[[int], bool]):
+
+    # snapshots can come from anywhere, so channel and role settings pointing outside the guild are dropped
+    for settings in snapshot['settings'].values():
+        for name, value in settings.items():
+            if value == None:
+                continue
+            if (name.endswith('_channel') and not is_valid_channel(value)) \
+                or (name.endswith('_role') and not is_valid_role(value)):
+                settings[name] = None
+
+async def import_guild(guild_id: int, snapshot: Dict[str, Any]):
+
+    async with in_transaction():
+
+        await Guild.get_or_create(id=guild_id)
+        for model in settings_models:
+            await model.get_or_create(guild_id=guild_id)
+            if model.__name__ in snapshot['settings']:
+                await model.filter(guild_id=guild_id).update(**snapshot['settings'][model.__name__])
+
+        await WordWatchWatch    .filter(guild_id=guild_id).delete()
+        await WordWatchPingGroup.filter(guild_id=guild_id).delete()
+        await WordWatchSubscription.filter(guild_id=guild_id).delete()
+        await WordWatchIgnore   .filter(guild_id=guild_id).delete()
+        await PreviewFilter     .filter(guild_id=guild_id).delete()
+        await UserWatchWatch    .filter(guild_id=guild_id).delete()
+        await HotlineTemplate   .filter(guild_id=guild_id).delete()
+
+        # groups are few and their ids are needed for the rows below, so they're created one by one
+        group_ids = {}
+        pings = []
+        for name, group_pings in snapshot['ping_groups'].items():
+            group = await WordWatchPingGroup.create(guild_id=guild_id, name=name)
+            group_ids[name] = group.id
+            for ping_type, target_id in group_pings:
+                pings.append(WordWatchPing(group_id=group.id, ping_type=ping_type, target_id=target_id))
+        if pings:
+            await WordWatchPing.bulk_create(pings)
+
+        if snapshot['watches']:
+            await WordWatchWatch.bulk_create([
+                WordWatchWatch(guild_id=guild_id, pattern=pattern, match_type=match_type, auto_delete=auto_delete,
+                               ignore_case=ignore_case, ban=ban, group_id=group_ids.get(group_name),
+                               distance=distance)
+                for pattern, match_type, auto_delete, ignore_case, ban, group_name, distance, _ in snapshot['watches']
+            ])
+            # patterns are unique per guild, and bulk inserts don't hand back ids
+            watch_ids = dict(await WordWatchWatch.filter(guild_id=guild_id).values_list('pattern', 'id'))
+            scopes = [
+                WordWatchScope(watch_id=watch_ids[watch[0]], target_id=target_id, scope_type=scope_type)
+                for watch in snapshot['watches']
+                for target_id, scope_type in watch[7]
+            ]
+            if scopes:
+                await WordWatchScope.bulk_create(scopes)
+        # subscriptions to lists that have since been deleted are left out
+        list_ids = dict(await WordWatchSharedList.filter(
+            name__in=[subscription[0] for subscription in snapshot['subscriptions']]).values_list('name', 'id'))
+        subscriptions = [subscription for subscription in snapshot['subscriptions'] if subscription[0] in list_ids]
+        if subscriptions:
+            await WordWatchSubscription.bulk_create([
+                WordWatchSubscription(guild_id=guild_id, list_id=list_ids[list_name], auto_delete=auto_delete, ban=ban,
+                                      group_id=group_ids.get(group_name))
+                for list_name, auto_delete, ban, group_name, _ in subscriptions
+            ])
+            subscription_ids = dict(await WordWatchSubscription.filter(guild_id=guild_id).values_list('list_id', 'id'))
+            exclusions = [
+                WordWatchListExclusion(subscription_id=subscription_ids[list_ids[subscription[0]]], pattern=pattern)
+                for subscription in subscriptions
+                for pattern in subscription[4]
+            ]
+            if exclusions:
+                await WordWatchListExclusion.bulk_create(exclusions)
+        if snapshot['ignores']:
+            await WordWatchIgnore.bulk_create([
+                WordWatchIgnore(guild_id=guild_id, target_id=target_id, mention_type=mention_type)
+                for target_id, mention_type in snapshot['ignores']
+            ])
+        if snapshot['preview_filters']:
+            await PreviewFilter.bulk_create([
+                PreviewFilter(guild_id=guild_id, channel_id=channel_id)
+                for channel_id in snapshot['preview_filters']
+            ])
+        if snapshot['user_watches']:
+            await UserWatchWatch.bulk_create([
+                UserWatchWatch(guild_id=guild_id, user_id=user_id)
+                for user_id in snapshot['user_watches']
+            ])
+        if snapshot['hotline_templates']:
+            await HotlineTemplate.bulk_create([
+                HotlineTemplate(guild_id=guild_id, name=name, text=text)
+                for name, text in snapshot['hotline_templates']
+            ])
+
+def dump_snapshot(snapshot: Dict[str, Any]) -> bytes:
+
+    return gzip.compress(json.dumps(snapshot, separators=(',', ':')).encode('utf8'))
+
+def load_snapshot(raw: bytes) -> Dict[str, Any]:
+
+    try:
+        if raw[:2] == b'\x1f\x8b':
+            raw = gzip.decompress(raw)
+        snapshot = json.loads(raw.decode('utf8'))
+    except (OSError, EOFError, UnicodeDecodeError, ValueError):
+        raise InvalidSnapshot('Malformed snapshot')
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != snapshot_version:
+        raise InvalidSnapshot(f'Unsupported snapshot version (expected {snapshot_version})')
+    for key in ['settings', *snapshot_shapes]:
+        if key not in snapshot:
+            raise InvalidSnapshot(f'Snapshot missing {key}')
+    # ping groups are a name keyed object, checked as name and pings pairs
+    if isinstance(snapshot['ping_groups'], dict):
+        groups = [[name, pings] for name, pings in snapshot['ping_groups'].items()]
+    else:
+        groups = None
+    for key, shape in snapshot_shapes.items():
+        if not matches_shape(groups if key == 'ping_groups' else snapshot[key], shape):
+            raise InvalidSnapshot(f'Malformed {key}')
+    patterns = [watch[0] for watch in snapshot['watches']]
+    if len(set(patterns)) != len(patterns):
+        raise InvalidSnapshot('Duplicate watch patterns')
+    if not isinstance(snapshot['settings'], dict):
+        raise InvalidSnapshot('Malformed settings')
+    models = {model.__name__: model for model in settings_models}
+    for name, settings in snapshot['settings'].items():
+        if name not in models:
+            raise InvalidSnapshot(f'Unknown settings table {name}')
+        if not isinstance(settings, dict):
+            raise InvalidSnapshot(f'Malformed settings for {name}')
+        for key in list(settings):
+            if key in settings_protected_fields:
+                del settings[key]
+            elif key not in models[name]._meta.fields_map:
+                raise InvalidSnapshot(f'Unknown setting {name}.{key}')
+            elif not matches_shape(settings[key], (int, str, bool, None)):
+                raise InvalidSnapshot(f'Malformed setting {name}.{key}')
+
+    return snapshot
+
+# command line entry points. these talk to the database directly, so a running bot
+# only picks up imported data after a restart
+
+async def init_db():
+
+    from shaak.settings import app_settings
+    await Tortoise.init(
+        db_url=app_settings.database_url,
+        modules={
+            'models': ['shaak.models']
+        }
+    )
+
+async def cli_export(guild_id: int, path: Path):
+
+    await init_db()
+    try:
+        path.write_bytes(dump_snapshot(await export_guild(guild_id)))
+    finally:
+        await Tortoise.close_connections()
+
+async def cli_import(guild_id: int, path: Path):
+
+    snapshot = load_snapshot(path.read_bytes())
+    await init_db()
+    try:
+        await import_guild(guild_id, snapshot)
+    finally:
+        await Tortoise.close_connections()
@@ -40,6 +40,7 @@ from shaak.modules.hotline import Hotline
 from shaak.tasks.guild_cleanup import GuildCleanupTask
 from shaak.tasks.bu_event_cleanup import BUEventCleanupTask
 from shaak.tasks.performance_metrics import PerformanceMetrics
+from shaak.tasks.ww_hit_cleanup import WWHitCleanupTask
 
 logger = logging.getLogger('shaak_start')
 
@@ -100,6 +101,7 @@ async def start_bot():
     conductor.load_task(GuildCleanupTask)
     conductor.load_task(BUEventCleanupTask)
     conductor.load_task(PerformanceMetrics)
+    conductor.load_task(WWHitCleanupTask)
 
     # start bot
     loop = asyncio.get_running_loop()
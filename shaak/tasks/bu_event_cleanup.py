@@ -20,6 +20,7 @@ from datetime import datetime, timedelta
 from shaak.consts    import TaskInfo
 from shaak.base_task import BaseTask
 from shaak.models    import BanUtilBanEvent, BanUtilCrossbanEvent
+from shaak.retention import RetentionStats, delete_in_batches, log_stats
 
 class BUEventCleanupTask(BaseTask):
 
@@ -31,5 +32,12 @@ class BUEventCleanupTask(BaseTask):
     async def run(self):
 
         cutoff = datetime.now() - timedelta(days=30)
-        await BanUtilBanEvent     .filter(timestamp__lt=cutoff).delete()
-        await BanUtilCrossbanEvent.filter(timestamp__lt=cutoff).delete()
\ No newline at end of file
+        # crossbans first, so deleting their events has little left to cascade to
+        self.last_stats = [RetentionStats(BanUtilCrossbanEvent.__name__), RetentionStats(BanUtilBanEvent.__name__)]
+        await delete_in_batches(BanUtilCrossbanEvent, self.last_stats[0], timestamp__lt=cutoff)
+        await delete_in_batches(BanUtilBanEvent,      self.last_stats[1], timestamp__lt=cutoff)
+        log_stats(self.meta.name, self.last_stats)
+
+        ban_utils = self.bot.get_cog('BanUtils')
+        if ban_utils != None:
+            await ban_utils.prune_tracked_messages()
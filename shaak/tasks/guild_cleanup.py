@@ -20,6 +20,7 @@ from datetime import datetime, timedelta
 from shaak.consts    import TaskInfo
 from shaak.base_task import BaseTask
 from shaak.models    import Guild
+from shaak.retention import log_stats, purge_guilds
 
 class GuildCleanupTask(BaseTask):
 
@@ -31,17 +32,11 @@ class GuildCleanupTask(BaseTask):
     async def run(self):
 
         now = datetime.now()
-        guild_ids = set()
-        for guild in self.bot.guilds:
-            guild_ids.add(guild.id)
-        for db_guild in await Guild.all():
-            if db_guild.id in guild_ids:
-                if db_guild.delete_at != None:
-                    db_guild.delete_at = None
-                    await db_guild.save(update_fields=['delete_at'])
-            else:
-                if db_guild.delete_at == None:
-                    db_guild.delete_at = datetime.now() + timedelta(days=90)
-                    await db_guild.save(update_fields=['delete_at'])
-            if db_guild.delete_at != None and db_guild.delete_at < now:
-                await db_guild.delete()
+        guild_ids = [guild.id for guild in self.bot.guilds]
+
+        await Guild.filter(id__in=guild_ids, delete_at__not_isnull=True).update(delete_at=None)
+        await Guild.filter(id__not_in=guild_ids, delete_at__isnull=True).update(delete_at=now + timedelta(days=90))
+
+        expired = await Guild.filter(delete_at__lt=now).values_list('id', flat=True)
+        self.last_stats = await purge_guilds(expired)
+        log_stats(self.meta.name, self.last_stats)
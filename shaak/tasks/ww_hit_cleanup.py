@@ -0,0 +1,37 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from datetime import datetime, timedelta
+
+from shaak.consts    import TaskInfo
+from shaak.base_task import BaseTask
+from shaak.models    import WordWatchHit
+from shaak.retention import RetentionStats, delete_in_batches, log_stats
+
+class WWHitCleanupTask(BaseTask):
+
+    meta = TaskInfo(
+        name='ww_hit_cleanup_task',
+        wait_time=60 * 60 * 24
+    )
+
+    async def run(self):
+
+        cutoff = datetime.now() - timedelta(days=90)
+        self.last_stats = [RetentionStats(WordWatchHit.__name__)]
+        await delete_in_batches(WordWatchHit, self.last_stats[0], timestamp__lt=cutoff)
+        log_stats(self.meta.name, self.last_stats)
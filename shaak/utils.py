@@ -22,7 +22,7 @@ import time
 import traceback
 import random
 import sys
-from typing import List, Optional, Union, Callable, TypeVar, Coroutine
+from typing import Dict, List, Optional, Tuple, Union, Callable, TypeVar, Coroutine
 from datetime import datetime, timedelta
 
 import discord
@@ -32,7 +32,8 @@ from discord.ext import commands
 
 from shaak.consts import ResponseLevel, response_map, color_green, MentionType, mem_usage_stat
 from shaak.models import GuildSettings, GlobalSettings
-from shaak.helpers import chunks, commas, getrange_s, escape_formatting, RollingStats
+from shaak.errors import InvalidId
+from shaak.helpers import chunks, commas, getrange_s, escape_formatting, resolve_mention, RollingStats
 from shaak.settings import product_settings
 from shaak.extra_types import GeneralChannel
 from shaak.checks import has_privlidged_role_check
@@ -195,6 +196,37 @@ class Utils(commands.Cog):
         else:
             return MentionType.user
 
+    def guess_id_cached(self, some_id: int, guild: discord.Guild) -> Optional[MentionType]:
+
+        if guild.get_member(some_id) != None or self.bot.get_user(some_id) != None:
+            return MentionType.user
+        if guild.get_channel(some_id) != None or guild.get_thread(some_id) != None:
+            return MentionType.channel
+        if guild.get_role(some_id) != None:
+            return MentionType.role
+        return None
+
+    async def resolve_references(self, references: List[str], guild: discord.Guild) -> Tuple[Dict[int, MentionType], List[int]]:
+
+        # resolves from the local cache first and only falls back to the api for ids it can't place
+        resolved = {}
+        errors = []
+        for index, reference in enumerate(references):
+            try:
+                id = int(reference)
+            except ValueError:
+                try:
+                    mention_type, id = resolve_mention(reference)
+                except InvalidId:
+                    mention_type = None
+            else:
+                mention_type = self.guess_id_cached(id, guild) or await self.guess_id(id, guild)
+            if mention_type in [MentionType.channel, MentionType.role, MentionType.user]:
+                resolved[id] = mention_type
+            else:
+                errors.append(index+1)
+        return resolved, errors
+
     async def log_background_error(self, guild: discord.Guild, error: Exception):
 
         guild_settings = await GuildSettings.get(guild_id=guild.id)
@@ -354,6 +386,8 @@ class Utils(commands.Cog):
             f'`{self.messages.summarize()}` messages',
             f'`{word_watch.scans.summarize()}` word watch scans',
             f'`{word_watch.hits.summarize()}` word watch hits',
+            f'`{word_watch.shed.summarize()}` word watch scans shed under load',
+            f'`{word_watch.dropped.summarize()}` word watch scans dropped under load',
             f'At an average of `{humanize.naturalsize(mem_avg)}` (`{round(mem_avg/mem_avail*100,1)}%`) memory usage',
         ]
 
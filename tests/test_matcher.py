@@ -0,0 +1,43 @@
+'''
+This file is part of Shaak.
+
+Shaak is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Shaak is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with Shaak.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from dataclasses import dataclass
+from typing      import Any
+
+from shaak.matcher import MatchType, compile_pattern, find_matches
+
+@dataclass
+class Entry:
+    id:          int
+    pattern:     str
+    match_type:  int
+    ignore_case: bool
+    compiled:    Any
+
+def fuzzy_entry(watch_id: int, compiled: Any) -> Entry:
+    return Entry(watch_id, compiled.pattern, MatchType.fuzzy.value, True, compiled)
+
+def test_shared_fuzzy_pattern_returns_callers_entries():
+
+    # the registry hands every guild the same compiled pattern, so cached fuzzy groups
+    # must not carry one caller's entries over to another
+    compiled = compile_pattern('scammer', MatchType.fuzzy.value, True, 1)
+    first, second = fuzzy_entry(1, compiled), fuzzy_entry(2, compiled)
+
+    assert [entry.id for entry, _, _ in find_matches([first], 'you scamer')] == [1]
+    assert [entry.id for entry, _, _ in find_matches([second], 'you scamer')] == [2]
+    assert [entry.id for entry, _, _ in find_matches([first], 'you scamer')] == [1]